@@ -9,10 +9,13 @@ from gopdb.common import ENDPOINTKEY
 
 class GopDBClient(GopHttpClientApi):
     select_agents_path = '/gopdb/agents'
+    caches_path = '/gopdb/caches'
     select_databases_path = '/gopdb/%s/select'
     reflect_databases_path = '/gopdb/%s/reflect'
     databases_path = '/gopdb/databases'
     database_path = '/gopdb/databases/%s'
+    databases_show_path = '/gopdb/databases/show'
+    databases_status_path = '/gopdb/databases/status'
     database_path_ex = '/gopdb/databases/%s/%s'
 
     schemas_path = '/gopdb/database/%s/schemas'
@@ -21,6 +24,9 @@ class GopDBClient(GopHttpClientApi):
 
     quote_path = '/gopdb/quotes/%s'
     quotes_path = '/gopdb/quotes'
+    quotes_bulk_path = '/gopdb/quotes/bulk'
+
+    job_path = '/gopdb/jobs/%s'
 
     def __init__(self, httpclient):
         # self.endpoint = DB
@@ -34,6 +40,14 @@ class GopDBClient(GopHttpClientApi):
                                             resone=results['result'])
         return results
 
+    def caches(self):
+        resp, results = self.get(action=self.caches_path)
+        if results['resultcode'] != common.RESULT_SUCCESS:
+            raise ServerExecuteRequestError(message='get cache status fail:%d' % results['resultcode'],
+                                            code=resp.status_code,
+                                            resone=results['result'])
+        return results
+
     def reflect_database(self, impl, body):
         resp, results = self.get(action=self.reflect_databases_path % impl, body=body)
         if results['resultcode'] != common.RESULT_SUCCESS:
@@ -66,6 +80,28 @@ class GopDBClient(GopHttpClientApi):
                                             resone=results['result'])
         return results
 
+    def databases_show(self, database_ids, quotes=False):
+        body = dict(ids=','.join(map(str, database_ids)), quotes=quotes)
+        resp, results = self.get(action=self.databases_show_path, body=body)
+        if results['resultcode'] != common.RESULT_SUCCESS:
+            raise ServerExecuteRequestError(message='show databases fail:%d' % results['resultcode'],
+                                            code=resp.status_code,
+                                            resone=results['result'])
+        return results
+
+    def databases_status(self, database_ids=None, zone=None):
+        body = dict()
+        if database_ids:
+            body['ids'] = ','.join(map(str, database_ids))
+        if zone:
+            body['zone'] = zone
+        resp, results = self.get(action=self.databases_status_path, body=body)
+        if results['resultcode'] != common.RESULT_SUCCESS:
+            raise ServerExecuteRequestError(message='status databases fail:%d' % results['resultcode'],
+                                            code=resp.status_code,
+                                            resone=results['result'])
+        return results
+
     def database_show(self, database_id, body=None):
         resp, results = self.get(action=self.database_path % str(database_id), body=body)
         if results['resultcode'] != common.RESULT_SUCCESS:
@@ -130,6 +166,81 @@ class GopDBClient(GopHttpClientApi):
                                             resone=results['result'])
         return results
 
+    def database_performance(self, database_id, history=False, limit=None):
+        body = dict(history=history)
+        if limit:
+            body['limit'] = limit
+        resp, results = self.get(action=self.database_path_ex % (str(database_id), 'performance'), body=body)
+        if results['resultcode'] != common.RESULT_SUCCESS:
+            raise ServerExecuteRequestError(message='get database %s performance fail:%d' %
+                                                    (str(database_id), results['resultcode']),
+                                            code=resp.status_code,
+                                            resone=results['result'])
+        return results
+
+    def database_slowlog(self, database_id, limit=10, order='total', schema=None):
+        body = dict(limit=limit, order=order)
+        if schema:
+            body['schema'] = schema
+        resp, results = self.get(action=self.database_path_ex % (str(database_id), 'slowlog'), body=body)
+        if results['resultcode'] != common.RESULT_SUCCESS:
+            raise ServerExecuteRequestError(message='get database %s slow log fail:%d' %
+                                                    (str(database_id), results['resultcode']),
+                                            code=resp.status_code,
+                                            resone=results['result'])
+        return results
+
+    def database_replication(self, database_id, history=False, channel=None, limit=None):
+        body = dict(history=history)
+        if channel:
+            body['channel'] = channel
+        if limit:
+            body['limit'] = limit
+        resp, results = self.get(action=self.database_path_ex % (str(database_id), 'replication'), body=body)
+        if results['resultcode'] != common.RESULT_SUCCESS:
+            raise ServerExecuteRequestError(message='get database %s replication fail:%d' %
+                                                    (str(database_id), results['resultcode']),
+                                            code=resp.status_code,
+                                            resone=results['result'])
+        return results
+
+    def database_config(self, database_id):
+        resp, results = self.get(action=self.database_path_ex % (str(database_id), 'config'))
+        if results['resultcode'] != common.RESULT_SUCCESS:
+            raise ServerExecuteRequestError(message='show database %s config fail:%d' %
+                                                    (str(database_id), results['resultcode']),
+                                            code=resp.status_code,
+                                            resone=results['result'])
+        return results
+
+    def database_apply(self, database_id, configs):
+        resp, results = self.put(action=self.database_path_ex % (str(database_id), 'apply'),
+                                 body=dict(configs=configs))
+        if results['resultcode'] != common.RESULT_SUCCESS:
+            raise ServerExecuteRequestError(message='apply database %s config fail:%d' %
+                                                    (str(database_id), results['resultcode']),
+                                            code=resp.status_code,
+                                            resone=results['result'])
+        return results
+
+    def database_dump(self, database_id, body=None):
+        resp, results = self.post(action=self.database_path_ex % (str(database_id), 'dump'), body=body)
+        if results['resultcode'] != common.RESULT_SUCCESS:
+            raise ServerExecuteRequestError(message='dump database %s fail:%d' %
+                                                    (str(database_id), results['resultcode']),
+                                            code=resp.status_code,
+                                            resone=results['result'])
+        return results
+
+    def database_restore(self, database_id, body):
+        resp, results = self.post(action=self.database_path_ex % (str(database_id), 'restore'), body=body)
+        if results['resultcode'] != common.RESULT_SUCCESS:
+            raise ServerExecuteRequestError(message='restore database %s fail:%d' %
+                                                    (str(database_id), results['resultcode']),
+                                            code=resp.status_code,
+                                            resone=results['result'])
+        return results
+
     def database_bond(self, database_id, body=None):
         resp, results = self.post(action=self.database_path_ex % (str(database_id), 'bond'),
                                   body=body, timeout=30)
@@ -252,4 +363,33 @@ class GopDBClient(GopHttpClientApi):
             raise ServerExecuteRequestError(message='list quotes fail:%d' % results['resultcode'],
                                             code=resp.status_code,
                                             resone=results['result'])
-        return results
\ No newline at end of file
+        return results
+
+    def quotes_bulk(self, endpoint, entitys, marker=None, limit=None):
+        body = dict(endpoint=endpoint, entitys=entitys)
+        if marker:
+            body.setdefault('marker', marker)
+        if limit:
+            body.setdefault('limit', limit)
+        resp, results = self.post(action=self.quotes_bulk_path, body=body)
+        if results['resultcode'] != common.RESULT_SUCCESS:
+            raise ServerExecuteRequestError(message='bulk list quotes fail:%d' % results['resultcode'],
+                                            code=resp.status_code,
+                                            resone=results['result'])
+        return results
+
+    def job_show(self, job_id, wait=0):
+        resp, results = self.get(action=self.job_path % str(job_id), body=dict(wait=wait))
+        if results['resultcode'] != common.RESULT_SUCCESS:
+            raise ServerExecuteRequestError(message='show job %s fail:%d' % (str(job_id), results['resultcode']),
+                                            code=resp.status_code,
+                                            resone=results['result'])
+        return results
+
+    def job_update(self, job_id, body):
+        resp, results = self.put(action=self.job_path % str(job_id), body=body)
+        if results['resultcode'] != common.RESULT_SUCCESS:
+            raise ServerExecuteRequestError(message='update job %s fail:%d' % (str(job_id), results['resultcode']),
+                                            code=resp.status_code,
+                                            resone=results['result'])
+        return results
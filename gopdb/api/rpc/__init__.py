@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
 import os
 import time
-import shutil
-import re
+import functools
+import errno
 import contextlib
 import eventlet
 import psutil
@@ -12,8 +12,6 @@ from simpleutil.utils import systemutils
 from simpleutil.log import log as logging
 from simpleutil.config import cfg
 
-from simpleservice.loopingcall import IntervalLoopinTask
-
 from goperation import threadpool
 from goperation.utils import safe_func_wrapper
 from goperation.manager.api import get_http
@@ -29,14 +27,28 @@ from gopdb import common
 from gopdb import privilegeutils
 from gopdb import utils
 from gopdb.api.rpc import impl as IMPL
+from gopdb.api.rpc.impl.scheduler import INSTALLSCHEDULER
+from gopdb.api.rpc.monitor import ReplicationMonitor
+from gopdb.api.rpc.monitor import StatusSampler
+from gopdb.api.rpc.monitor import SlowLogMonitor
+from gopdb.api.rpc.reaper import TrashReaper
 
 from gopdb.api.client import GopDBClient
 
 
+if systemutils.LINUX:
+    import pwd
+
 CONF = cfg.CONF
 
 LOG = logging.getLogger(__name__)
 
+MB = 1024 * 1024
+# min memory(MB) of a database intance
+MINMEMORY = 256
+# max memory(MB) of new intance without memory hint
+MAXAUTOMEMORY = 4096
+
 
 def count_timeout(ctxt, kwargs):
     deadline = ctxt.get('deadline')
@@ -49,18 +61,154 @@ def count_timeout(ctxt, kwargs):
     return min(deadline, timeout)
 
 
+def jobprogress(func):
+    """func report progress of job, progress function passed by jobreport"""
+    func.progress = True
+    return func
+
+
+def jobreport(func):
+    """report result to gopdb job when rpc called with job"""
+    @functools.wraps(func)
+    def wrapper(self, ctxt, entity, **kwargs):
+        job_id = kwargs.pop('job', None)
+        token = kwargs.pop('job_token', None)
+        if job_id is None:
+            return func(self, ctxt, entity, **kwargs)
+        if getattr(func, 'progress', False):
+
+            def _progress(result):
+                try:
+                    self.client.job_update(job_id, body=dict(token=token, progress=True, result=result))
+                except Exception as e:
+                    LOG.error('Report job %d progress fail with %s' % (job_id, e.__class__.__name__))
+
+            # progress report should not block the job
+            kwargs['progress'] = lambda result: eventlet.spawn_n(_progress, result)
+        try:
+            result = func(self, ctxt, entity, **kwargs)
+        except Exception as e:
+            LOG.exception('Job %d of entity %d fail' % (job_id, entity))
+            result = resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
+                                                resultcode=manager_common.RESULT_ERROR,
+                                                ctxt=ctxt,
+                                                result='%s fail with %s' % (func.__name__, e.__class__.__name__))
+        _result = result.to_dict()
+        try:
+            self.client.job_update(job_id, body=dict(token=token,
+                                                     resultcode=_result.get('resultcode'),
+                                                     result=_result.get('result')))
+        except Exception as e:
+            LOG.error('Report job %d result fail with %s' % (job_id, e.__class__.__name__))
+        return result
+    return wrapper
+
+
 class CreateResult(resultutils.AgentRpcResult):
     def __init__(self, agent_id, ctxt,
                  resultcode, result,
-                 connection, port):
+                 connection, port, install=None):
         super(CreateResult, self).__init__(agent_id, ctxt, resultcode, result)
         self.connection = connection
         self.port = port
+        self.install = install
 
     def to_dict(self):
         ret_dict = super(CreateResult, self).to_dict()
         ret_dict.setdefault('port', self.port)
         ret_dict.setdefault('connection', self.connection)
+        ret_dict.setdefault('install', self.install)
+        return ret_dict
+
+
+class StatusResult(resultutils.AgentRpcResult):
+    def __init__(self, agent_id, ctxt,
+                 resultcode, result,
+                 entitys):
+        super(StatusResult, self).__init__(agent_id, ctxt, resultcode, result)
+        self.entitys = entitys
+
+    def to_dict(self):
+        ret_dict = super(StatusResult, self).to_dict()
+        ret_dict.setdefault('entitys', self.entitys)
+        return ret_dict
+
+
+class ManifestResult(resultutils.AgentRpcResult):
+    def __init__(self, agent_id, ctxt,
+                 resultcode, result,
+                 manifest):
+        super(ManifestResult, self).__init__(agent_id, ctxt, resultcode, result)
+        self.manifest = manifest
+
+    def to_dict(self):
+        ret_dict = super(ManifestResult, self).to_dict()
+        ret_dict.setdefault('manifest', self.manifest)
+        return ret_dict
+
+
+class ConfigResult(resultutils.AgentRpcResult):
+    def __init__(self, agent_id, ctxt,
+                 resultcode, result,
+                 config):
+        super(ConfigResult, self).__init__(agent_id, ctxt, resultcode, result)
+        self.config = config
+
+    def to_dict(self):
+        ret_dict = super(ConfigResult, self).to_dict()
+        ret_dict.setdefault('config', self.config)
+        return ret_dict
+
+
+class ReplicationResult(resultutils.AgentRpcResult):
+    def __init__(self, agent_id, ctxt,
+                 resultcode, result,
+                 replication):
+        super(ReplicationResult, self).__init__(agent_id, ctxt, resultcode, result)
+        self.replication = replication
+
+    def to_dict(self):
+        ret_dict = super(ReplicationResult, self).to_dict()
+        ret_dict.setdefault('replication', self.replication)
+        return ret_dict
+
+
+class PerformanceResult(resultutils.AgentRpcResult):
+    def __init__(self, agent_id, ctxt,
+                 resultcode, result,
+                 performance):
+        super(PerformanceResult, self).__init__(agent_id, ctxt, resultcode, result)
+        self.performance = performance
+
+    def to_dict(self):
+        ret_dict = super(PerformanceResult, self).to_dict()
+        ret_dict.setdefault('performance', self.performance)
+        return ret_dict
+
+
+class SlowLogResult(resultutils.AgentRpcResult):
+    def __init__(self, agent_id, ctxt,
+                 resultcode, result,
+                 slowlog):
+        super(SlowLogResult, self).__init__(agent_id, ctxt, resultcode, result)
+        self.slowlog = slowlog
+
+    def to_dict(self):
+        ret_dict = super(SlowLogResult, self).to_dict()
+        ret_dict.setdefault('slowlog', self.slowlog)
+        return ret_dict
+
+
+class ReclaimResult(resultutils.AgentRpcResult):
+    def __init__(self, agent_id, ctxt,
+                 resultcode, result,
+                 reclaim):
+        super(ReclaimResult, self).__init__(agent_id, ctxt, resultcode, result)
+        self.reclaim = reclaim
+
+    def to_dict(self):
+        ret_dict = super(ReclaimResult, self).to_dict()
+        ret_dict.setdefault('reclaim', self.reclaim)
         return ret_dict
 
 
@@ -73,6 +221,14 @@ class Application(AppEndpointBase):
         self.client = GopDBClient(get_http())
         self.delete_tokens = {}
         self.konwn_database = {}
+        # entity -> uid of entity run user
+        self.entity_uids = {}
+        # entity -> memory(MB) admitted but config not saved
+        self.admitted = {}
+        self.metadata = None
+        self.replication = None
+        self.status = None
+        self.reaper = None
 
     @property
     def apppathname(self):
@@ -92,10 +248,12 @@ class Application(AppEndpointBase):
         super(AppEndpointBase, self).pre_start(external_objects)
         external_objects.update(common.VERSIONMAP)
         external_objects.update({'gopdb-aff': CONF[common.DB].affinity})
+        # qps unknown when status sampler disabled
+        external_objects.update({'gopdb-qps': 0})
+        self.metadata = external_objects
 
     def post_start(self):
         super(Application, self).post_start()
-        pids = utils.find_process()
         # reflect entity database_id
         dbmaps = self.client.reflect_database(impl='local', body=dict(entitys=self.entitys))['data']
         for dbinfo in dbmaps:
@@ -112,19 +270,32 @@ class Application(AppEndpointBase):
                                                          pid=None))
         # find entity pid
         for entity in self.entitys:
-            _pid = self._find_from_pids(entity, pids)
-            if _pid:
-                LOG.info('Database entity %d is running at %d' % (entity, _pid))
-                self.konwn_database[entity]['pid'] = _pid
+            if entity not in self.konwn_database:
+                continue
+            p = self._entity_process(entity)
+            if p:
+                LOG.info('Database entity %d is running at %d' % (entity, p.pid))
+        self._update_left()
+        self.reaper = TrashReaper(self._trash_path(), os.path.dirname(self.entity_home(0)))
+        self.reaper.notify = self.manager.change_performance
+        self.reaper.resume()
+        if CONF[common.DB].replication_monitor_interval:
+            self.replication = ReplicationMonitor(self)
+            self.manager.add_periodic_task(self.replication)
+        if CONF[common.DB].status_sample_interval:
+            self.status = StatusSampler(self)
+            self.manager.add_periodic_task(self.status)
+        if CONF[common.DB].slowlog_interval:
+            self.manager.add_periodic_task(SlowLogMonitor(self))
 
     def _esure(self, entity, username, cmdline):
         datadir = False
         runuser = False
         if username == self.entity_user(entity):
             runuser = True
-        pattern = re.compile('%s' % self.apppath(entity))
+        apppath = self.apppath(entity)
         for cmd in cmdline:
-            if re.search(pattern, cmd):
+            if apppath in cmd:
                 datadir = True
                 break
         if datadir and runuser:
@@ -141,12 +312,104 @@ class Application(AppEndpointBase):
             if self._esure(entity, info.get('username'), info.get('cmdline')):
                 return info.get('pid')
 
+    def _pidfile(self, entity, dbtype):
+        return os.path.join(self.entity_home(entity), '%s.pid' % dbtype)
+
+    def _entity_uid(self, entity):
+        try:
+            return self.entity_uids[entity]
+        except KeyError:
+            uid = pwd.getpwnam(self.entity_user(entity)).pw_uid
+            self.entity_uids[entity] = uid
+            return uid
+
+    def _pid_alive(self, entity, pid):
+        """cheap check pid is alive and run by entity user"""
+        if systemutils.LINUX:
+            try:
+                return os.stat('/proc/%d' % pid).st_uid == self._entity_uid(entity)
+            except (OSError, KeyError):
+                return False
+        try:
+            return psutil.Process(pid=pid).username() == self.entity_user(entity)
+        except psutil.NoSuchProcess:
+            return False
+
+    def _pid_from_file(self, entity, dbtype):
+        """
+        read pid from entity pidfile
+        return 0 when database not running, None when pidfile can not be used
+        """
+        try:
+            with open(self._pidfile(entity, dbtype), 'r') as f:
+                pid = int(f.read().strip())
+        except IOError as e:
+            # no pidfile, database not running
+            if e.errno == errno.ENOENT:
+                return 0
+            return None
+        except ValueError:
+            return None
+        if self._pid_alive(entity, pid):
+            return pid
+        # stale pidfile left by crash
+        return 0
+
     def _db_conf(self, entity, dbtype):
         return os.path.join(self.entity_home(entity), '%s.conf' % dbtype)
 
     def _dbtype(self, entity):
         return self.konwn_database[entity].get('dbtype')
 
+    def _memory_left(self, exclude=None):
+        """memory(MB) can be committed to new database intance"""
+        conf = CONF[common.DB]
+        total = psutil.virtual_memory().total / MB
+        committed = self._committed_memory(exclude) + sum(self.admitted.values())
+        return int(total * conf.memory_overcommit) - conf.reserved_memory - committed
+
+    def _update_left(self):
+        """expose memory left in agent metadata for agent select, push to server when changed"""
+        if self.metadata is not None:
+            last = self.metadata.get('gopdb-left')
+            left = max(self._memory_left(), 0)
+            self.metadata['gopdb-left'] = left
+            # first count in post start reported with agent start
+            if last is not None and last != left:
+                self.manager.change_performance()
+
+    def _trash_path(self):
+        trash = CONF[common.DB].trash_path
+        if not trash:
+            # same file system of entity homes, rename is atomic
+            trash = os.path.join(os.path.dirname(self.entity_home(0)), '.trash')
+        return trash
+
+    def _update_qps(self):
+        """expose sampled qps in agent metadata for agent select"""
+        if self.metadata is not None and self.status:
+            self.metadata['gopdb-qps'] = int(self.status.qps())
+
+    def _dump_path(self, entity, name):
+        if not name or os.sep in name or name.startswith('.'):
+            raise ValueError('Dump name error')
+        if entity not in self.entitys:
+            raise ValueError('Dump entity %d not on this agent' % entity)
+        return os.path.join(self.entity_home(entity), 'backup', name)
+
+    def _committed_memory(self, exclude=None):
+        """memory(MB) committed by database intances on this agent"""
+        committed = 0
+        for entity in self.entitys:
+            if entity == exclude:
+                continue
+            dbtype = self.konwn_database.get(entity, {}).get('dbtype') or 'mysql'
+            try:
+                committed += utils.impl_cls('rpc', dbtype).budget(self._db_conf(entity, dbtype))
+            except Exception:
+                LOG.exception('Count memory of entity %d fail' % entity)
+        return committed
+
     @contextlib.contextmanager
     def _allocate_port(self, entity, port):
         with self.manager.frozen_ports(common.DB, entity, ports=[port, ]) as ports:
@@ -164,29 +427,23 @@ class Application(AppEndpointBase):
         if not entityinfo:
             raise ValueError('Entity not found')
         _pid = entityinfo.get('pid')
-        if _pid:
-            try:
-                p = psutil.Process(pid=_pid)
-                if self._esure(entity, p.username(), p.cmdline()):
-                    info = dict(pid=p.pid, exe=p.exe(), cmdline=p.cmdline(), username=p.username())
-                    setattr(p, 'info', info)
-                    return p
-            except psutil.NoSuchProcess:
-                _pid = None
-        if not _pid:
-            _pid = self._find_from_pids(entity)
+        if not _pid or not self._pid_alive(entity, _pid):
+            _pid = self._pid_from_file(entity, entityinfo.get('dbtype'))
+            # pidfile can not be used, full scan process table
+            if _pid is None:
+                LOG.warning('Pidfile of entity %d error, find pid from process table' % entity)
+                _pid = self._find_from_pids(entity, impl=entityinfo.get('dbtype'))
         if not _pid:
-            self.konwn_database[entity]['pid'] = None
+            entityinfo['pid'] = None
             return None
         try:
             p = psutil.Process(pid=_pid)
-            info = dict(pid=p.pid, exe=p.exe(), cmdline=p.cmdline(), username=p.username())
-            setattr(p, 'info', info)
-            self.konwn_database[entity]['pid'] = _pid
-            return p
         except psutil.NoSuchProcess:
-            self.konwn_database[entity]['pid'] = None
+            entityinfo['pid'] = None
             return None
+        setattr(p, 'info', dict(pid=p.pid, username=self.entity_user(entity)))
+        entityinfo['pid'] = _pid
+        return p
 
     def delete_entity(self, entity, token):
         if token != self._entity_token(entity):
@@ -194,16 +451,26 @@ class Application(AppEndpointBase):
         if self._entity_process(entity):
             raise ValueError('Target entity is running')
         LOG.info('Try delete %s entity %d' % (self.namespace, entity))
+        dbtype = self._dbtype(entity)
+        utils.impl_cls('rpc', dbtype).release(self._db_conf(entity, dbtype))
         home = self.entity_home(entity)
         if os.path.exists(home):
+            # files removed by reaper in background
             try:
-                shutil.rmtree(home)
+                self.reaper.throw(entity, home)
             except Exception:
                 LOG.exception('delete error')
         self._free_port(entity)
         self.entitys_map.pop(entity, None)
         self.konwn_database.pop(entity, None)
+        self.entity_uids.pop(entity, None)
+        if self.replication:
+            self.replication.remove(entity)
+        if self.status:
+            self.status.remove(entity)
+            self._update_qps()
         systemutils.drop_user(self.entity_user(entity))
+        self._update_left()
 
     def create_entity(self, entity, timeout, **kwargs):
         """
@@ -219,9 +486,10 @@ class Application(AppEndpointBase):
             replication = privilegeutils.mysql_replprivileges(bond.get('database_id'), bond.get('host'))
             kwargs['replication'] = replication
         port = configs.pop('port', None)
-        pidfile = os.path.join(self.entity_home(entity), '%s.pid' % dbtype)
+        pidfile = self._pidfile(entity, dbtype)
         sockfile = os.path.join(self.entity_home(entity), '%s.sock' % dbtype)
         logfile = os.path.join(self.logpath(entity), '%s.log' % dbtype)
+        slowlog = os.path.join(self.logpath(entity), '%s-slow.log' % dbtype)
         install_log = os.path.join(self.logpath(entity), 'install.log')
         cfgfile = self._db_conf(entity, dbtype)
         LOG.info('Load database manager for %s' % dbtype)
@@ -236,12 +504,14 @@ class Application(AppEndpointBase):
                 configs.setdefault('pidfile', pidfile)
                 configs.setdefault('sockfile', sockfile)
                 configs.setdefault('logfile', logfile)
+                configs.setdefault('slowlog', slowlog)
                 configs.setdefault('runuser', self.entity_user(entity))
                 dbmanager.save_conf(cfgfile, **configs)
                 LOG.info('Prepare database config file success')
 
                 def _notify_success(binlog):
                     """notify database intance create success"""
+                    self._update_left()
                     self.manager.change_performance()
                     dbinfo = self.konwn_database.get(entity)
                     if not dbinfo:
@@ -282,21 +552,32 @@ class Application(AppEndpointBase):
         return port
 
     def rpc_create_entity(self, ctxt, entity, **kwargs):
-        memory = psutil.virtual_memory()
-        leftmem = memory.cached / (1024 * 1024) + memory.free / (1024 * 1024)
-        if leftmem < 1000:
-            return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
-                                              resultcode=manager_common.RESULT_ERROR,
-                                              ctxt=ctxt,
-                                              result='create database fail, memory left %d MB' % leftmem)
         entity = int(entity)
+        configs = kwargs.get('configs') or {}
+        kwargs['configs'] = configs
         with self.lock(entity, timeout=3):
             if entity in self.entitys:
                 return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
                                                   resultcode=manager_common.RESULT_ERROR,
                                                   ctxt=ctxt,
                                                   result='create %s database fail, entity exist' % entity)
+            # 按已分配内存做准入, 而不是当前空闲内存
+            leftmem = self._memory_left()
+            if configs.get('memory'):
+                memory = max(int(configs['memory']), MINMEMORY)
+            else:
+                # 没有内存提示时使用剩余内存的1/4, 给其他实例留出空间
+                memory = min(max(leftmem / 4, MINMEMORY), MAXAUTOMEMORY)
+            if leftmem < memory:
+                return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
+                                                  resultcode=manager_common.RESULT_ERROR,
+                                                  ctxt=ctxt,
+                                                  result='create database fail, memory left %d MB, '
+                                                         'request %d MB' % (leftmem, memory))
             timeout = count_timeout(ctxt, kwargs)
+            self.admitted[entity] = memory
+            # 配置按准入的内存生成, 准入与实际分配一致
+            configs['memory'] = memory
             try:
                 port = self.create_entity(entity, timeout, **kwargs)
                 resultcode = manager_common.RESULT_SUCCESS
@@ -310,12 +591,18 @@ class Application(AppEndpointBase):
                                                   ctxt=ctxt,
                                                   resultcode=resultcode,
                                                   result=result, )
+            finally:
+                # budget file has been saved or create fail
+                self.admitted.pop(entity, None)
+                self._update_left()
         return CreateResult(agent_id=self.manager.agent_id,
                             ctxt=ctxt,
                             resultcode=resultcode,
                             result=result,
                             connection=self.manager.local_ip,
-                            port=port)
+                            port=port,
+                            # install queue status when install submitted
+                            install=INSTALLSCHEDULER.stats())
 
     def rpc_post_create_entity(self, ctxt, entity, **kwargs):
         database_id = kwargs.pop('database_id')
@@ -363,35 +650,106 @@ class Application(AppEndpointBase):
                                           result=result,
                                           details=details)
 
+    def rpc_reclaim_status(self, ctxt, **kwargs):
+        """reclaim progress of deleted entity homes"""
+        return ReclaimResult(agent_id=self.manager.agent_id,
+                             ctxt=ctxt,
+                             resultcode=manager_common.RESULT_SUCCESS,
+                             result='get reclaim status success',
+                             reclaim=self.reaper.stats())
+
+    @jobreport
     def rpc_start_entity(self, ctxt, entity, **kwargs):
         dbtype = self._dbtype(entity)
         dbmanager = utils.impl_cls('rpc', dbtype)
         cfgfile = self._db_conf(entity, dbtype)
+        timeout = count_timeout(ctxt, kwargs)
+        ready = None
         p = self._entity_process(entity)
         with self.lock(entity, timeout=3):
             if not p:
-                dbmanager.start(cfgfile)
-                eventlet.sleep(0.5)
+                try:
+                    ready = dbmanager.start(cfgfile, timeout=timeout)
+                except Exception as e:
+                    return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
+                                                      resultcode=manager_common.RESULT_ERROR,
+                                                      ctxt=ctxt,
+                                                      result='start entity fail with %s' % e.__class__.__name__)
                 p = self._entity_process(entity)
         if not p:
             return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
                                               resultcode=manager_common.RESULT_ERROR,
                                               ctxt=ctxt,
                                               result='start entity faile, process not exist after start')
+        result = 'start entity success, runinng on pid %d' % p.info.get('pid')
+        if ready is not None:
+            result += ', ready after %1.3f seconds' % ready
         return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
                                           ctxt=ctxt,
-                                          result='start entity success, runinng on pid %d' % p.info.get('pid'))
+                                          result=result)
 
+    @jobreport
     def rpc_stop_entity(self, ctxt, entity, **kwargs):
         dbtype = self._dbtype(entity)
         dbmanager = utils.impl_cls('rpc', dbtype)
+        timeout = count_timeout(ctxt, kwargs)
         p = self._entity_process(entity)
-        if p:
-            cfgfile = self._db_conf(entity, dbtype)
-            dbmanager.stop(cfgfile, postrun=None, timeout=None, process=p)
+        if not p:
+            return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
+                                              ctxt=ctxt,
+                                              result='stop database entity success, process not exist')
+        cfgfile = self._db_conf(entity, dbtype)
+        try:
+            used = dbmanager.stop(cfgfile, postrun=None, timeout=timeout, process=p,
+                                  mode=kwargs.get('mode'), dump=kwargs.get('dump', False))
+        except Exception as e:
+            return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
+                                              resultcode=manager_common.RESULT_ERROR,
+                                              ctxt=ctxt,
+                                              result='stop database entity fail with %s' % e.__class__.__name__)
         return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
                                           ctxt=ctxt,
-                                          result='stop database entity success')
+                                          result='stop database entity success, shutdown used %1.3f seconds'
+                                                 % used)
+
+    def rpc_entity_config(self, ctxt, entity, **kwargs):
+        """config of database entity, and options need restart"""
+        dbtype = self._dbtype(entity)
+        dbmanager = utils.impl_cls('rpc', dbtype)
+        config = dbmanager.load_conf(self._db_conf(entity, dbtype))
+        return ConfigResult(agent_id=self.manager.agent_id,
+                            ctxt=ctxt,
+                            resultcode=manager_common.RESULT_SUCCESS,
+                            result='load database entity config success',
+                            config=config)
+
+    def rpc_apply_entity_config(self, ctxt, entity, **kwargs):
+        """apply config without restart, static options take effect at next start"""
+        dbtype = self._dbtype(entity)
+        dbmanager = utils.impl_cls('rpc', dbtype)
+        configs = kwargs.pop('configs')
+        with self.lock(entity, timeout=3):
+            online = self._entity_process(entity) is not None
+            try:
+                config = dbmanager.apply_conf(self._db_conf(entity, dbtype), online=online, **configs)
+            except Exception as e:
+                LOG.exception('Apply config of entity %d fail' % entity)
+                return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
+                                                  resultcode=manager_common.RESULT_ERROR,
+                                                  ctxt=ctxt,
+                                                  result='apply database entity config fail with %s'
+                                                         % e.__class__.__name__)
+            # buffer pool changed, memory committed changed
+            self._update_left()
+        return ConfigResult(agent_id=self.manager.agent_id,
+                            ctxt=ctxt,
+                            resultcode=(manager_common.RESULT_ERROR if config['failed']
+                                        else manager_common.RESULT_SUCCESS),
+                            result='apply database entity config %s, %d applied, %d need restart, '
+                                   '%d fail' % ('fail' if config['failed'] else 'success',
+                                                len(config['applied']), len(config['restart']),
+                                                len(config['failed'])),
+                            config=config)
 
     def rpc_status_entity(self, ctxt, entity, **kwargs):
         dbtype = self._dbtype(entity)
@@ -406,6 +764,141 @@ class Application(AppEndpointBase):
                                           ctxt=ctxt,
                                           result=result)
 
+    def rpc_status_entities(self, ctxt, entitys=None, **kwargs):
+        """status of all(or listed) database entitys on this agent"""
+        if not entitys:
+            entitys = self.konwn_database.keys()
+        now = time.time()
+        statuses = []
+        for entity in entitys:
+            dbinfo = self.konwn_database.get(entity)
+            if not dbinfo:
+                statuses.append(dict(entity=entity, status='unkonwn'))
+                continue
+            try:
+                port = self._get_port(entity)
+            except (KeyError, IndexError):
+                port = None
+            status = dict(entity=entity, database_id=dbinfo.get('database_id'),
+                          dbtype=dbinfo.get('dbtype'), port=port,
+                          status='stoped', pid=None, uptime=0)
+            p = self._entity_process(entity)
+            if p:
+                status.update(status='running', pid=p.pid)
+                try:
+                    status['uptime'] = int(now - p.create_time())
+                except psutil.NoSuchProcess:
+                    status.update(status='stoped', pid=None)
+            statuses.append(status)
+        return StatusResult(agent_id=self.manager.agent_id,
+                            ctxt=ctxt,
+                            resultcode=manager_common.RESULT_SUCCESS,
+                            result='status %d database entitys success' % len(statuses),
+                            entitys=statuses)
+
+    @jobreport
+    def rpc_dump_entity(self, ctxt, entity, **kwargs):
+        """dump database entity data into entity backup path"""
+        dbtype = self._dbtype(entity)
+        dbmanager = utils.impl_cls('rpc', dbtype)
+        timeout = count_timeout(ctxt, kwargs)
+        name = kwargs.pop('name', None) or time.strftime('%Y%m%d%H%M%S')
+        if not self._entity_process(entity):
+            return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
+                                              resultcode=manager_common.RESULT_ERROR,
+                                              ctxt=ctxt,
+                                              result='dump database entity fail, process not exist')
+        path = self._dump_path(entity, name)
+        if not os.path.exists(path):
+            os.makedirs(path, 0o700)
+        try:
+            manifest = dbmanager.dump(self._db_conf(entity, dbtype), postrun=None, timeout=timeout,
+                                      path=path, schemas=kwargs.pop('schemas', None),
+                                      workers=kwargs.pop('workers', None))
+        except Exception as e:
+            LOG.exception('Dump entity %d fail' % entity)
+            return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
+                                              resultcode=manager_common.RESULT_ERROR,
+                                              ctxt=ctxt,
+                                              result='dump database entity fail with %s' % e.__class__.__name__)
+        return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
+                                          ctxt=ctxt,
+                                          result='dump database entity success, %d rows(%d bytes) '
+                                                 'dumped to %s with %d workers, used %1.3f seconds'
+                                                 % (manifest['rows'], manifest['size'], name,
+                                                    manifest['workers'], manifest['elapsed']))
+
+    def rpc_dump_manifest(self, ctxt, entity, **kwargs):
+        """schemas info in dump manifest"""
+        dbtype = self._dbtype(entity)
+        dbmanager = utils.impl_cls('rpc', dbtype)
+        source = int(kwargs.pop('source', None) or entity)
+        try:
+            manifest = dbmanager.manifest(self._dump_path(source, kwargs.pop('name', None)))
+        except Exception as e:
+            return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
+                                              resultcode=manager_common.RESULT_ERROR,
+                                              ctxt=ctxt,
+                                              result='load dump manifest fail with %s' % e.__class__.__name__)
+        schemas = {}
+        for schema, info in manifest['schemas'].items():
+            schemas[schema] = dict(character_set=info.get('character_set'),
+                                   collation_type=info.get('collation_type'),
+                                   tables=len(info['tables']),
+                                   rows=sum([t['rows'] for t in info['tables'].values()]))
+        return ManifestResult(agent_id=self.manager.agent_id,
+                              ctxt=ctxt,
+                              resultcode=manager_common.RESULT_SUCCESS,
+                              result='load dump manifest success',
+                              manifest=dict(ctime=manifest['ctime'], binlog=manifest['binlog'],
+                                            rows=manifest['rows'], size=manifest['size'],
+                                            schemas=schemas))
+
+    @jobreport
+    @jobprogress
+    def rpc_restore_entity(self, ctxt, entity, **kwargs):
+        """restore dump of entity(or other entity on this agent) into entity"""
+        progress = kwargs.pop('progress', None)
+        dbtype = self._dbtype(entity)
+        dbmanager = utils.impl_cls('rpc', dbtype)
+        timeout = count_timeout(ctxt, kwargs)
+        source = int(kwargs.pop('source', None) or entity)
+        path = self._dump_path(source, kwargs.pop('name', None))
+        if not self._entity_process(entity):
+            return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
+                                              resultcode=manager_common.RESULT_ERROR,
+                                              ctxt=ctxt,
+                                              result='restore database entity fail, process not exist')
+
+        def _notify(info):
+            progress('restore database entity running, %d/%d tables, %d/%d rows; %s %d rows %d rows/s'
+                     % (info['finished'], info['tables'], info['rows'], info['total'],
+                        info['table'], info['info']['rows'], info['info']['rate']))
+
+        try:
+            report = dbmanager.restore(self._db_conf(entity, dbtype), postrun=None, timeout=timeout,
+                                       path=path, schemas=kwargs.pop('schemas', None),
+                                       workers=kwargs.pop('workers', None),
+                                       notify=_notify if progress else None)
+        except Exception as e:
+            LOG.exception('Restore entity %d fail' % entity)
+            return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
+                                              resultcode=manager_common.RESULT_ERROR,
+                                              ctxt=ctxt,
+                                              result='restore database entity fail with %s' % e.__class__.__name__)
+        # slowest tables first
+        tables = sorted(report['tables'].items(), key=lambda x: x[1]['seconds'], reverse=True)
+        return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
+                                          ctxt=ctxt,
+                                          result='restore database entity success, %d rows with %d workers, '
+                                                 'used %1.3f seconds(%d rows/s); %s'
+                                                 % (report['rows'], report['workers'], report['elapsed'],
+                                                    report['rate'],
+                                                    ', '.join(['%s %d rows %d rows/s' % (name, info['rows'],
+                                                                                        info['rate'])
+                                                               for name, info in tables])))
+
+    @jobreport
     def rpc_slave_entity(self, ctxt, entity, **kwargs):
         """主库收到绑定从库命令"""
         bond = kwargs.pop('bond')
@@ -448,6 +941,7 @@ class Application(AppEndpointBase):
                                           ctxt=ctxt,
                                           result='bond slave for master success')
 
+    @jobreport
     def rpc_bond_entity(self, ctxt, entity, **kwargs):
         """
         从库收到绑定主库命令
@@ -495,6 +989,22 @@ class Application(AppEndpointBase):
                                           ctxt=ctxt,
                                           result='unbond from master success')
 
+    def rpc_entity_master_status(self, ctxt, entity, **kwargs):
+        """current binlog position of master entity"""
+        dbtype = self._dbtype(entity)
+        dbmanager = utils.impl_cls('rpc', dbtype)
+        if not self._entity_process(entity):
+            return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
+                                              resultcode=manager_common.RESULT_ERROR,
+                                              ctxt=ctxt,
+                                              result='get master status fail, process not exist')
+        binlog = dbmanager.master_status(self._db_conf(entity, dbtype))
+        return ReplicationResult(agent_id=self.manager.agent_id,
+                                 ctxt=ctxt,
+                                 resultcode=manager_common.RESULT_SUCCESS,
+                                 result='get master status success',
+                                 replication=binlog)
+
     def rpc_revoke_entity(self, ctxt, entity, **kwargs):
         dbtype = self._dbtype(entity)
         dbmanager = utils.impl_cls('rpc', dbtype)
@@ -510,6 +1020,65 @@ class Application(AppEndpointBase):
                                           ctxt=ctxt,
                                           result='revoke to master success')
 
+    def rpc_replication_history(self, ctxt, entity, **kwargs):
+        """replication samples of slave entity from memory"""
+        if not self.replication:
+            return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
+                                              resultcode=manager_common.RESULT_ERROR,
+                                              ctxt=ctxt,
+                                              result='replication monitor disabled')
+        if kwargs.get('history'):
+            replication = self.replication.samples(entity, channel=kwargs.get('channel'),
+                                                   limit=kwargs.get('limit'))
+        else:
+            replication = self.replication.current(entity)
+        return ReplicationResult(agent_id=self.manager.agent_id,
+                                 ctxt=ctxt,
+                                 resultcode=manager_common.RESULT_SUCCESS,
+                                 result='get replication of %d channels success' % len(replication),
+                                 replication=replication)
+
+    def rpc_entity_performance(self, ctxt, entity, **kwargs):
+        """global status rates of entity from memory"""
+        if not self.status:
+            return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
+                                              resultcode=manager_common.RESULT_ERROR,
+                                              ctxt=ctxt,
+                                              result='status sampler disabled')
+        if kwargs.get('history'):
+            rates = self.status.samples(entity, limit=kwargs.get('limit'))
+        else:
+            rates = self.status.current(entity)
+        performance = dict(qps=round(self.status.average(entity), 3), rates=rates)
+        return PerformanceResult(agent_id=self.manager.agent_id,
+                                 ctxt=ctxt,
+                                 resultcode=manager_common.RESULT_SUCCESS,
+                                 result='get performance of entity %d success' % entity,
+                                 performance=performance)
+
+    def rpc_entity_slowlog(self, ctxt, entity, **kwargs):
+        """top query fingerprints in slow log digest of entity"""
+        limit = kwargs.get('limit') or 10
+        order = kwargs.get('order') or 'total'
+        dbtype = self._dbtype(entity)
+        dbmanager = utils.impl_cls('rpc', dbtype)
+        cfgfile = self._db_conf(entity, dbtype)
+        digest = dbmanager.slowlog_digest(cfgfile)
+        if not digest:
+            return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
+                                              resultcode=manager_common.RESULT_ERROR,
+                                              ctxt=ctxt,
+                                              result='slow log of entity %d not enable' % entity)
+        if kwargs.get('reset'):
+            digest.reset()
+        slowlog = digest.top(limit, schema=kwargs.get('schema'), order=order)
+        return SlowLogResult(agent_id=self.manager.agent_id,
+                             ctxt=ctxt,
+                             resultcode=manager_common.RESULT_SUCCESS,
+                             result='get slow log digest of entity %d success' % entity,
+                             slowlog=slowlog)
+
+    @jobreport
     def rpc_entity_replication_ready(self, ctxt, entity, **kwargs):
         dbtype = self._dbtype(entity)
         dbmanager = utils.impl_cls('rpc', dbtype)
@@ -520,9 +1089,47 @@ class Application(AppEndpointBase):
                 return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
                                                   ctxt=ctxt,
                                                   result='get replication status fail, process not exist')
+            master = kwargs.get('master')
+            binlog = master.pop('binlog', None)
+            max_eta = kwargs.pop('max_eta', None)
+            channel = 'masterdb-%(database_id)s' % master
             success, msg = dbmanager.replication_status(cfgfile, postrun=None, timeout=None, **kwargs)
-        return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
-                                          resultcode=manager_common.RESULT_SUCCESS
-                                          if success else manager_common.RESULT_ERROR,
-                                          ctxt=ctxt,
-                                          result=msg)
+            if not success:
+                return resultutils.AgentRpcResult(agent_id=self.manager.agent_id,
+                                                  resultcode=manager_common.RESULT_ERROR,
+                                                  ctxt=ctxt,
+                                                  result=msg)
+            samples = self._channel_samples(entity, dbmanager, cfgfile, channel)
+        catchup = dbmanager.catchup(samples, binlog) if samples else None
+        if catchup:
+            msg = '%s, backlog %s bytes, exec %s bytes/s, eta %s seconds' % (msg, catchup['backlog'],
+                                                                             catchup['exec_rate'],
+                                                                             catchup['eta'])
+            if max_eta is not None and (catchup['eta'] is None or catchup['eta'] > max_eta):
+                return ReplicationResult(agent_id=self.manager.agent_id,
+                                         ctxt=ctxt,
+                                         resultcode=manager_common.RESULT_ERROR,
+                                         result='%s, catch up eta over %d seconds' % (msg, max_eta),
+                                         replication=catchup)
+        return ReplicationResult(agent_id=self.manager.agent_id,
+                                 ctxt=ctxt,
+                                 resultcode=manager_common.RESULT_SUCCESS,
+                                 result=msg,
+                                 replication=catchup)
+
+    def _channel_samples(self, entity, dbmanager, cfgfile, channel):
+        """replication samples of channel, from monitor or sample now"""
+        if self.replication:
+            samples = self.replication.samples(entity, channel=channel).get(channel)
+            interval = CONF[common.DB].replication_monitor_interval
+            if samples and len(samples) > 1 and time.time() - samples[-1]['time'] < interval * 2:
+                return samples
+        # sample twice to count rate
+        samples = []
+        for i in range(2):
+            if i:
+                eventlet.sleep(1)
+            for sample in dbmanager.replication_samples(cfgfile):
+                if sample.pop('channel') == channel:
+                    samples.append(sample)
+        return samples
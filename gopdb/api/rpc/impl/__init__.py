@@ -1,3 +1,4 @@
+import os
 import six
 import abc
 
@@ -14,10 +15,36 @@ config.register_opts(CONF.find_group(common.DB))
 @six.add_metaclass(abc.ABCMeta)
 class DatabaseConfigBase(object):
 
+    # cfgfile -> ((inode, size, mtime), config)
+    _cache = {}
+
     @classmethod
     def load(cls, cfgfile):
         """load config from config file"""
 
+    @classmethod
+    def cached(cls, cfgfile):
+        """
+        load config from cache, config file parsed only when changed
+        config from cache is shared, do not modify it
+        """
+        try:
+            st = os.stat(cfgfile)
+        except OSError:
+            cls.invalidate(cfgfile)
+            return cls.load(cfgfile)
+        key = (st.st_ino, st.st_size, st.st_mtime)
+        cached = cls._cache.get(cfgfile)
+        if cached and cached[0] == key:
+            return cached[1]
+        config = cls.load(cfgfile)
+        cls._cache[cfgfile] = (key, config)
+        return config
+
+    @classmethod
+    def invalidate(cls, cfgfile):
+        cls._cache.pop(cfgfile, None)
+
     @classmethod
     def loads(cls, **kwargs):
         """load config from kwargs"""
@@ -57,6 +84,14 @@ class DatabaseManagerBase(object):
     def dump(self, cfgfile, postrun, timeout, **kwargs):
         """dump database data"""
 
+    @abc.abstractmethod
+    def restore(self, cfgfile, postrun, timeout, **kwargs):
+        """restore database data from dump"""
+
+    def manifest(self, path):
+        """manifest of dump in path"""
+        raise NotImplementedError
+
     @abc.abstractmethod
     def load_conf(self, cfgfile, **kwargs):
         """out put database config"""
@@ -64,3 +99,34 @@ class DatabaseManagerBase(object):
     @abc.abstractmethod
     def save_conf(self, cfgfile, **kwargs):
         """update database config"""
+
+    @abc.abstractmethod
+    def apply_conf(self, cfgfile, online=True, **configs):
+        """apply config to running database intance and config file"""
+
+    def release(self, cfgfile):
+        """release resource hold for database intance"""
+
+    def budget(self, cfgfile):
+        """memory(MB) committed by database intance"""
+        return 0
+
+    def replication_samples(self, cfgfile):
+        """replication state of each channel of slave database intance"""
+        return []
+
+    def master_status(self, cfgfile):
+        """current binlog position of master database intance"""
+        return None
+
+    def global_status(self, cfgfile):
+        """counters and gauges of database intance"""
+        return {}
+
+    def slowlog_digest(self, cfgfile):
+        """slow log digest of database intance, None means slow log not enable"""
+        return None
+
+    def catchup(self, samples, binlog=None):
+        """replication rate and catch up eta of a channel"""
+        return None
@@ -13,7 +13,54 @@ db_opts = [
     cfg.IntOpt('affinity',
                default=1,
                min=1, max=3,
-               help='local database admin password, 1 master, 2 slave, 3 both')
+               help='local database admin password, 1 master, 2 slave, 3 both'),
+    cfg.IntOpt('install_concurrency',
+               default=0,
+               min=0, max=32,
+               help='Max database intance install at same time, '
+                    '0 means count from cpu count and disk type'),
+    cfg.IntOpt('reserved_memory',
+               min=256,
+               default=1024,
+               help='Memory(MB) reserved for system, not used by database intances'),
+    cfg.FloatOpt('memory_overcommit',
+                 min=0.5, max=4.0,
+                 default=1.0,
+                 help='Memory committed by database intances can be '
+                      'memory_overcommit times of host memory'),
+    cfg.IntOpt('replication_monitor_interval',
+               min=0,
+               max=300,
+               default=10,
+               help='Seconds between replication samples of slave database intances, 0 means disable'),
+    cfg.IntOpt('replication_history',
+               min=10,
+               max=8640,
+               default=360,
+               help='Replication samples kept for each replication channel'),
+    cfg.IntOpt('status_sample_interval',
+               min=0,
+               max=600,
+               default=30,
+               help='Seconds between global status samples of database intances, 0 means disable'),
+    cfg.IntOpt('status_window',
+               min=2,
+               max=1440,
+               default=20,
+               help='Global status rates kept for each database intance'),
+    cfg.IntOpt('slowlog_interval',
+               min=0,
+               max=3600,
+               default=60,
+               help='Seconds between slow log digest of database intances, 0 means disable'),
+    cfg.StrOpt('trash_path',
+               default=None,
+               help='Path of deleted entity homes wait for reclaim, must be in same file system '
+                    'of entity homes, None means .trash in path of entity homes'),
+    cfg.IntOpt('reclaim_rate',
+               min=0,
+               default=64,
+               help='Max io rate(MB/s) of reclaim deleted entity homes, 0 means no limit'),
 ]
 
 
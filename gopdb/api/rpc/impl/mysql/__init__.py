@@ -1,7 +1,14 @@
 import six
 import os
+import glob
+import shutil
+import time
+import hashlib
 import contextlib
 import eventlet
+from eventlet import semaphore
+from eventlet.green import socket
+from eventlet.green import subprocess
 import ConfigParser
 from collections import OrderedDict
 import psutil
@@ -9,10 +16,9 @@ import mysql.connector
 
 from simpleutil.log import log as logging
 from simpleutil.config import cfg
+from simpleutil.utils import jsonutils
 from simpleutil.utils import systemutils
 
-import goperation
-
 from gopdb import common
 from gopdb import privilegeutils
 from gopdb.api import exceptions
@@ -20,14 +26,22 @@ from gopdb.api.rpc.impl import DatabaseConfigBase
 from gopdb.api.rpc.impl import DatabaseManagerBase
 
 from gopdb.api.rpc.impl.mysql import config
+from gopdb.api.rpc.impl.mysql.pool import ADMINPOOL
+from gopdb.api.rpc.impl.mysql.dumper import MysqlDumper
+from gopdb.api.rpc.impl.mysql.dumper import load_manifest
+from gopdb.api.rpc.impl.mysql.restorer import MysqlRestorer
+from gopdb.api.rpc.impl.mysql.slowlog import SlowLogDigest
+from gopdb.api.rpc.impl.scheduler import INSTALLSCHEDULER
 
 from goperation.utils import safe_fork
 
 if systemutils.POSIX:
+    import pwd
     from simpleutil.utils.systemutils.posix import wait
     MYSQLSAFE = systemutils.find_executable('mysqld_safe')
     MYSQLINSTALL = systemutils.find_executable('mysql_install_db')
     SH = systemutils.find_executable('sh')
+    CP = systemutils.find_executable('cp')
     BASELOG = '/var/log/mysqld.log'
 else:
     # just for windows test
@@ -35,6 +49,7 @@ else:
     MYSQLSAFE = r'C:\Program Files\mysql\bin\mysqld_safe.exe'
     MYSQLINSTALL = r'C:\Program Files\mysql\bin\mysql_install_db.exe'
     SH = r'C:\Program Files\Git\bin\sh.exe'
+    CP = r'C:\Program Files\Git\usr\bin\cp.exe'
     BASELOG = r'C:\temp\mysqld.log'
 
 
@@ -45,11 +60,53 @@ LOG = logging.getLogger(__name__)
 
 config.register_opts(CONF.find_group(common.DB))
 
+# only one template build at same time
+TEMPLATELOCK = semaphore.Semaphore(1)
+# options decide datadir file format, template can be shared only when these options same
+TEMPLATEOPTS = ['innodb_data_file_path', 'innodb_page_size', 'lower_case_table_names',
+                'character-set-server']
+
+# global status sampled
+STATUSNAMES = frozenset([
+    'Uptime', 'Questions', 'Threads_running', 'Threads_connected',
+    'Bytes_sent', 'Bytes_received', 'Slow_queries',
+    'Innodb_rows_read', 'Innodb_rows_inserted', 'Innodb_rows_updated', 'Innodb_rows_deleted',
+])
+STATUSCOMS = frozenset([
+    'Com_select', 'Com_insert', 'Com_update', 'Com_delete', 'Com_replace',
+    'Com_commit', 'Com_rollback',
+])
+
+# options managed by gopdb, can not be changed by apply config
+PROTECTEDOPTS = frozenset([
+    'server-id', 'datadir', 'pid-file', 'socket', 'port', 'user', 'log-error',
+    'log-bin', 'relay-log', 'relay-log-index', 'slow_query_log_file',
+])
+
+# options count from memory budget
+AUTOTUNEOPTS = frozenset([
+    'innodb_buffer_pool_size', 'innodb_log_file_size',
+    'key_buffer_size', 'query_cache_size', 'tmp_table_size', 'max_heap_table_size',
+    'max_connections', 'thread_cache_size', 'read_buffer_size', 'read_rnd_buffer_size',
+])
+
+# slow log file -> slow log digest
+SLOWLOGS = {}
+
 MULTIABLEOPTS = frozenset([
     'replicate-ignore-db',
 ])
 
 
+def _chown(path, user):
+    """chown path to user recursively"""
+    pw = pwd.getpwnam(user)
+    os.lchown(path, pw.pw_uid, pw.pw_gid)
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            os.lchown(os.path.join(root, name), pw.pw_uid, pw.pw_gid)
+
+
 class MultiOrderedDict(OrderedDict):
     def __setitem__(self, key, value,
                     dict_setitem=dict.__setitem__):
@@ -143,6 +200,106 @@ def default_config():
     return cf
 
 
+MB = 1024 * 1024
+# max_binlog_size of intance, size of binlog file when count distance cross binlog files
+MAXBINLOGSIZE = 270532608
+# replication samples in this seconds used to count replication rate
+RATEWINDOW = 60
+
+
+def _bound(value, lower, upper):
+    return max(lower, min(value, upper))
+
+
+def memory_budget(memory=None):
+    """
+    count memory budget of new intance from admitted memory and cpu count
+    @param memory:      int memory(MB) admitted for new intance by agent
+    """
+    total = psutil.virtual_memory().total / MB
+    cpu = psutil.cpu_count() or 1
+    budget = max(int(memory or 0), 256)
+    # innodb buffer pool use 60% of budget, in 128MB chunks
+    buffer_pool = max(budget * 6 / 10 / 128 * 128, 128)
+    key_buffer = _bound(budget / 20, 8, 128)
+    query_cache = _bound(budget / 20, 16, 128)
+    tmp_table = _bound(budget / 20, 16, 256)
+    return dict(memory=budget,
+                host=total, cpu=cpu,
+                innodb_buffer_pool_size=buffer_pool * MB,
+                innodb_log_file_size=_bound(buffer_pool / 4, 48, 512) * MB,
+                key_buffer_size=key_buffer * MB,
+                query_cache_size=query_cache * MB,
+                tmp_table_size=tmp_table * MB,
+                max_heap_table_size=tmp_table * MB,
+                max_connections=_bound(cpu * 64, 64, 512),
+                thread_cache_size=_bound(cpu * 2, 8, 64),
+                read_buffer_size=(1 if budget < 2048 else 4) * MB,
+                read_rnd_buffer_size=(2 if budget < 2048 else 6) * MB)
+
+
+def _size(value):
+    """mysql size option to bytes"""
+    if not value:
+        return 0
+    value = str(value).strip()
+    unit = value[-1].upper()
+    if unit in 'KMG':
+        return int(value[:-1]) * 1024 ** ('KMG'.index(unit) + 1)
+    return int(value)
+
+
+def budget_file(cfgfile):
+    return '%s.budget' % cfgfile
+
+
+def pending_file(cfgfile):
+    return '%s.pending' % cfgfile
+
+
+def variable_name(key):
+    return key.replace('-', '_')
+
+
+def _normalize(value):
+    """normalize config value and server variable value for compare"""
+    value = str(value).strip().strip('\'"')
+    lower = value.lower()
+    if lower in ('on', 'true', 'yes'):
+        return '1'
+    if lower in ('off', 'false', 'no'):
+        return '0'
+    try:
+        return str(_size(value))
+    except ValueError:
+        return value
+
+
+def _literal(converter, value):
+    """value in SET GLOBAL sql"""
+    value = str(value).strip()
+    if value.upper() in ('ON', 'OFF', 'DEFAULT'):
+        return value.upper()
+    try:
+        return str(_size(value))
+    except ValueError:
+        pass
+    try:
+        float(value)
+        return value
+    except ValueError:
+        return str(converter.quote(converter.escape(value)))
+
+
+def binlog_distance(file_from, pos_from, file_to, pos_to):
+    """bytes between two binlog positions, binlog file size treat as max_binlog_size"""
+    if not file_from or not file_to:
+        return None
+    index_from = int(file_from.rsplit('.', 1)[-1])
+    index_to = int(file_to.rsplit('.', 1)[-1])
+    return (index_to - index_from) * MAXBINLOGSIZE + int(pos_to) - int(pos_from)
+
+
 def slave_config(cf):
     # Slave opts
     cf.set('mysqld', 'read-only', 1)
@@ -154,11 +311,12 @@ def slave_config(cf):
 
 class MysqlConfig(DatabaseConfigBase):
 
-    def __init__(self, config):
+    def __init__(self, config, budget=None):
         # default opts
         if not isinstance(config, MultiConfigParser):
             raise TypeError('mysql config not ConfigParser')
         self.config = config
+        self.budget = budget
 
     def get(self, key):
         try:
@@ -182,11 +340,18 @@ class MysqlConfig(DatabaseConfigBase):
         pidfile = kwargs.pop('pidfile')
         sockfile = kwargs.pop('sockfile')
         logfile = kwargs.pop('logfile')
+        slowlog = kwargs.pop('slowlog', None)
         # binlog on/off
         binlog = (kwargs.pop('binlog', False) or kwargs.pop('log-bin', False))
         relaylog = (kwargs.pop('relaylog', False) or kwargs.pop('relay-bin', False))
+        # memory admitted by agent
+        budget = memory_budget(kwargs.pop('memory', None))
+        budget['hint'] = budget['memory']
         # init mysql default config
         config = default_config()
+        for k in budget:
+            if k in AUTOTUNEOPTS:
+                config.set('mysqld', k, budget[k])
         # set mysqld_safe opts
         config.set('mysqld_safe', 'log-error', logfile)
         # read opts from kwargs
@@ -198,6 +363,13 @@ class MysqlConfig(DatabaseConfigBase):
         config.set('mysqld', 'pid-file', pidfile)
         config.set('mysqld', 'log-error', logfile)
         config.set('mysqld', 'user', runuser)
+        # set slow log
+        if slowlog:
+            config.set('mysqld', 'slow_query_log_file', slowlog)
+            if not config.has_option('mysqld', 'slow_query_log'):
+                config.set('mysqld', 'slow_query_log', 1)
+            if not config.has_option('mysqld', 'long_query_time'):
+                config.set('mysqld', 'long_query_time', CONF[common.DB].long_query_time)
         # set default socket opts
         config.set('mysqld', 'socket', sockfile)
         # ste logbin
@@ -205,15 +377,25 @@ class MysqlConfig(DatabaseConfigBase):
             conf = CONF[common.DB]
             config.set('mysqld', 'log-bin', 'binlog')
             config.set('mysqld', 'expire_logs_days', conf.expire_log_days)
-            config.set('mysqld', 'max_binlog_size', 270532608)
+            config.set('mysqld', 'max_binlog_size', MAXBINLOGSIZE)
         if relaylog:
             slave_config(config)
-        return cls(config)
+        # options set from kwargs override autotune
+        for k in AUTOTUNEOPTS:
+            budget[k] = config.get('mysqld', k, raw=True)
+        # memory committed count from effective buffer pool, buffer pool is 60% of budget
+        buffer_pool = _size(budget['innodb_buffer_pool_size']) / MB
+        budget['memory'] = max(budget['memory'], buffer_pool * 10 / 6)
+        return cls(config, budget)
 
     def save(self, cfgfile):
         """save config"""
         with open(cfgfile, 'wb') as f:
             self.config.write(f)
+        self.invalidate(cfgfile)
+        if self.budget:
+            with open(budget_file(cfgfile), 'wb') as f:
+                f.write(jsonutils.dumps(self.budget))
 
     def dump(self, cfgfile):
         """out put config"""
@@ -228,13 +410,47 @@ class MysqlConfig(DatabaseConfigBase):
         config.read(cfgfile)
         self.config = config
 
+    @property
+    def sockfile(self):
+        return self.get('socket')
+
+    @property
+    def pidfile(self):
+        return self.get('pid-file')
+
+    @property
+    def datadir(self):
+        return self.get('datadir')
+
+    @property
+    def port(self):
+        port = self.get('port')
+        return int(port) if port else None
+
+    @property
+    def logbin(self):
+        return bool(self.get('log-bin'))
+
+    @property
+    def slowlog(self):
+        """slow log file, None means slow log not enable"""
+        if _normalize(self.get('slow_query_log') or 'OFF') == '1':
+            return self.get('slow_query_log_file')
+        return None
+
+    def set(self, key, value):
+        self.config.set('mysqld', key, value)
+
+    def options(self):
+        return dict(self.config.items('mysqld'))
+
     def binlog(self):
         config = self.config
         if not self.get('log-bin'):
             conf = CONF[common.DB]
             config.set('mysqld', 'log-bin', 'binlog')
             config.set('mysqld', 'expire_logs_days', conf.expire_log_days)
-            config.set('mysqld', 'max_binlog_size', 270532608)
+            config.set('mysqld', 'max_binlog_size', MAXBINLOGSIZE)
 
 
 class DatabaseManager(DatabaseManagerBase):
@@ -279,27 +495,107 @@ class DatabaseManager(DatabaseManagerBase):
 
     @contextlib.contextmanager
     def _lower_conn(self, sockfile, user, passwd, schema=None,
-                    raise_on_warnings=True):
-        kwargs = dict(user=user, passwd=passwd, unix_socket=sockfile,
-                      raise_on_warnings=raise_on_warnings)
-        if schema:
-            kwargs['database'] = schema
-        conn = mysql.connector.connect(**kwargs)
+                    raise_on_warnings=True, pooled=True):
+        if pooled:
+            conn = ADMINPOOL.get(sockfile, user, passwd, schema, raise_on_warnings)
+        else:
+            kwargs = dict(user=user, passwd=passwd, unix_socket=sockfile,
+                          raise_on_warnings=raise_on_warnings)
+            if schema:
+                kwargs['database'] = schema
+            conn = mysql.connector.connect(**kwargs)
         try:
             yield conn
         except Exception as e:
             LOG.error('lower mysql connect error %s' % e.__class__.__name__)
             if LOG.isEnabledFor(logging.DEBUG):
                 LOG.exception('mysql.connector exec error')
-            raise
-        finally:
+            # connection state unknown, do not return to pool
             conn.close()
+            raise
+        else:
+            if pooled:
+                ADMINPOOL.put(sockfile, user, schema, conn)
+            else:
+                conn.close()
+
+    def release(self, cfgfile):
+        """release pooled connections of database intance"""
+        if not os.path.exists(cfgfile):
+            return
+        config = self.config_cls.cached(cfgfile)
+        ADMINPOOL.invalidate(config.sockfile)
+        if config.slowlog:
+            SLOWLOGS.pop(config.slowlog, None)
+        self.config_cls.invalidate(cfgfile)
+
+    def _update_budget(self, cfgfile, buffer_pool):
+        """count memory committed again after buffer pool changed"""
+        try:
+            with open(budget_file(cfgfile), 'rb') as f:
+                budget = jsonutils.loads(f.read())
+        except (IOError, OSError, ValueError):
+            # intance created before autotune, budget count from config file
+            return
+        budget['innodb_buffer_pool_size'] = buffer_pool
+        budget['memory'] = max(budget.get('hint', 0), _size(buffer_pool) / MB * 10 / 6)
+        with open(budget_file(cfgfile), 'wb') as f:
+            f.write(jsonutils.dumps(budget))
+
+    def budget(self, cfgfile):
+        """memory(MB) committed by database intance"""
+        try:
+            with open(budget_file(cfgfile), 'rb') as f:
+                return int(jsonutils.loads(f.read())['memory'])
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+        if not os.path.exists(cfgfile):
+            return 0
+        # intance created before autotune, count from buffer size
+        config = self.config_cls.cached(cfgfile)
+        memory = 0
+        for key in ('innodb_buffer_pool_size', 'key_buffer_size', 'query_cache_size'):
+            memory += _size(config.get(key))
+        return memory / MB
 
     def status(self, cfgfile, **kwargs):
         """status of database intance"""
 
+    def _wait_ready(self, cfgfile, timeout=None):
+        """
+        wait until mysqld accept connection from unix socket
+        return seconds used
+        """
+        config = self.config_cls.cached(cfgfile)
+        pidfile = config.pidfile
+        sockfile = config.sockfile
+        start = time.time()
+        deadline = start + (timeout or 60)
+        interval = 0.05
+        while True:
+            if os.path.exists(pidfile) and os.path.exists(sockfile):
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(1)
+                try:
+                    sock.connect(sockfile)
+                    # mysqld send handshake packet first when accept
+                    if sock.recv(4):
+                        used = time.time() - start
+                        LOG.info('Mysql on %s ready after %1.3f seconds' % (sockfile, used))
+                        return used
+                except (socket.error, socket.timeout):
+                    pass
+                finally:
+                    sock.close()
+            now = time.time()
+            if now >= deadline:
+                raise exceptions.GopdbError('Mysql on %s not ready after %d seconds' %
+                                            (sockfile, int(now - start)))
+            eventlet.sleep(min(interval, deadline - now))
+            interval = min(interval * 2, 1.0)
+
     def start(self, cfgfile, postrun=None, timeout=None, **kwargs):
-        """stary database intance"""
+        """stary database intance, return seconds to ready"""
         args = [SH, MYSQLSAFE, '--defaults-file=%s' % cfgfile]
         args.extend(self.base_opts)
         if not systemutils.POSIX:
@@ -323,15 +619,25 @@ class DatabaseManager(DatabaseManagerBase):
                 os._exit(0)
         else:
             wait(pid)
-            eventlet.sleep(1)
+            used = self._wait_ready(cfgfile, timeout)
+            # static options in config file take effect now
+            if os.path.exists(pending_file(cfgfile)):
+                os.remove(pending_file(cfgfile))
+            return used
 
     def stop(self, cfgfile, postrun=None, timeout=None, **kwargs):
-        """stop database intance"""
+        """
+        stop database intance, return seconds used
+        @param mode:    string fast or slow shutdown, None means not change
+        @param dump:    bool   dump innodb buffer pool at shutdown
+        """
         process = kwargs.pop('process', None)
-        timeout = timeout or 3
-        config = self.config_cls.load(cfgfile)
-        pidifle = config.get('pid-file')
-        datadir = config.get('datadir')
+        mode = kwargs.pop('mode', None)
+        dump = kwargs.pop('dump', False)
+        timeout = timeout or 30
+        config = self.config_cls.cached(cfgfile)
+        pidifle = config.pidfile
+        datadir = config.datadir
         user = config.get('user')
         with open(pidifle, 'rb') as f:
             _pid = int(f.read(4096).strip())
@@ -341,17 +647,46 @@ class DatabaseManager(DatabaseManagerBase):
             else:
                 process = psutil.Process(_pid)
         cmdlines = process.cmdline()
-        if process.username() == user and '--datadir=%s' % datadir in cmdlines:
-            process.terminate()
-        else:
+        if process.username() != user or '--datadir=%s' % datadir not in cmdlines:
             raise ValueError('Process user or cmdline not match')
-        while timeout > 0:
-            eventlet.sleep(1)
-            timeout -= 1
-            if not process.is_running():
-                LOG.debug('Stop mysql process success')
-                return
-        raise exceptions.GopdbError('Process is running after stop')
+        if mode or dump:
+            self._shutdown_opts(config.sockfile, mode, dump)
+        start = time.time()
+        deadline = start + timeout
+        process.terminate()
+        interval = 0.01
+        while process.is_running():
+            now = time.time()
+            if now >= deadline:
+                raise exceptions.GopdbError('Process is running after stop')
+            eventlet.sleep(min(interval, deadline - now))
+            interval = min(interval * 2, 0.2)
+        used = time.time() - start
+        ADMINPOOL.invalidate(config.sockfile)
+        LOG.info('Stop mysql process success, shutdown used %1.3f seconds' % used)
+        return used
+
+    def _shutdown_opts(self, sockfile, mode, dump):
+        conf = CONF[common.DB]
+        sqls = []
+        if mode:
+            if mode not in ('fast', 'slow'):
+                raise ValueError('Shutdown mode %s error' % mode)
+            sqls.append('SET GLOBAL innodb_fast_shutdown = %d' % (1 if mode == 'fast' else 0))
+        if dump:
+            sqls.append('SET GLOBAL innodb_buffer_pool_dump_at_shutdown = ON')
+        with self._lower_conn(sockfile, conf.localroot, conf.localpass,
+                              raise_on_warnings=False, pooled=False) as conn:
+            for sql in sqls:
+                LOG.debug(sql)
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(sql)
+                except mysql.connector.Error as e:
+                    # old version has no buffer pool dump
+                    LOG.warning('Execute %s fail with %s' % (sql, e.__class__.__name__))
+                finally:
+                    cursor.close()
 
     def bond(self, cfgfile, postrun, timeout, dbinfo,
              **kwargs):
@@ -360,8 +695,8 @@ class DatabaseManager(DatabaseManagerBase):
         master = kwargs.pop('master')
         schemas = set(master.pop('schemas'))
         force = kwargs.pop('force', False)
-        config = self.config_cls.load(cfgfile)
-        sockfile = config.get('socket')
+        config = self.config_cls.cached(cfgfile)
+        sockfile = config.sockfile
 
         auth = privilegeutils.mysql_slave_replprivileges(slave_id=dbinfo.get('database_id'), **master)
         master_name = 'masterdb-%(database_id)s' % auth
@@ -449,8 +784,8 @@ class DatabaseManager(DatabaseManagerBase):
         schemas = master.get('schemas')
         ready = master.get('ready')
         force = kwargs.pop('force', False)
-        config = self.config_cls.load(cfgfile)
-        sockfile = config.get('socket')
+        config = self.config_cls.cached(cfgfile)
+        sockfile = config.sockfile
 
         master_name = 'masterdb-%(database_id)s' % master
 
@@ -492,8 +827,8 @@ class DatabaseManager(DatabaseManagerBase):
         """revoke from master database intance"""
         conf = CONF[common.DB]
         auth = kwargs.pop('auth')
-        config = self.config_cls.load(cfgfile)
-        sockfile = config.get('socket')
+        config = self.config_cls.cached(cfgfile)
+        sockfile = config.sockfile
         if not auth.get('schema'):
             auth['schema'] = '*'
 
@@ -519,8 +854,8 @@ class DatabaseManager(DatabaseManagerBase):
         replication = kwargs.pop('replication')
         schemas = kwargs.pop('schemas')
         cf = self.config_cls.load(cfgfile)
-        sockfile = cf.get('socket')
-        if not cf.get('log-bin'):
+        sockfile = cf.sockfile
+        if not cf.logbin:
             if schemas:
                 raise exceptions.AcceptableDbError('Databaes bin log is off in config file')
             LOG.warning('Database log-bin not open, try open it')
@@ -534,10 +869,8 @@ class DatabaseManager(DatabaseManagerBase):
                     raise exceptions.UnAcceptableDbError('Bin log has been opened but now closed')
             cf.save(cfgfile)
             LOG.info('log bin opened in config file, try restart mysql')
-            self.stop(cfgfile, timeout=3)
-            self.start(cfgfile)
-            if not os.path.exists(sockfile):
-                eventlet.sleep(1)
+            self.stop(cfgfile, timeout=timeout)
+            self.start(cfgfile, timeout=timeout)
 
         sqls = []
         sqls.append("grant %(privileges)s on *.* to '%(user)s'@'%(source)s' IDENTIFIED by '%(passwd)s'"
@@ -592,8 +925,8 @@ class DatabaseManager(DatabaseManagerBase):
     def replication_status(self, cfgfile, postrun, timeout, **kwargs):
         """get slave replication status"""
         conf = CONF[common.DB]
-        config = self.config_cls.load(cfgfile)
-        sockfile = config.get('socket')
+        config = self.config_cls.cached(cfgfile)
+        sockfile = config.sockfile
 
         master = kwargs.pop('master')
         schemas = set(master.pop('schemas'))
@@ -628,51 +961,379 @@ class DatabaseManager(DatabaseManagerBase):
             LOG.debug(msg)
         return if_success, msg
 
+    def replication_samples(self, cfgfile):
+        """replication state of each channel of slave database intance"""
+        conf = CONF[common.DB]
+        config = self.config_cls.cached(cfgfile)
+        samples = []
+        with self._lower_conn(config.sockfile, conf.localroot, conf.localpass,
+                              schema=None, raise_on_warnings=False) as conn:
+            now = round(time.time(), 3)
+            for slave_status in self._slave_status(conn):
+                lag = slave_status.get('Seconds_Behind_Master')
+                samples.append(dict(channel=slave_status.get('Connection_name'),
+                                    host=slave_status.get('Master_Host'),
+                                    port=slave_status.get('Master_Port'),
+                                    io=slave_status.get('Slave_IO_Running', '').lower() == 'yes',
+                                    sql=slave_status.get('Slave_SQL_Running', '').lower() == 'yes',
+                                    lag=int(lag) if lag is not None else None,
+                                    read_file=slave_status.get('Master_Log_File'),
+                                    read_pos=int(slave_status.get('Read_Master_Log_Pos') or 0),
+                                    exec_file=slave_status.get('Relay_Master_Log_File'),
+                                    exec_pos=int(slave_status.get('Exec_Master_Log_Pos') or 0),
+                                    error=(slave_status.get('Last_IO_Error') or
+                                           slave_status.get('Last_SQL_Error') or None),
+                                    time=now))
+        return samples
+
+    def master_status(self, cfgfile):
+        """current binlog position of master database intance"""
+        conf = CONF[common.DB]
+        config = self.config_cls.cached(cfgfile)
+        with self._lower_conn(config.sockfile, conf.localroot, conf.localpass,
+                              schema=None, raise_on_warnings=False) as conn:
+            binlog = self._master_status(conn)
+        if not binlog:
+            return None
+        return dict(File=binlog.get('File'), Position=int(binlog.get('Position')))
+
+    def global_status(self, cfgfile):
+        """selected SHOW GLOBAL STATUS values of database intance"""
+        conf = CONF[common.DB]
+        config = self.config_cls.cached(cfgfile)
+        status = {}
+        with self._lower_conn(config.sockfile, conf.localroot, conf.localpass,
+                              schema=None, raise_on_warnings=False) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SHOW GLOBAL STATUS WHERE Variable_name IN (%s) OR Variable_name LIKE 'Com\\_%%'"
+                           % ', '.join(["'%s'" % name for name in STATUSNAMES]))
+            for name, value in cursor.fetchall():
+                if name.startswith('Com_') and name not in STATUSCOMS:
+                    continue
+                try:
+                    status[name] = int(value)
+                except (TypeError, ValueError):
+                    continue
+            cursor.close()
+        return status
+
+    def slowlog_digest(self, cfgfile):
+        """slow log digest of database intance, None means slow log not enable"""
+        slowlog = self.config_cls.cached(cfgfile).slowlog
+        if not slowlog:
+            return None
+        try:
+            return SLOWLOGS[slowlog]
+        except KeyError:
+            digest = SlowLogDigest(slowlog)
+            SLOWLOGS[slowlog] = digest
+            return digest
+
+    def catchup(self, samples, binlog=None):
+        """
+        replication rate and catch up eta of a channel
+        @param samples:     list  replication samples of channel, oldest first
+        @param binlog:      dict  current binlog File/Position of master
+        """
+        # io thread not connected yet, position of sample unknown
+        known = [sample for sample in samples if sample['read_file'] and sample['exec_file']]
+        if not known:
+            last = samples[-1]
+            return dict(lag=last['lag'], io=last['io'], sql=last['sql'], read_rate=None, exec_rate=None,
+                        backlog=None, relay_backlog=None, eta=None)
+        samples = known
+        last = samples[-1]
+        window = [sample for sample in samples if last['time'] - sample['time'] <= RATEWINDOW]
+        first = window[0] if len(window) > 1 else samples[0]
+        used = last['time'] - first['time']
+        read_rate = exec_rate = None
+        if used > 0:
+            read_rate = binlog_distance(first['read_file'], first['read_pos'],
+                                        last['read_file'], last['read_pos']) / used
+            exec_rate = binlog_distance(first['exec_file'], first['exec_pos'],
+                                        last['exec_file'], last['exec_pos']) / used
+        result = dict(lag=last['lag'], io=last['io'], sql=last['sql'],
+                      read_rate=int(read_rate) if read_rate is not None else None,
+                      exec_rate=int(exec_rate) if exec_rate is not None else None,
+                      backlog=None, relay_backlog=None, eta=None)
+        result['relay_backlog'] = binlog_distance(last['exec_file'], last['exec_pos'],
+                                                  last['read_file'], last['read_pos'])
+        if binlog:
+            backlog = binlog_distance(last['exec_file'], last['exec_pos'],
+                                      binlog['File'], binlog['Position'])
+            io_backlog = binlog_distance(last['read_file'], last['read_pos'],
+                                         binlog['File'], binlog['Position'])
+        else:
+            # no master position, io thread read position as master position
+            backlog = result['relay_backlog']
+            io_backlog = 0
+        if backlog is None or io_backlog is None:
+            return result
+        result['backlog'] = max(backlog, 0)
+        io_backlog = max(io_backlog, 0)
+        if not result['backlog']:
+            result['eta'] = 0
+        elif last['sql'] and exec_rate:
+            closing = exec_rate
+            # io thread has caught up, read rate is master write rate
+            if read_rate and io_backlog <= read_rate * RATEWINDOW:
+                closing = exec_rate - read_rate
+            if closing > 0:
+                result['eta'] = int(result['backlog'] / closing)
+        return result
+
+    def _install_db(self, cfgfile, timeout, logfile=None):
+        """run mysql_install_db"""
+        args = [SH, MYSQLINSTALL, '--defaults-file=%s' % cfgfile]
+        args.extend(self.base_opts)
+        if not systemutils.POSIX:
+            # just for test on windows
+            LOG.info('will call %s', ' '.join(args))
+            return
+        with INSTALLSCHEDULER.slot(os.path.dirname(cfgfile), timeout) as waited:
+            if waited:
+                LOG.info('Database install waited %1.2f seconds for install slot' % waited)
+                if timeout:
+                    timeout = max(1, timeout - int(waited))
+            pid = safe_fork()
+            if pid == 0:
+                os.closerange(3, systemutils.MAXFD)
+                logfile = logfile or os.devnull
+                with open(logfile, 'wb') as f:
+                    os.dup2(f.fileno(), 1)
+                    os.dup2(f.fileno(), 2)
+                try:
+                    os.execv(SH, args)
+                except OSError:
+                    os._exit(1)
+            else:
+                try:
+                    wait(pid, timeout)
+                except:
+                    raise
+                finally:
+                    LOG.info('%s has been exit' % MYSQLINSTALL)
+
+    def _template(self, cfgfile, timeout):
+        """get datadir template path, build template if not exist"""
+        conf = CONF[common.DB]
+        config = self.config_cls.cached(cfgfile)
+        key = hashlib.md5(';'.join([str(common.VERSIONMAP.get('mysql'))] +
+                                   ['%s=%s' % (opt, config.get(opt)) for opt in TEMPLATEOPTS])).hexdigest()
+        path = os.path.join(conf.template_path, 'mysql-%s-%s' % (common.VERSIONMAP.get('mysql'), key[:8]))
+        if os.path.exists(path):
+            return path
+        with TEMPLATELOCK:
+            if os.path.exists(path):
+                return path
+            LOG.info('Build mysql datadir template %s' % path)
+            building = path + '.building'
+            if os.path.exists(building):
+                shutil.rmtree(building)
+            os.makedirs(building)
+            # template config, paths in template dir, no network no binlog
+            tconfig = self.config_cls.load(cfgfile)
+            for opt in ('log-bin', 'expire_logs_days', 'max_binlog_size', 'relay-log', 'read-only'):
+                tconfig.config.remove_option('mysqld', opt)
+            tconfig.config.set('mysqld', 'datadir', os.path.join(building, 'data'))
+            tconfig.config.set('mysqld', 'pid-file', os.path.join(building, 'mysql.pid'))
+            tconfig.config.set('mysqld', 'socket', os.path.join(building, 'mysql.sock'))
+            tconfig.config.set('mysqld', 'log-error', os.path.join(building, 'mysql.log'))
+            tconfig.config.set('mysqld_safe', 'log-error', os.path.join(building, 'mysql.log'))
+            tconfig.config.set('mysqld', 'skip-networking', 1)
+            tcfgfile = os.path.join(building, 'mysql.conf')
+            tconfig.save(tcfgfile)
+            _chown(building, tconfig.get('user'))
+            self._install_db(tcfgfile, timeout, logfile=os.path.join(building, 'install.log'))
+            self.start(tcfgfile, timeout=timeout)
+            with self._lower_conn(sockfile=tconfig.sockfile,
+                                  user='root', passwd='', schema='mysql', pooled=False) as conn:
+                for sql in self._template_sqls():
+                    LOG.debug(sql)
+                    cursor = conn.cursor()
+                    cursor.execute(sql)
+                    cursor.close()
+                # slow shutdown, template need clean redo log
+                cursor = conn.cursor()
+                cursor.execute('SET GLOBAL innodb_fast_shutdown = 0')
+                cursor.close()
+            self.stop(tcfgfile, timeout=max(timeout or 0, 60))
+            datadir = tconfig.datadir
+            # server uuid and redo log must not be shared
+            for _file in [os.path.join(datadir, 'auto.cnf')] + glob.glob(os.path.join(datadir, 'ib_logfile*')):
+                if os.path.exists(_file):
+                    os.remove(_file)
+            os.rename(building, path)
+            LOG.info('Mysql datadir template %s build success' % path)
+        return path
+
+    def _clone(self, template, cfgfile):
+        """clone datadir from template"""
+        config = self.config_cls.cached(cfgfile)
+        datadir = config.datadir
+        src = os.path.join(template, 'data')
+        if os.path.exists(datadir):
+            # empty datadir prepared by agent
+            os.rmdir(datadir)
+        # reflink when file system support, datafile can not be hardlink
+        # because innodb write datafile in place
+        if subprocess.call([CP, '-a', '--reflink=auto', src, datadir]) != 0:
+            LOG.warning('Clone datadir with cp fail, try plain copy')
+            if os.path.exists(datadir):
+                shutil.rmtree(datadir)
+            shutil.copytree(src, datadir)
+        _chown(datadir, config.get('user'))
+
     def install(self, cfgfile, postrun, timeout, **kwargs):
         """create database intance"""
         if not os.path.exists(cfgfile):
             raise ValueError('Config file not exist')
-        args = [SH, MYSQLINSTALL, '--defaults-file=%s' % cfgfile]
-        args.extend(self.base_opts)
         replication = kwargs.pop('replication', None)
         auth = kwargs.pop('auth')
         logfile = kwargs.get('logfile')
-        if not systemutils.POSIX:
-            # just for test on windows
-            LOG.info('will call %s', ' '.join(args))
-        else:
-            with goperation.tlock('gopdb-install', 30):
-                pid = safe_fork()
-                if pid == 0:
-                    os.closerange(3, systemutils.MAXFD)
-                    logfile = logfile or os.devnull
-                    with open(logfile, 'wb') as f:
-                        os.dup2(f.fileno(), 1)
-                        os.dup2(f.fileno(), 2)
-                    try:
-                        os.execv(SH, args)
-                    except OSError:
-                        os._exit(1)
-                else:
-                    try:
-                        wait(pid, timeout)
-                    except:
-                        raise
-                    finally:
-                        LOG.info('%s has been exit' % MYSQLINSTALL)
+        cloned = False
+        if CONF[common.DB].template_path and systemutils.POSIX:
+            try:
+                template = self._template(cfgfile, timeout)
+                self._clone(template, cfgfile)
+                cloned = True
+                LOG.info('Database datadir cloned from template %s' % template)
+            except Exception:
+                LOG.exception('Clone datadir from template fail, use %s' % MYSQLINSTALL)
+        if not cloned:
+            self._install_db(cfgfile, timeout, logfile)
         eventlet.sleep(0)
-        self.start(cfgfile)
-        eventlet.sleep(3)
-        binlog = self._init_passwd(cfgfile, auth, replication)
+        ready = self.start(cfgfile, timeout=timeout)
+        if ready is not None:
+            LOG.info('Database intance of %s ready after %1.3f seconds' % (cfgfile, ready))
+        binlog = self._init_passwd(cfgfile, auth, replication, cloned)
         if postrun:
             postrun(binlog)
 
     def dump(self, cfgfile, postrun, timeout,
              **kwargs):
-        """dump database data"""
+        """
+        dump database data
+        @param path:        string  dump path
+        @param schemas:     list    schemas to dump, None means all
+        @param workers:     int     dump worker count
+        """
+        conf = CONF[common.DB]
+        path = kwargs.pop('path')
+        config = self.config_cls.cached(cfgfile)
+        dumper = MysqlDumper(config.sockfile, conf.localroot, conf.localpass, path,
+                             schemas=kwargs.pop('schemas', None),
+                             workers=kwargs.pop('workers', None),
+                             timeout=timeout)
+        manifest = dumper.dump()
+        if postrun:
+            postrun(manifest)
+        return manifest
+
+    def manifest(self, path):
+        """manifest of dump in path"""
+        return load_manifest(path)
+
+    def restore(self, cfgfile, postrun, timeout,
+                **kwargs):
+        """
+        restore database data from dump
+        @param path:        string  dump path
+        @param schemas:     list    schemas to restore, None means all
+        @param workers:     int     restore worker count
+        @param notify:      func    called with progress after tables loaded
+        """
+        conf = CONF[common.DB]
+        path = kwargs.pop('path')
+        config = self.config_cls.cached(cfgfile)
+        restorer = MysqlRestorer(config.sockfile, conf.localroot, conf.localpass, path,
+                                 schemas=kwargs.pop('schemas', None),
+                                 workers=kwargs.pop('workers', None),
+                                 timeout=timeout, notify=kwargs.pop('notify', None))
+        report = restorer.restore()
+        if postrun:
+            postrun(report)
+        return report
+
+    def pending(self, cfgfile):
+        """options changed in config file, need restart to take effect"""
+        try:
+            with open(pending_file(cfgfile), 'rb') as f:
+                return jsonutils.loads(f.read())
+        except (IOError, OSError, ValueError):
+            return []
 
     def load_conf(self, cfgfile, **kwargs):
         """out put database config"""
+        config = self.config_cls.cached(cfgfile)
+        return dict(config=config.options(), restart=self.pending(cfgfile))
+
+    def apply_conf(self, cfgfile, online=True, **configs):
+        """
+        apply config to running database intance and config file
+        dynamic variables changed by SET GLOBAL, static variables need restart
+        @param online:  bool   database intance is running
+        """
+        protected = [k for k in configs if variable_name(k) in set(map(variable_name, PROTECTEDOPTS))]
+        if protected:
+            raise exceptions.AcceptableDbError('Options %s can not be changed' % ','.join(protected))
+        conf = CONF[common.DB]
+        config = self.config_cls.load(cfgfile)
+        applied = []
+        unchanged = []
+        restart = []
+        failed = {}
+        if online:
+            with self._lower_conn(config.sockfile, conf.localroot, conf.localpass,
+                                  raise_on_warnings=False) as conn:
+                cursor = conn.cursor()
+                cursor.execute('SHOW GLOBAL VARIABLES')
+                variables = dict(cursor.fetchall())
+                cursor.close()
+                for key in sorted(configs):
+                    name = variable_name(key)
+                    value = configs[key]
+                    if name not in variables:
+                        # not a server variable, only for startup
+                        restart.append(key)
+                        continue
+                    if _normalize(variables[name]) == _normalize(value):
+                        unchanged.append(key)
+                        continue
+                    sql = 'SET GLOBAL %s = %s' % (name, _literal(conn.converter, value))
+                    LOG.debug(sql)
+                    cursor = conn.cursor()
+                    try:
+                        cursor.execute(sql)
+                        applied.append(key)
+                    except mysql.connector.Error as e:
+                        # ER_INCORRECT_GLOBAL_LOCAL_VAR, variable is read only
+                        if e.errno == 1238:
+                            restart.append(key)
+                        else:
+                            failed[key] = e.msg
+                    finally:
+                        cursor.close()
+        else:
+            # take effect at next start
+            applied = sorted(configs.keys())
+        for key in configs:
+            if key not in failed:
+                config.set(key, configs[key])
+        config.save(cfgfile)
+        for key in configs:
+            if key not in failed and variable_name(key) == 'innodb_buffer_pool_size':
+                # keep memory committed of admission same as buffer pool
+                self._update_budget(cfgfile, configs[key])
+        pending = set(self.pending(cfgfile)) | set(restart)
+        # value changed back by SET GLOBAL need no restart
+        pending = sorted(pending - set(applied) - set(unchanged))
+        if pending:
+            with open(pending_file(cfgfile), 'wb') as f:
+                f.write(jsonutils.dumps(pending))
+        elif os.path.exists(pending_file(cfgfile)):
+            os.remove(pending_file(cfgfile))
+        return dict(applied=applied, unchanged=unchanged, restart=pending, failed=failed)
 
     def save_conf(self, cfgfile, **configs):
         """update database config"""
@@ -680,23 +1341,32 @@ class DatabaseManager(DatabaseManagerBase):
         dbconfig.save(cfgfile)
         systemutils.chmod(cfgfile, 0o644)
 
-    def _init_passwd(self, cfgfile, auth, replication):
-        """init password for database"""
+    @staticmethod
+    def _template_sqls():
+        """sqls not entity specific, can be applied in datadir template"""
         conf = CONF[common.DB]
-        config = self.config_cls.load(cfgfile)
-        sockfile = config.get('socket')
-
-        _auth = dict(user=auth.get('user'), passwd=auth.get('passwd'),
-                     privileges=common.ALLPRIVILEGES, source=auth.get('source') or '%')
-        sqls = ["drop database test",
+        return ["drop database test",
                 "truncate table db",
                 "delete from user where host != 'localhost' or user != 'root'",
                 "update user set user='%s', password=password('%s') where user='root'" % (conf.localroot,
                                                                                           conf.localpass),
-                "grant %(privileges)s on *.* to '%(user)s'@'%(source)s' IDENTIFIED by '%(passwd)s'" % _auth ,
-                "grant grant option on *.* to '%(user)s'@'%(source)s'" % dict(user=_auth.get('user'),
-                                                                              source=_auth.get('source'))
-                ]
+                'FLUSH PRIVILEGES']
+
+    def _init_passwd(self, cfgfile, auth, replication, cloned=False):
+        """init password for database"""
+        conf = CONF[common.DB]
+        config = self.config_cls.cached(cfgfile)
+        sockfile = config.sockfile
+
+        _auth = dict(user=auth.get('user'), passwd=auth.get('passwd'),
+                     privileges=common.ALLPRIVILEGES, source=auth.get('source') or '%')
+        # datadir cloned from template, local root has been set
+        sqls = [] if cloned else self._template_sqls()[:-1]
+        sqls.extend([
+            "grant %(privileges)s on *.* to '%(user)s'@'%(source)s' IDENTIFIED by '%(passwd)s'" % _auth,
+            "grant grant option on *.* to '%(user)s'@'%(source)s'" % dict(user=_auth.get('user'),
+                                                                          source=_auth.get('source'))
+        ])
         if replication:
             sqls.append("grant %(privileges)s on *.* to '%(user)s'@'%(source)s' IDENTIFIED by '%(passwd)s'"
                         % replication)
@@ -705,8 +1375,13 @@ class DatabaseManager(DatabaseManagerBase):
         if replication:
             sqls.append('RESET MASTER')
 
+        if cloned:
+            user, passwd = conf.localroot, conf.localpass
+        else:
+            user, passwd = 'root', ''
+        # password changed in init, connection can not be pooled
         with self._lower_conn(sockfile=sockfile,
-                              user='root', passwd='', schema='mysql') as conn:
+                              user=user, passwd=passwd, schema='mysql', pooled=False) as conn:
             LOG.info('Login mysql from unix sock %s success, try init database' % sockfile)
             for sql in sqls:
                 LOG.debug(sql)
@@ -9,6 +9,56 @@ mysql_db_opts = [
                max=14,
                default=3,
                help='mysql bin log expire days'),
+    cfg.IntOpt('admin_pool_size',
+               min=0,
+               max=8,
+               default=2,
+               help='Max idle admin connections pooled for each mysql intance'),
+    cfg.IntOpt('admin_pool_idle',
+               min=1,
+               default=60,
+               help='Seconds of pooled admin connection can be idle'),
+    cfg.StrOpt('template_path',
+               default=None,
+               help='Path of pre-initialized mysql datadir templates, '
+                    'new database intance will be cloned from template, None means disable'),
+    cfg.IntOpt('dump_workers',
+               min=0,
+               max=32,
+               default=0,
+               help='Workers of parallel dump, 0 means count from cpu count'),
+    cfg.IntOpt('dump_chunk_rows',
+               min=1000,
+               default=200000,
+               help='Rows of each table chunk file in dump'),
+    cfg.IntOpt('dump_buffer_size',
+               min=1,
+               max=256,
+               default=16,
+               help='Max memory(MB) of rows buffered by each dump worker'),
+    cfg.IntOpt('dump_compress_level',
+               min=1,
+               max=9,
+               default=1,
+               help='Gzip compress level of dump chunk files'),
+    cfg.IntOpt('dump_lock_timeout',
+               min=1,
+               max=600,
+               default=30,
+               help='Max seconds of global read lock held by dump, and of dump workers connecting'),
+    cfg.FloatOpt('long_query_time',
+                 min=0.0,
+                 default=1.0,
+                 help='Seconds of query logged in slow log of new mysql intance'),
+    cfg.IntOpt('slowlog_read_size',
+               min=1,
+               max=256,
+               default=16,
+               help='Max size(MB) of slow log read each time'),
+    cfg.IntOpt('slowlog_fingerprints',
+               min=100,
+               default=1000,
+               help='Max query fingerprints kept in slow log digest of each mysql intance'),
 ]
 
 
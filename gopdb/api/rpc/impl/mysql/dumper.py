@@ -0,0 +1,350 @@
+# -*- coding:utf-8 -*-
+import os
+import sys
+import time
+import hashlib
+import eventlet
+import psutil
+from eventlet import queue
+from eventlet.green import subprocess
+import mysql.connector
+
+from simpleutil.config import cfg
+from simpleutil.log import log as logging
+from simpleutil.utils import jsonutils
+
+from gopdb import common
+from gopdb.api.rpc.impl.mysql import dumpworker
+
+CONF = cfg.CONF
+
+LOG = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+MB = 1024 * 1024
+# run worker by file path, not by .pyc
+WORKER = os.path.splitext(dumpworker.__file__)[0] + '.py'
+INTTYPES = frozenset(['tinyint', 'smallint', 'mediumint', 'int', 'bigint'])
+
+
+def quote_name(name):
+    return '`%s`' % name.replace('`', '``')
+
+
+def checksum(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(MB)
+            if not block:
+                break
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def load_manifest(path):
+    manifest = os.path.join(path, MANIFEST)
+    if not os.path.exists(manifest):
+        raise ValueError('Dump manifest not found in %s' % path)
+    with open(manifest, 'rb') as f:
+        return jsonutils.loads(f.read())
+
+
+def dump_workers():
+    workers = CONF[common.DB].dump_workers
+    if not workers:
+        workers = max(2, min(psutil.cpu_count() or 2, 16))
+    return workers
+
+
+class TableChunk(object):
+
+    def __init__(self, schema, table, columns, index, key=None, lower=None, upper=None):
+        self.schema = schema
+        self.table = table
+        self.columns = columns
+        self.index = index
+        self.key = key
+        self.lower = lower
+        self.upper = upper
+
+    @property
+    def filename(self):
+        return os.path.join(self.schema, '%s.%05d.sql.gz' % (self.table, self.index))
+
+    def sql(self):
+        sql = 'SELECT %s FROM %s.%s' % (', '.join(map(quote_name, self.columns)),
+                                        quote_name(self.schema), quote_name(self.table))
+        where = []
+        if self.lower is not None:
+            where.append('%s >= %d' % (quote_name(self.key), self.lower))
+        if self.upper is not None:
+            where.append('%s < %d' % (quote_name(self.key), self.upper))
+        if where:
+            sql += ' WHERE %s' % ' AND '.join(where)
+        return sql
+
+
+class MysqlDumper(object):
+    """
+    parallel logical dump of mysql intance
+    export tables in primary key chunks, each worker is a process with a connection
+    in same consistent snapshot, rows formatted and compressed into gzip chunk files
+    by worker processes, so dump use multi cpu cores
+    """
+
+    def __init__(self, sockfile, user, passwd, path,
+                 schemas=None, workers=None, timeout=None):
+        conf = CONF[common.DB]
+        self.sockfile = sockfile
+        self.user = user
+        self.passwd = passwd
+        self.path = path
+        self.schemas = schemas
+        self.workers = workers or dump_workers()
+        self.timeout = timeout
+        self.chunk_rows = conf.dump_chunk_rows
+        # memory used for rows buffer of each worker
+        self.buffer_size = conf.dump_buffer_size * MB
+        self.compresslevel = conf.dump_compress_level
+        self.lock_timeout = conf.dump_lock_timeout
+        self.chunks = queue.LightQueue()
+        # (schema, table) -> chunk results
+        self.results = {}
+        self.error = None
+
+    def _connect(self):
+        return mysql.connector.connect(user=self.user, passwd=self.passwd,
+                                       unix_socket=self.sockfile,
+                                       raise_on_warnings=False)
+
+    @staticmethod
+    def _fetchall(conn, sql, params=None):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall() if cursor.with_rows else None
+        finally:
+            cursor.close()
+
+    def _spawn(self):
+        """start a worker process, worker connect and wait for snapshot command"""
+        proc = subprocess.Popen([sys.executable, WORKER], close_fds=True,
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        options = dict(sockfile=self.sockfile, user=self.user, passwd=self.passwd,
+                       path=self.path, compresslevel=self.compresslevel,
+                       buffer_size=self.buffer_size)
+        self._send(proc, options)
+        return proc
+
+    @staticmethod
+    def _send(proc, message):
+        proc.stdin.write(jsonutils.dumps(message) + '\n')
+        proc.stdin.flush()
+
+    @staticmethod
+    def _recv(proc):
+        line = proc.stdout.readline()
+        if not line:
+            raise RuntimeError('Dump worker %d exit with %s' % (proc.pid, proc.wait()))
+        message = jsonutils.loads(line)
+        if 'error' in message:
+            raise RuntimeError('Dump worker %d fail with %s' % (proc.pid, message['error']))
+        return message
+
+    @staticmethod
+    def _kill(procs):
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+
+    def _snapshot(self):
+        """
+        open planning connection and start worker processes in same consistent snapshot,
+        return planning connection, worker processes and binlog position
+        """
+        procs = []
+        conn = None
+        lockconn = None
+        try:
+            # workers connected before lock, only snapshot opened under lock
+            with eventlet.Timeout(self.lock_timeout):
+                for i in range(self.workers):
+                    procs.append(self._spawn())
+                for proc in procs:
+                    self._recv(proc)
+            conn = self._connect()
+            self._fetchall(conn, 'SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            lockconn = self._connect()
+            self._fetchall(lockconn, 'FLUSH TABLES WITH READ LOCK')
+            try:
+                # all writes blocked, lock must not be held long
+                with eventlet.Timeout(self.lock_timeout):
+                    binlog = self._fetchall(lockconn, 'SHOW MASTER STATUS')
+                    self._fetchall(conn, 'START TRANSACTION WITH CONSISTENT SNAPSHOT')
+                    for proc in procs:
+                        self._send(proc, dict(snapshot=True))
+                    for proc in procs:
+                        self._recv(proc)
+            finally:
+                self._fetchall(lockconn, 'UNLOCK TABLES')
+        except (Exception, eventlet.Timeout):
+            self._kill(procs)
+            if conn is not None:
+                conn.close()
+            raise
+        finally:
+            if lockconn is not None:
+                lockconn.close()
+        if binlog:
+            binlog = dict(File=binlog[0][0], Position=int(binlog[0][1]))
+        else:
+            LOG.warning('Binlog of %s not enable, no binlog position in dump' % self.sockfile)
+            binlog = None
+        return conn, procs, binlog
+
+    def _plan(self, conn):
+        """find schemas and tables, split tables to chunks, return schemas info of manifest"""
+        schemas = {}
+        for schema, character, collation in self._fetchall(
+                conn, 'SELECT SCHEMA_NAME, DEFAULT_CHARACTER_SET_NAME, DEFAULT_COLLATION_NAME '
+                      'FROM information_schema.SCHEMATA'):
+            if schema in common.IGNORES['mysql']:
+                continue
+            if self.schemas and schema not in self.schemas:
+                continue
+            schemas[schema] = dict(character_set=character, collation_type=collation,
+                                   tables={}, views={})
+        if self.schemas:
+            missed = set(self.schemas) - set(schemas.keys())
+            if missed:
+                raise ValueError('Schemas %s not found' % ','.join(missed))
+        chunks = []
+        for schema in schemas:
+            tables = schemas[schema]['tables']
+            for table, table_type, rows in self._fetchall(
+                    conn, 'SELECT TABLE_NAME, TABLE_TYPE, TABLE_ROWS FROM information_schema.TABLES '
+                          'WHERE TABLE_SCHEMA = %s', (schema, )):
+                if table_type == 'VIEW':
+                    create = self._fetchall(conn, 'SHOW CREATE VIEW %s.%s' % (quote_name(schema),
+                                                                              quote_name(table)))
+                    schemas[schema]['views'][table] = create[0][1]
+                    continue
+                create = self._fetchall(conn, 'SHOW CREATE TABLE %s.%s' % (quote_name(schema),
+                                                                           quote_name(table)))
+                tables[table] = dict(create=create[0][1], rows=0, size=0, chunks=[])
+                chunks.extend(self._split(conn, schema, table, rows or 0))
+        # chunks of split tables first
+        chunks.sort(key=lambda c: (c.lower is None and c.upper is None, c.schema, c.table, c.index))
+        for chunk in chunks:
+            self.chunks.put(chunk)
+        LOG.info('Dump %d schemas %d chunks from %s' % (len(schemas), len(chunks), self.sockfile))
+        return schemas
+
+    def _split(self, conn, schema, table, rows):
+        columns = []
+        keys = []
+        for column, data_type, column_key in self._fetchall(
+                conn, 'SELECT COLUMN_NAME, DATA_TYPE, COLUMN_KEY FROM information_schema.COLUMNS '
+                      'WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s ORDER BY ORDINAL_POSITION',
+                (schema, table)):
+            columns.append(column)
+            if column_key == 'PRI':
+                keys.append((column, data_type))
+        # only table with single integer primary key can be split
+        if rows <= self.chunk_rows or len(keys) != 1 or keys[0][1] not in INTTYPES:
+            return [TableChunk(schema, table, columns, 0)]
+        key = keys[0][0]
+        lower, upper = self._fetchall(conn, 'SELECT MIN(%s), MAX(%s) FROM %s.%s' %
+                                      (quote_name(key), quote_name(key),
+                                       quote_name(schema), quote_name(table)))[0]
+        if lower is None:
+            return [TableChunk(schema, table, columns, 0)]
+        count = (rows + self.chunk_rows - 1) // self.chunk_rows
+        step = max((upper - lower + count) // count, 1)
+        chunks = []
+        index = 0
+        start = lower
+        while start <= upper:
+            end = start + step
+            # first and last chunk no bound
+            chunks.append(TableChunk(schema, table, columns, index, key,
+                                     start if index else None,
+                                     end if end <= upper else None))
+            index += 1
+            start = end
+        return chunks
+
+    def _worker(self, proc):
+        try:
+            while self.error is None:
+                try:
+                    chunk = self.chunks.get_nowait()
+                except queue.Empty:
+                    break
+                start = time.time()
+                prefix = 'INSERT INTO %s (%s) VALUES\n' % (quote_name(chunk.table),
+                                                           ', '.join(map(quote_name, chunk.columns)))
+                self._send(proc, dict(sql=chunk.sql(), prefix=prefix, file=chunk.filename))
+                result = self._recv(proc)
+                LOG.debug('Dump %s %d rows used %1.3f seconds' % (chunk.filename, result['rows'],
+                                                                  time.time() - start))
+                result['index'] = chunk.index
+                self.results.setdefault((chunk.schema, chunk.table), []).append(result)
+        except Exception as e:
+            LOG.exception('Dump worker fail')
+            if self.error is None:
+                self.error = e
+        finally:
+            # worker exit after stdin closed
+            proc.stdin.close()
+            if proc.wait() != 0 and self.error is None:
+                self.error = RuntimeError('Dump worker %d exit with %d' % (proc.pid, proc.returncode))
+
+    def dump(self):
+        """dump intance into path, return manifest"""
+        start = time.time()
+        if os.path.exists(os.path.join(self.path, MANIFEST)):
+            raise ValueError('Dump path %s has been used' % self.path)
+        conn, procs, binlog = self._snapshot()
+        try:
+            schemas = self._plan(conn)
+            for schema in schemas:
+                path = os.path.join(self.path, schema)
+                if not os.path.exists(path):
+                    os.makedirs(path, 0o755)
+        except Exception:
+            self._kill(procs)
+            raise
+        finally:
+            conn.close()
+        pool = eventlet.GreenPool(self.workers)
+        try:
+            with eventlet.Timeout(self.timeout):
+                for proc in procs:
+                    pool.spawn_n(self._worker, proc)
+                pool.waitall()
+        except eventlet.Timeout as e:
+            self.error = e
+            self._kill(procs)
+            raise
+        if self.error is not None:
+            raise self.error
+        rows = 0
+        size = 0
+        for (schema, table), results in self.results.iteritems():
+            results.sort(key=lambda r: r.pop('index'))
+            info = schemas[schema]['tables'][table]
+            info['chunks'] = results
+            info['rows'] = sum([r['rows'] for r in results])
+            info['size'] = sum([r['size'] for r in results])
+            rows += info['rows']
+            size += info['size']
+        manifest = dict(ctime=int(start), binlog=binlog, schemas=schemas,
+                        workers=self.workers, rows=rows, size=size,
+                        elapsed=round(time.time() - start, 3))
+        with open(os.path.join(self.path, MANIFEST), 'wb') as f:
+            f.write(jsonutils.dumps(manifest))
+        LOG.info('Dump %d rows to %s, used %1.3f seconds' % (rows, self.path, manifest['elapsed']))
+        return manifest
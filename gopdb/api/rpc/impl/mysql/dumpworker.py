@@ -0,0 +1,166 @@
+# -*- coding:utf-8 -*-
+"""
+dump worker process of MysqlDumper
+run by file path, only stdlib and mysql.connector imported, no eventlet
+one json message each line
+  stdin  first line, connection and options
+  stdout {"connected": true} after connected
+  stdin  {"snapshot": true} sent under global read lock
+  stdout {"ready": true} after consistent snapshot opened
+  stdin  chunk {"sql", "prefix", "file"}
+  stdout chunk result {"file", "rows", "size", "md5"} or {"error"}
+"""
+import os
+import sys
+import gzip
+import json
+import hashlib
+import binascii
+import mysql.connector
+from mysql.connector.constants import FieldFlag
+from mysql.connector.constants import FieldType
+
+MB = 1024 * 1024
+# rows fetched from server each time
+FETCHROWS = 1000
+# max size of one insert sql, less than default max_allowed_packet
+STATEMENTSIZE = MB
+
+NUMERICTYPES = frozenset([FieldType.TINY, FieldType.SHORT, FieldType.INT24,
+                          FieldType.LONG, FieldType.LONGLONG, FieldType.YEAR,
+                          FieldType.FLOAT, FieldType.DOUBLE,
+                          FieldType.DECIMAL, FieldType.NEWDECIMAL])
+# string types with binary flag are binary data
+STRINGTYPES = frozenset([FieldType.STRING, FieldType.VAR_STRING, FieldType.VARCHAR,
+                         FieldType.TINY_BLOB, FieldType.MEDIUM_BLOB,
+                         FieldType.LONG_BLOB, FieldType.BLOB])
+HEXTYPES = frozenset([FieldType.BIT, FieldType.GEOMETRY])
+
+NUMERIC = 0
+STRING = 1
+HEX = 2
+
+
+def escape(value):
+    # newline must be escaped, restore split statements by ';\n'
+    return value.replace('\\', '\\\\').replace('\0', '\\0').replace('\n', '\\n').replace(
+        '\r', '\\r').replace('\x1a', '\\Z').replace("'", "\\'")
+
+
+def checksum(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(MB)
+            if not block:
+                break
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def column_kinds(description):
+    kinds = []
+    for column in description:
+        type_code = column[1]
+        flags = column[7] if len(column) > 7 else 0
+        if type_code in NUMERICTYPES:
+            kinds.append(NUMERIC)
+        elif type_code in HEXTYPES or (type_code in STRINGTYPES and flags & FieldFlag.BINARY):
+            kinds.append(HEX)
+        else:
+            kinds.append(STRING)
+    return kinds
+
+
+def literal(kind, value):
+    if value is None:
+        return 'NULL'
+    value = str(value)
+    if kind == NUMERIC:
+        return value
+    if kind == HEX:
+        return '0x%s' % binascii.hexlify(value) if value else "''"
+    return "'%s'" % escape(value)
+
+
+def dump_chunk(conn, options, chunk):
+    filename = os.path.join(options['path'], chunk['file'])
+    prefix = chunk['prefix']
+    buffer_size = options['buffer_size']
+    fobj = gzip.open(filename, 'wb', options['compresslevel'])
+    rows = 0
+    buffered = []
+    buffered_size = 0
+    values = []
+    values_size = 0
+    cursor = conn.cursor(raw=True)
+    try:
+        cursor.execute(chunk['sql'])
+        kinds = column_kinds(cursor.description)
+        while True:
+            batch = cursor.fetchmany(FETCHROWS)
+            if not batch:
+                break
+            for row in batch:
+                value = '(%s)' % ','.join([literal(kind, v) for kind, v in zip(kinds, row)])
+                values.append(value)
+                values_size += len(value)
+                rows += 1
+                if values_size >= STATEMENTSIZE:
+                    buffered.append(prefix + ',\n'.join(values) + ';\n')
+                    buffered_size += values_size
+                    values = []
+                    values_size = 0
+                    if buffered_size >= buffer_size:
+                        fobj.write(''.join(buffered))
+                        buffered = []
+                        buffered_size = 0
+        if values:
+            buffered.append(prefix + ',\n'.join(values) + ';\n')
+        if buffered:
+            fobj.write(''.join(buffered))
+    finally:
+        cursor.close()
+        fobj.close()
+    return dict(file=chunk['file'], rows=rows,
+                size=os.path.getsize(filename),
+                md5=checksum(filename))
+
+
+def reply(message):
+    sys.stdout.write(json.dumps(message) + '\n')
+    sys.stdout.flush()
+
+
+def main():
+    options = json.loads(sys.stdin.readline())
+    conn = mysql.connector.connect(user=options['user'], passwd=options['passwd'],
+                                   unix_socket=options['sockfile'],
+                                   raise_on_warnings=False)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        reply(dict(connected=True))
+        # snapshot opened when dumper hold global read lock
+        line = sys.stdin.readline()
+        if not line or not json.loads(line).get('snapshot'):
+            return
+        cursor.execute('START TRANSACTION WITH CONSISTENT SNAPSHOT')
+        cursor.close()
+        reply(dict(ready=True))
+        while True:
+            line = sys.stdin.readline()
+            if not line:
+                break
+            try:
+                result = dump_chunk(conn, options, json.loads(line))
+            except Exception as e:
+                reply(dict(error='%s: %s' % (e.__class__.__name__, str(e))))
+                break
+            reply(result)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
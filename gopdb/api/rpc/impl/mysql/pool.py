@@ -0,0 +1,77 @@
+import time
+import mysql.connector
+
+from simpleutil.config import cfg
+from simpleutil.log import log as logging
+
+from gopdb import common
+
+CONF = cfg.CONF
+
+LOG = logging.getLogger(__name__)
+
+
+class AdminConnectionPool(object):
+    """pooled admin connections from unix socket, keyed by socket, user and schema"""
+
+    def __init__(self):
+        # (sockfile, user, schema) -> list of (connection, last used time)
+        self.pools = {}
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            LOG.debug('Close pooled mysql connection fail')
+
+    def _evict(self, now):
+        idle = CONF[common.DB].admin_pool_idle
+        for key in self.pools.keys():
+            pool = self.pools[key]
+            while pool and now - pool[0][1] > idle:
+                self._close(pool.pop(0)[0])
+            if not pool:
+                self.pools.pop(key, None)
+
+    def get(self, sockfile, user, passwd, schema=None, raise_on_warnings=True):
+        now = time.time()
+        self._evict(now)
+        pool = self.pools.get((sockfile, user, schema))
+        while pool:
+            conn = pool.pop()[0]
+            try:
+                conn.ping(reconnect=False)
+            except mysql.connector.Error:
+                self._close(conn)
+                continue
+            conn.raise_on_warnings = raise_on_warnings
+            return conn
+        kwargs = dict(user=user, passwd=passwd, unix_socket=sockfile,
+                      raise_on_warnings=raise_on_warnings)
+        if schema:
+            kwargs['database'] = schema
+        return mysql.connector.connect(**kwargs)
+
+    def put(self, sockfile, user, schema, conn):
+        pool = self.pools.setdefault((sockfile, user, schema), [])
+        if len(pool) >= CONF[common.DB].admin_pool_size:
+            self._close(conn)
+            return
+        try:
+            # session variables and temporary tables must not leak to next user
+            conn.reset_session()
+        except (AttributeError, mysql.connector.Error):
+            self._close(conn)
+            return
+        pool.append((conn, time.time()))
+
+    def invalidate(self, sockfile):
+        for key in self.pools.keys():
+            if key[0] == sockfile:
+                for conn, last in self.pools.pop(key, []):
+                    self._close(conn)
+        LOG.debug('Pooled connections of %s invalidated' % sockfile)
+
+
+ADMINPOOL = AdminConnectionPool()
@@ -0,0 +1,299 @@
+# -*- coding:utf-8 -*-
+import os
+import re
+import gzip
+import time
+import eventlet
+from eventlet import tpool
+from eventlet import queue
+import mysql.connector
+
+from simpleutil.config import cfg
+from simpleutil.log import log as logging
+from simpleutil.utils import jsonutils
+
+from gopdb import common
+from gopdb.api.rpc.impl.mysql.dumper import MB
+from gopdb.api.rpc.impl.mysql.dumper import checksum
+from gopdb.api.rpc.impl.mysql.dumper import dump_workers
+from gopdb.api.rpc.impl.mysql.dumper import load_manifest
+from gopdb.api.rpc.impl.mysql.dumper import quote_name
+
+CONF = cfg.CONF
+
+LOG = logging.getLogger(__name__)
+
+# statement end in chunk file, newline in values has been escaped
+DELIMITER = ';\n'
+SECONDARYKEYS = ('KEY ', 'UNIQUE KEY ', 'FULLTEXT KEY ', 'SPATIAL KEY ')
+DEFINER = re.compile(r'DEFINER=`[^`]*`@`[^`]*`\s+')
+# min seconds between two progress notify
+NOTIFYINTERVAL = 5
+
+
+def split_create(create):
+    """split secondary indexes and foreign keys out of create table sql"""
+    lines = create.split('\n')
+    # table options and partition block of partitioned table after line start with )
+    end = 1
+    while end < len(lines) and not lines[end].startswith(')'):
+        end += 1
+    head, body, tail = lines[0], lines[1:end], '\n'.join(lines[end:])
+    autoinc = None
+    for line in body:
+        define = line.strip()
+        if define.startswith('`') and ' AUTO_INCREMENT' in define:
+            autoinc = '`%s`' % define.split('`')[1]
+    defines = []
+    indexes = []
+    constraints = []
+    for line in body:
+        define = line.strip().rstrip(',')
+        if define.startswith(SECONDARYKEYS):
+            # auto increment column must be in a key
+            if autoinc and autoinc in define.split('(', 1)[-1]:
+                defines.append(define)
+            else:
+                indexes.append(define)
+        elif define.startswith('CONSTRAINT '):
+            constraints.append(define)
+        else:
+            defines.append(define)
+    return '%s\n  %s\n%s' % (head, ',\n  '.join(defines), tail), indexes, constraints
+
+
+def read_chunk(filename, size):
+    """yield sql statements of chunk file"""
+    fobj = tpool.execute(gzip.open, filename, 'rb')
+    try:
+        left = ''
+        while True:
+            # decompress in native thread
+            block = tpool.execute(fobj.read, size)
+            if not block:
+                break
+            statements = (left + block).split(DELIMITER)
+            left = statements.pop()
+            for statement in statements:
+                yield statement
+        if left.strip():
+            yield left
+    finally:
+        tpool.execute(fobj.close)
+
+
+class TableProgress(object):
+
+    def __init__(self, schema, table, info):
+        self.schema = schema
+        self.table = table
+        self.chunks = len(info['chunks'])
+        if self.chunks:
+            self.create, self.indexes, self.constraints = split_create(info['create'])
+        else:
+            self.create, self.indexes, self.constraints = info['create'], [], []
+        self.total = info['rows']
+        self.loaded = 0
+        self.done = 0
+        self.start = None
+        self.used = 0.0
+        self.index_used = 0.0
+
+    @property
+    def name(self):
+        return '%s.%s' % (self.schema, self.table)
+
+    def info(self):
+        return dict(rows=self.loaded, chunks=self.done, seconds=round(self.used, 3),
+                    index_seconds=round(self.index_used, 3),
+                    rate=int(self.loaded / self.used) if self.used else 0)
+
+
+class MysqlRestorer(object):
+    """
+    parallel restore chunked dump of MysqlDumper into mysql intance
+    tables created without secondary indexes, indexes and foreign keys
+    added after table data loaded
+    """
+
+    def __init__(self, sockfile, user, passwd, path,
+                 schemas=None, workers=None, timeout=None, notify=None):
+        self.sockfile = sockfile
+        self.user = user
+        self.passwd = passwd
+        self.path = path
+        self.workers = workers or dump_workers()
+        self.timeout = timeout
+        self.buffer_size = CONF[common.DB].dump_buffer_size * MB
+        self.manifest = load_manifest(path)
+        if schemas:
+            missed = set(schemas) - set(self.manifest['schemas'].keys())
+            if missed:
+                raise ValueError('Schemas %s not found in dump' % ','.join(missed))
+        self.schemas = schemas or self.manifest['schemas'].keys()
+        self.chunks = queue.LightQueue()
+        # schema.table -> table progress
+        self.tables = {}
+        self.error = None
+        # called with progress after tables loaded
+        self.notify = notify
+        self.notified = 0
+
+    def _connect(self, schema=None):
+        kwargs = dict(user=self.user, passwd=self.passwd,
+                      unix_socket=self.sockfile, raise_on_warnings=False)
+        if schema:
+            kwargs['database'] = schema
+        return mysql.connector.connect(**kwargs)
+
+    @staticmethod
+    def _execute(conn, sql):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql)
+            if cursor.with_rows:
+                return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def _prepare(self):
+        """create tables without secondary indexes"""
+        conn = self._connect()
+        try:
+            exists = set([r[0] for r in self._execute(conn, 'SHOW DATABASES')])
+            for schema in self.schemas:
+                if schema not in exists:
+                    raise ValueError('Schema %s not created' % schema)
+                tables = self.manifest['schemas'][schema]['tables']
+                conn.database = schema
+                self._execute(conn, 'SET SESSION foreign_key_checks = 0')
+                for table in tables:
+                    progress = TableProgress(schema, table, tables[table])
+                    self._execute(conn, progress.create)
+                    self.tables[progress.name] = progress
+                    for chunk in tables[table]['chunks']:
+                        self.chunks.put((progress, chunk))
+        finally:
+            conn.close()
+        LOG.info('Restore %d tables %d chunks from %s' % (len(self.tables), self.chunks.qsize(), self.path))
+
+    def _load_chunk(self, conn, progress, chunk):
+        filename = os.path.join(self.path, chunk['file'])
+        if tpool.execute(checksum, filename) != chunk['md5']:
+            raise ValueError('Checksum of %s not match' % chunk['file'])
+        if conn.database != progress.schema:
+            conn.database = progress.schema
+        for statement in read_chunk(filename, self.buffer_size):
+            conn.cmd_query(statement)
+        conn.commit()
+
+    def _add_indexes(self, conn, progress):
+        if not progress.indexes:
+            return
+        start = time.time()
+        self._execute(conn, 'ALTER TABLE %s.%s %s' % (quote_name(progress.schema), quote_name(progress.table),
+                                                      ', '.join(['ADD %s' % i for i in progress.indexes])))
+        progress.index_used = time.time() - start
+
+    def _worker(self):
+        conn = None
+        try:
+            conn = self._connect()
+            for sql in ('SET SESSION unique_checks = 0', 'SET SESSION foreign_key_checks = 0'):
+                self._execute(conn, sql)
+            while self.error is None:
+                try:
+                    progress, chunk = self.chunks.get_nowait()
+                except queue.Empty:
+                    break
+                if progress.start is None:
+                    progress.start = time.time()
+                self._load_chunk(conn, progress, chunk)
+                progress.loaded += chunk['rows']
+                progress.done += 1
+                if progress.done == progress.chunks:
+                    progress.used = time.time() - progress.start
+                    # last chunk loaded, build secondary indexes
+                    self._add_indexes(conn, progress)
+                    LOG.info('Restore table %s: %d rows used %1.3f seconds(%d rows/s), '
+                             'index used %1.3f seconds' % (progress.name, progress.loaded, progress.used,
+                                                           progress.info()['rate'], progress.index_used))
+                    self._notify(progress)
+                else:
+                    LOG.debug('Restore table %s: %d/%d rows' % (progress.name, progress.loaded, progress.total))
+        except Exception as e:
+            LOG.exception('Restore worker fail')
+            if self.error is None:
+                self.error = e
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def progress(self):
+        """tables and rows loaded now"""
+        tables = self.tables.values()
+        return dict(tables=len(tables),
+                    finished=len([p for p in tables if p.done == p.chunks]),
+                    total=sum([p.total for p in tables]),
+                    rows=sum([p.loaded for p in tables]))
+
+    def _notify(self, progress):
+        if self.notify is None:
+            return
+        now = time.time()
+        if now - self.notified < NOTIFYINTERVAL:
+            return
+        self.notified = now
+        _progress = self.progress()
+        _progress['table'] = progress.name
+        _progress['info'] = progress.info()
+        try:
+            self.notify(_progress)
+        except Exception:
+            LOG.exception('Notify restore progress fail')
+
+    def _finish(self):
+        """add foreign keys and create views"""
+        conn = self._connect()
+        try:
+            self._execute(conn, 'SET SESSION foreign_key_checks = 0')
+            for progress in self.tables.values():
+                if progress.constraints:
+                    self._execute(conn, 'ALTER TABLE %s.%s %s' %
+                                  (quote_name(progress.schema), quote_name(progress.table),
+                                   ', '.join(['ADD %s' % c for c in progress.constraints])))
+            for schema in self.schemas:
+                conn.database = schema
+                for view in self.manifest['schemas'][schema]['views'].values():
+                    self._execute(conn, DEFINER.sub('', view))
+        finally:
+            conn.close()
+
+    def restore(self):
+        """restore dump into intance, return restore report"""
+        start = time.time()
+        self._prepare()
+        pool = eventlet.GreenPool(self.workers)
+        try:
+            with eventlet.Timeout(self.timeout):
+                for i in range(self.workers):
+                    pool.spawn_n(self._worker)
+                pool.waitall()
+        except eventlet.Timeout as e:
+            # workers stop after current chunk
+            self.error = e
+            raise
+        if self.error is not None:
+            raise self.error
+        self._finish()
+        rows = sum([progress.loaded for progress in self.tables.values()])
+        elapsed = time.time() - start
+        report = dict(ctime=int(start), schemas=self.schemas, workers=self.workers,
+                      rows=rows, elapsed=round(elapsed, 3),
+                      rate=int(rows / elapsed) if elapsed else 0,
+                      binlog=self.manifest.get('binlog'),
+                      tables=dict([(name, progress.info()) for name, progress in self.tables.items()]))
+        with open(os.path.join(self.path, 'restore-%d.json' % int(start)), 'wb') as f:
+            f.write(jsonutils.dumps(report))
+        LOG.info('Restore %d rows from %s, used %1.3f seconds' % (rows, self.path, elapsed))
+        return report
@@ -0,0 +1,252 @@
+# -*- coding:utf-8 -*-
+import os
+import re
+import random
+import eventlet
+from eventlet import tpool
+
+from simpleutil.config import cfg
+from simpleutil.log import log as logging
+from simpleutil.utils import jsonutils
+
+from gopdb import common
+from gopdb.api.rpc.impl.mysql.dumper import MB
+
+CONF = cfg.CONF
+
+LOG = logging.getLogger(__name__)
+
+# latencies kept for percentile of each fingerprint
+SAMPLESIZE = 100
+# lines parsed before yield to other greenthreads
+YIELDLINES = 1000
+ENTRYSTART = ('# Time:', '# User@Host:')
+
+METRICS = re.compile(r'#\s+Query_time:\s+([\d.]+)\s+Lock_time:\s+([\d.]+)\s+'
+                     r'Rows_sent:\s+(\d+)\s+Rows_examined:\s+(\d+)')
+USE = re.compile(r'^use\s+`?([^`;\s]+)`?;$', re.IGNORECASE)
+
+COMMENTS = re.compile(r'/\*.*?\*/|(?:--|#)[^\n]*', re.DOTALL)
+STRINGS = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+# sign absorbed when not after a word, id=-5 and id=5 has same fingerprint
+NUMBERS = re.compile(r'(?<!\w)(?:0x[0-9a-f]+|[-+]?\d+(?:\.\d+)?(?:e[-+]?\d+)?)\b')
+INLIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+VALUES = re.compile(r'(values\s*\(\?\+\))(?:\s*,\s*\(\?\+\))+')
+SPACES = re.compile(r'\s+')
+
+
+def slowlog_state(slowlog):
+    """offset and digest of slow log saved in this file"""
+    return slowlog + '.digest'
+
+
+def fingerprint(sql):
+    """normalize sql, values replaced by ?"""
+    sql = COMMENTS.sub(' ', sql)
+    sql = STRINGS.sub('?', sql)
+    sql = sql.lower()
+    sql = NUMBERS.sub('?', sql)
+    sql = SPACES.sub(' ', sql).strip().rstrip(';').strip()
+    # in (?, ?, ?) and multi rows insert
+    sql = INLIST.sub('(?+)', sql)
+    sql = VALUES.sub(r'\1', sql)
+    return sql
+
+
+class QueryStats(object):
+
+    def __init__(self, sql, count=0, total=0.0, lock=0.0, rows_sent=0, rows_examined=0,
+                 max=0.0, samples=None):
+        self.sql = sql
+        self.count = count
+        self.total = total
+        self.lock = lock
+        self.rows_sent = rows_sent
+        self.rows_examined = rows_examined
+        self.max = max
+        self.samples = samples or []
+
+    def add(self, query_time, lock_time, rows_sent, rows_examined):
+        self.count += 1
+        self.total += query_time
+        self.lock += lock_time
+        self.rows_sent += rows_sent
+        self.rows_examined += rows_examined
+        self.max = max(self.max, query_time)
+        # reservoir sampling of latencies
+        if len(self.samples) < SAMPLESIZE:
+            self.samples.append(query_time)
+        else:
+            index = random.randint(0, self.count - 1)
+            if index < SAMPLESIZE:
+                self.samples[index] = query_time
+
+    def p95(self):
+        if not self.samples:
+            return 0.0
+        samples = sorted(self.samples)
+        return samples[min(int(len(samples) * 0.95), len(samples) - 1)]
+
+    def save(self):
+        return dict(sql=self.sql, count=self.count, total=self.total, lock=self.lock,
+                    rows_sent=self.rows_sent, rows_examined=self.rows_examined,
+                    max=self.max, samples=self.samples)
+
+    def info(self):
+        return dict(sql=self.sql, count=self.count,
+                    total=round(self.total, 3),
+                    avg=round(self.total / self.count, 6) if self.count else 0.0,
+                    p95=round(self.p95(), 6), max=round(self.max, 6),
+                    lock=round(self.lock, 6),
+                    rows_sent=self.rows_sent, rows_examined=self.rows_examined,
+                    avg_examined=self.rows_examined // self.count if self.count else 0)
+
+
+class SlowLogDigest(object):
+    """
+    tail mysql slow log incrementally, aggregate queries by schema and fingerprint
+    offset and digest saved together, so restart of agent will not read log again
+    """
+
+    def __init__(self, slowlog):
+        self.slowlog = slowlog
+        self.statefile = slowlog_state(slowlog)
+        self.inode = None
+        self.offset = 0
+        # schema of last use statement
+        self.schema = None
+        # (schema, fingerprint) -> query stats
+        self.queries = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.statefile):
+            return
+        try:
+            with open(self.statefile, 'rb') as f:
+                state = jsonutils.loads(f.read())
+        except (IOError, ValueError):
+            LOG.warning('Slow log digest file %s broken, read slow log from head' % self.statefile)
+            return
+        self.inode = state['inode']
+        self.offset = state['offset']
+        self.schema = state.get('schema')
+        for query in state['queries']:
+            key = (query.pop('schema'), query.pop('fingerprint'))
+            self.queries[key] = QueryStats(**query)
+
+    def _save(self):
+        queries = []
+        for (schema, _fingerprint), stats in self.queries.items():
+            query = stats.save()
+            query['schema'] = schema
+            query['fingerprint'] = _fingerprint
+            queries.append(query)
+        tmp = self.statefile + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(jsonutils.dumps(dict(inode=self.inode, offset=self.offset,
+                                         schema=self.schema, queries=queries)))
+        os.rename(tmp, self.statefile)
+
+    def _add(self, schema, metrics, lines):
+        sql = '\n'.join(lines).strip()
+        if not sql or sql.startswith('#'):
+            return
+        key = (schema, fingerprint(sql))
+        stats = self.queries.get(key)
+        if stats is None:
+            # example of fingerprint is first sql, truncated
+            stats = QueryStats(sql[:1024])
+            self.queries[key] = stats
+        stats.add(*metrics)
+
+    def _parse(self, block):
+        metrics = None
+        lines = []
+        for index, line in enumerate(block.split('\n')):
+            if index % YIELDLINES == 0:
+                eventlet.sleep(0)
+            if line.startswith(ENTRYSTART):
+                if metrics:
+                    self._add(self.schema, metrics, lines)
+                metrics = None
+                lines = []
+            elif line.startswith('# Query_time:'):
+                match = METRICS.match(line)
+                if match:
+                    query_time, lock_time, rows_sent, rows_examined = match.groups()
+                    metrics = (float(query_time), float(lock_time), int(rows_sent), int(rows_examined))
+            elif line.startswith('#'):
+                continue
+            elif metrics is None:
+                # server start head of slow log
+                continue
+            elif USE.match(line):
+                self.schema = USE.match(line).group(1)
+            elif line.startswith('SET timestamp='):
+                continue
+            else:
+                lines.append(line)
+        if metrics:
+            self._add(self.schema, metrics, lines)
+
+    def _read(self, size):
+        with open(self.slowlog, 'rb') as f:
+            f.seek(self.offset)
+            return f.read(size)
+
+    def _evict(self):
+        limit = CONF[common.DB].slowlog_fingerprints
+        if len(self.queries) <= limit:
+            return
+        # drop fingerprints cost least
+        keys = sorted(self.queries.keys(), key=lambda k: self.queries[k].total)
+        for key in keys[:len(self.queries) - limit]:
+            self.queries.pop(key, None)
+
+    def tail(self):
+        """read new entries of slow log, return bytes parsed"""
+        try:
+            st = os.stat(self.slowlog)
+        except OSError:
+            return 0
+        if st.st_ino != self.inode or st.st_size < self.offset:
+            # slow log rotated or truncated
+            self.inode = st.st_ino
+            self.offset = 0
+            self.schema = None
+        if st.st_size == self.offset:
+            return 0
+        size = CONF[common.DB].slowlog_read_size * MB
+        block = tpool.execute(self._read, size)
+        # last entry may be writing by mysqld, only parse entries before last entry start
+        # last entry parsed after next entry start appended
+        end = max(block.rfind('\n' + start) for start in ENTRYSTART)
+        if end > 0:
+            block = block[:end + 1]
+        elif len(block) < size:
+            # only one entry, wait next entry
+            return 0
+        self._parse(block)
+        self.offset += len(block)
+        self._evict()
+        self._save()
+        return len(block)
+
+    def top(self, limit=10, schema=None, order='total'):
+        """top fingerprints ordered by total/count/p95/rows_examined"""
+        queries = []
+        for (_schema, _fingerprint), stats in self.queries.items():
+            if schema and schema != _schema:
+                continue
+            query = stats.info()
+            query['schema'] = _schema
+            query['fingerprint'] = _fingerprint
+            queries.append(query)
+        queries.sort(key=lambda q: q[order], reverse=True)
+        return dict(offset=self.offset, fingerprints=len(self.queries),
+                    queries=queries[:limit])
+
+    def reset(self):
+        self.queries = {}
+        self._save()
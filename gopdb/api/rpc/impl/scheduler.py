@@ -0,0 +1,99 @@
+import os
+import time
+import contextlib
+import eventlet
+import psutil
+from collections import deque
+from eventlet import event
+
+from simpleutil.config import cfg
+from simpleutil.log import log as logging
+
+from gopdb import common
+
+CONF = cfg.CONF
+
+LOG = logging.getLogger(__name__)
+
+
+def rotational(path):
+    """disk of path is rotational or not, None means unknown"""
+    try:
+        st = os.stat(path)
+        sysfs = os.path.realpath('/sys/dev/block/%d:%d' % (os.major(st.st_dev), os.minor(st.st_dev)))
+        # partition has no queue, find from parent disk
+        for _path in (sysfs, os.path.dirname(sysfs)):
+            qfile = os.path.join(_path, 'queue', 'rotational')
+            if os.path.exists(qfile):
+                with open(qfile, 'r') as f:
+                    return f.read().strip() == '1'
+    except (OSError, IOError):
+        pass
+    return None
+
+
+class InstallScheduler(object):
+    """FIFO bounded scheduler for database intance install"""
+
+    def __init__(self):
+        self.running = 0
+        self.waiters = deque()
+        self.auto = None
+        self.count = 0
+        self.waited = 0.0
+
+    def concurrency(self, path=None):
+        concurrency = CONF[common.DB].install_concurrency
+        if concurrency:
+            return concurrency
+        if self.auto is None:
+            concurrency = max(1, min((psutil.cpu_count() or 2) // 2, 8))
+            # install is io bound on rotational disk
+            if path and rotational(path):
+                concurrency = min(concurrency, 2)
+            LOG.info('Database install concurrency set to %d' % concurrency)
+            self.auto = concurrency
+        return self.auto
+
+    @contextlib.contextmanager
+    def slot(self, path=None, timeout=None):
+        """wait for an install slot, yield seconds waited"""
+        start = time.time()
+        if self.running < self.concurrency(path) and not self.waiters:
+            self.running += 1
+        else:
+            waiter = event.Event()
+            self.waiters.append(waiter)
+            LOG.info('Database install queued, %d install waiting' % len(self.waiters))
+            try:
+                with eventlet.Timeout(timeout):
+                    waiter.wait()
+            except eventlet.Timeout:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+                else:
+                    # slot has been handed to this waiter
+                    self._release()
+                raise
+        waited = time.time() - start
+        self.count += 1
+        self.waited += waited
+        try:
+            yield waited
+        finally:
+            self._release()
+
+    def _release(self):
+        if self.waiters and self.running <= self.concurrency():
+            # hand the slot to the first waiter
+            self.waiters.popleft().send()
+        else:
+            self.running -= 1
+
+    def stats(self):
+        return dict(running=self.running, waiting=len(self.waiters),
+                    concurrency=self.concurrency(),
+                    avg_wait=round(self.waited / self.count, 3) if self.count else 0)
+
+
+INSTALLSCHEDULER = InstallScheduler()
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+import time
+from collections import deque
+
+from simpleutil.config import cfg
+from simpleutil.log import log as logging
+
+from simpleservice.loopingcall import IntervalLoopinTask
+
+from gopdb import common
+from gopdb import utils
+
+
+CONF = cfg.CONF
+
+LOG = logging.getLogger(__name__)
+
+
+class ReplicationMonitor(IntervalLoopinTask):
+    """sample replication channels of slave entitys, keep history in ring buffer"""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        conf = CONF[common.DB]
+        self.size = conf.replication_history
+        # entity -> {channel: deque of samples}
+        self.history = {}
+        interval = conf.replication_monitor_interval
+        super(ReplicationMonitor, self).__init__(periodic_interval=interval,
+                                                 initial_delay=interval - time.time() % interval,
+                                                 stop_on_exception=False)
+
+    def __call__(self, *args, **kwargs):
+        endpoint = self.endpoint
+        for entity in endpoint.konwn_database.keys():
+            dbinfo = endpoint.konwn_database.get(entity)
+            if not dbinfo or not dbinfo.get('slave'):
+                continue
+            if not endpoint._entity_process(entity):
+                continue
+            dbtype = dbinfo.get('dbtype')
+            try:
+                samples = utils.impl_cls('rpc', dbtype).replication_samples(endpoint._db_conf(entity, dbtype))
+            except Exception as e:
+                LOG.warning('Sample replication of entity %d fail with %s' % (entity, e.__class__.__name__))
+                continue
+            channels = self.history.setdefault(entity, {})
+            sampled = set()
+            for sample in samples:
+                channel = sample.pop('channel')
+                sampled.add(channel)
+                try:
+                    channels[channel].append(sample)
+                except KeyError:
+                    channels[channel] = deque([sample], maxlen=self.size)
+            # channel removed by unbond
+            for channel in set(channels.keys()) - sampled:
+                channels.pop(channel, None)
+
+    def remove(self, entity):
+        self.history.pop(entity, None)
+
+    def current(self, entity):
+        """last sample of each channel"""
+        channels = self.history.get(entity, {})
+        return dict([(channel, samples[-1]) for channel, samples in channels.items() if samples])
+
+    def samples(self, entity, channel=None, limit=None):
+        """samples of each channel, oldest first"""
+        channels = self.history.get(entity, {})
+        if channel is not None:
+            channels = {channel: channels[channel]} if channel in channels else {}
+        history = {}
+        for _channel, samples in channels.items():
+            samples = list(samples)
+            history[_channel] = samples[-limit:] if limit else samples
+        return history
+
+
+class StatusSampler(IntervalLoopinTask):
+    """sample global status of running entitys, keep rates in rolling window"""
+
+    # values not counter, keep value as sampled
+    GAUGES = frozenset(['Uptime', 'Threads_running', 'Threads_connected'])
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        conf = CONF[common.DB]
+        self.size = conf.status_window
+        # entity -> last raw sample
+        self.last = {}
+        # entity -> deque of rates
+        self.window = {}
+        interval = conf.status_sample_interval
+        super(StatusSampler, self).__init__(periodic_interval=interval,
+                                            initial_delay=interval - time.time() % interval,
+                                            stop_on_exception=False)
+
+    def _rates(self, last, status):
+        interval = status['time'] - last['time']
+        if interval <= 0:
+            return None
+        # database restarted, counters reset
+        if status.get('Uptime', 0) < last.get('Uptime', 0):
+            return None
+        rates = dict(time=status['time'], interval=round(interval, 3))
+        for name, value in status.items():
+            if name == 'time':
+                continue
+            if name in self.GAUGES:
+                rates[name] = value
+            elif name in last:
+                rates[name] = round(max(value - last[name], 0) / interval, 3)
+        return rates
+
+    def __call__(self, *args, **kwargs):
+        endpoint = self.endpoint
+        for entity in endpoint.konwn_database.keys():
+            dbinfo = endpoint.konwn_database.get(entity)
+            if not dbinfo:
+                continue
+            if not endpoint._entity_process(entity):
+                # stoped entity has no rate
+                self.last.pop(entity, None)
+                self.window.pop(entity, None)
+                continue
+            dbtype = dbinfo.get('dbtype')
+            try:
+                status = utils.impl_cls('rpc', dbtype).global_status(endpoint._db_conf(entity, dbtype))
+            except Exception as e:
+                LOG.warning('Sample global status of entity %d fail with %s' % (entity, e.__class__.__name__))
+                continue
+            if not status:
+                continue
+            status['time'] = round(time.time(), 3)
+            last = self.last.get(entity)
+            self.last[entity] = status
+            if last is None:
+                continue
+            rates = self._rates(last, status)
+            if rates is None:
+                continue
+            try:
+                self.window[entity].append(rates)
+            except KeyError:
+                self.window[entity] = deque([rates], maxlen=self.size)
+        for entity in set(self.window.keys()) - set(endpoint.konwn_database.keys()):
+            self.remove(entity)
+        endpoint._update_qps()
+
+    def remove(self, entity):
+        self.last.pop(entity, None)
+        self.window.pop(entity, None)
+
+    def current(self, entity):
+        """last rates of entity"""
+        window = self.window.get(entity)
+        return window[-1] if window else None
+
+    def samples(self, entity, limit=None):
+        """rates of entity, oldest first"""
+        samples = list(self.window.get(entity, []))
+        return samples[-limit:] if limit else samples
+
+    def average(self, entity, name='Questions'):
+        """average rate of entity in window"""
+        samples = [rates[name] for rates in self.window.get(entity, []) if name in rates]
+        return sum(samples) / len(samples) if samples else 0.0
+
+    def qps(self):
+        """average qps of all entitys"""
+        return sum([self.average(entity) for entity in self.window.keys()])
+
+
+class SlowLogMonitor(IntervalLoopinTask):
+    """tail slow log of running entitys into digest"""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        interval = CONF[common.DB].slowlog_interval
+        super(SlowLogMonitor, self).__init__(periodic_interval=interval,
+                                             initial_delay=interval - time.time() % interval,
+                                             stop_on_exception=False)
+
+    def __call__(self, *args, **kwargs):
+        endpoint = self.endpoint
+        for entity in endpoint.konwn_database.keys():
+            dbinfo = endpoint.konwn_database.get(entity)
+            if not dbinfo:
+                continue
+            if not endpoint._entity_process(entity):
+                continue
+            dbtype = dbinfo.get('dbtype')
+            try:
+                digest = utils.impl_cls('rpc', dbtype).slowlog_digest(endpoint._db_conf(entity, dbtype))
+                if digest:
+                    digest.tail()
+            except Exception as e:
+                LOG.warning('Digest slow log of entity %d fail with %s' % (entity, e.__class__.__name__))
@@ -0,0 +1,198 @@
+import os
+import time
+import eventlet
+import psutil
+from collections import deque
+from eventlet import tpool
+
+from simpleutil.config import cfg
+from simpleutil.log import log as logging
+
+from gopdb import common
+
+CONF = cfg.CONF
+
+LOG = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+# big file truncated step by step before unlink, avoid long io stall
+TRUNCATESTEP = 256 * MB
+
+
+def _thread_id():
+    """id of current native thread, None means unknown"""
+    try:
+        return int(os.readlink('/proc/thread-self').split('/')[-1])
+    except (OSError, ValueError):
+        return None
+
+
+class TrashItem(object):
+
+    def __init__(self, entity, path):
+        self.entity = entity
+        self.path = path
+        self.ctime = int(time.time())
+        self.size = None
+        self.reclaimed = 0
+        self.start = None
+        self.used = 0.0
+
+    def info(self):
+        return dict(entity=self.entity, path=self.path, ctime=self.ctime,
+                    size=self.size, reclaimed=self.reclaimed,
+                    seconds=round(self.used, 3))
+
+
+class TrashReaper(object):
+    """
+    deleted entity home renamed into trash path at once,
+    files removed in native thread with io rate limit and idle io priority
+    """
+
+    def __init__(self, trash, homes):
+        self.trash = trash
+        # items not in trash can not be resumed, trash must be renamed into
+        if not os.path.exists(trash):
+            os.makedirs(trash, 0o755)
+        if os.path.exists(homes) and os.stat(trash).st_dev != os.stat(homes).st_dev:
+            raise ValueError('Trash path %s not in same file system of entity homes %s' % (trash, homes))
+        self.items = deque()
+        self.current = None
+        self.running = False
+        self.reclaimed = 0
+        self.count = 0
+        # called after each item reclaimed
+        self.notify = None
+
+    def throw(self, entity, home):
+        """move entity home into trash, return path in trash or home removed inline"""
+        if not os.path.exists(self.trash):
+            os.makedirs(self.trash, 0o755)
+        path = os.path.join(self.trash, '%d-%d' % (entity, int(time.time())))
+        try:
+            os.rename(home, path)
+        except OSError as e:
+            # item out of trash can not be resumed after restart, remove inline
+            LOG.warning('Move %s into trash fail with %s, remove inline' % (home, e.strerror))
+            item = TrashItem(entity, home)
+            tpool.execute(self._reclaim, item)
+            self.count += 1
+            LOG.info('Reclaim %s success, %d bytes used %1.3f seconds' % (home, item.reclaimed, item.used))
+            return home
+        self.items.append(TrashItem(entity, path))
+        LOG.info('Entity %d home %s thrown into trash' % (entity, path))
+        self._spawn()
+        return path
+
+    def resume(self):
+        """reclaim items left in trash by last run"""
+        if not os.path.exists(self.trash):
+            return
+        for name in sorted(os.listdir(self.trash)):
+            try:
+                entity = int(name.split('-')[0])
+            except ValueError:
+                entity = None
+            self.items.append(TrashItem(entity, os.path.join(self.trash, name)))
+        if self.items:
+            LOG.info('%d items left in trash, resume reclaim' % len(self.items))
+            self._spawn()
+
+    def _spawn(self):
+        if not self.running:
+            self.running = True
+            eventlet.spawn_n(self._loop)
+
+    def _loop(self):
+        try:
+            while self.items:
+                item = self.items.popleft()
+                self.current = item
+                try:
+                    tpool.execute(self._reclaim, item)
+                except Exception:
+                    LOG.exception('Reclaim %s fail' % item.path)
+                else:
+                    self.count += 1
+                    LOG.info('Reclaim %s success, %d bytes used %1.3f seconds' %
+                             (item.path, item.reclaimed, item.used))
+                finally:
+                    self.current = None
+                if self.notify:
+                    try:
+                        self.notify()
+                    except Exception:
+                        LOG.exception('Notify reclaim fail')
+        finally:
+            self.running = False
+
+    def _throttle(self, item, size):
+        """run in native thread, sleep when io rate over limit"""
+        item.reclaimed += size
+        self.reclaimed += size
+        rate = CONF[common.DB].reclaim_rate * MB
+        if not rate:
+            return
+        delay = item.reclaimed / float(rate) - (time.time() - item.start)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _remove(self, item, path):
+        size = os.lstat(path).st_size
+        if size > TRUNCATESTEP and not os.path.islink(path):
+            with open(path, 'r+b') as f:
+                while size > TRUNCATESTEP:
+                    size -= TRUNCATESTEP
+                    os.ftruncate(f.fileno(), size)
+                    self._throttle(item, TRUNCATESTEP)
+        os.unlink(path)
+        self._throttle(item, size)
+
+    def _reclaim(self, item):
+        """run in native thread"""
+        item.start = time.time()
+        tid = _thread_id()
+        p = None
+        ionice = None
+        if tid:
+            try:
+                p = psutil.Process(tid)
+                ionice = p.ionice()
+                p.ionice(psutil.IOPRIO_CLASS_IDLE)
+            except (psutil.Error, AttributeError, ValueError):
+                p = None
+        try:
+            if item.size is None:
+                item.size = 0
+                for root, dirs, files in os.walk(item.path):
+                    for name in files:
+                        item.size += os.lstat(os.path.join(root, name)).st_size
+            for root, dirs, files in os.walk(item.path, topdown=False):
+                for name in files:
+                    self._remove(item, os.path.join(root, name))
+                for name in dirs:
+                    path = os.path.join(root, name)
+                    if os.path.islink(path):
+                        os.unlink(path)
+                    else:
+                        os.rmdir(path)
+            os.rmdir(item.path)
+        finally:
+            item.used = time.time() - item.start
+            if p is not None:
+                # thread of tpool reused by others, do not log in native thread
+                try:
+                    p.ionice(ionice.ioclass, ionice.value)
+                except (psutil.Error, ValueError):
+                    pass
+
+    def stats(self):
+        items = list(self.items)
+        if self.current:
+            items.insert(0, self.current)
+        return dict(trash=self.trash, running=self.running,
+                    reclaimed=self.reclaimed, count=self.count,
+                    pending=sum([item.size or 0 for item in items]) -
+                    (self.current.reclaimed if self.current else 0),
+                    items=[item.info() for item in items])
@@ -0,0 +1,128 @@
+import time
+from collections import OrderedDict
+
+import six
+
+from simpleutil.config import cfg
+from simpleutil.log import log as logging
+
+from simpleservice.ormdb.api import model_query
+
+from gopdb import common
+from gopdb.models import GopDatabase
+
+CONF = cfg.CONF
+
+LOG = logging.getLogger(__name__)
+
+
+class AddressCache(object):
+    """process-wide database address cache with ttl"""
+
+    def __init__(self):
+        # database_id -> (address, expire time)
+        self.addresses = {}
+        self.hit = 0
+        self.miss = 0
+
+    @property
+    def ttl(self):
+        return CONF[common.DB].address_cache_ttl
+
+    def gets(self, database_ids):
+        """return cached address map and database ids not cached"""
+        now = time.time()
+        maps = {}
+        missed = []
+        for database_id in database_ids:
+            try:
+                address, expire = self.addresses[database_id]
+            except KeyError:
+                missed.append(database_id)
+                continue
+            if expire < now:
+                self.addresses.pop(database_id, None)
+                missed.append(database_id)
+            else:
+                maps[database_id] = address
+        self.hit += len(maps)
+        self.miss += len(missed)
+        return maps, missed
+
+    def get(self, database_id):
+        maps, missed = self.gets([database_id, ])
+        return maps.get(database_id)
+
+    def update(self, maps):
+        ttl = self.ttl
+        if ttl <= 0:
+            return
+        expire = time.time() + ttl
+        for database_id, address in six.iteritems(maps):
+            # address of offline database will not be cached
+            if address.get('host') in (None, 'unkonwn') or (address.get('port') or -1) <= 0:
+                continue
+            self.addresses[database_id] = (dict(host=address.get('host'),
+                                                port=address.get('port')), expire)
+
+    def invalidate(self, *database_ids):
+        for database_id in database_ids:
+            if self.addresses.pop(database_id, None):
+                LOG.debug('Address cache of database %d invalidated' % database_id)
+
+    def clear(self):
+        self.addresses.clear()
+
+    def stats(self):
+        return dict(size=len(self.addresses), ttl=self.ttl,
+                    hit=self.hit, miss=self.miss)
+
+
+class ImplIndex(object):
+    """lru bounded index of database_id -> impl"""
+
+    def __init__(self):
+        self.impls = OrderedDict()
+        self.hit = 0
+        self.miss = 0
+
+    @property
+    def size(self):
+        return CONF[common.DB].impl_cache_size
+
+    def get(self, database_id):
+        try:
+            impl = self.impls.pop(database_id)
+        except KeyError:
+            self.miss += 1
+            return None
+        # move to the newest end
+        self.impls[database_id] = impl
+        self.hit += 1
+        return impl
+
+    def set(self, database_id, impl):
+        self.impls.pop(database_id, None)
+        self.impls[database_id] = impl
+        size = self.size
+        while len(self.impls) > size:
+            self.impls.popitem(last=False)
+
+    def invalidate(self, database_id):
+        self.impls.pop(database_id, None)
+
+    def prewarm(self, session):
+        """load newest databases impl with one query"""
+        query = model_query(session, (GopDatabase.database_id, GopDatabase.impl))
+        query = query.order_by(GopDatabase.database_id.desc()).limit(self.size)
+        for r in reversed(query.all()):
+            self.set(r[0], r[1])
+        LOG.info('Database impl index prewarm with %d databases' % len(self.impls))
+
+    def stats(self):
+        return dict(size=len(self.impls), limit=self.size,
+                    hit=self.hit, miss=self.miss)
+
+
+ADDRESSCACHE = AddressCache()
+IMPLINDEX = ImplIndex()
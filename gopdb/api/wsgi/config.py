@@ -3,7 +3,23 @@ from simpleservice.ormdb.config import database_opts
 
 CONF = cfg.CONF
 
+wsgi_opts = [
+    cfg.IntOpt('address_cache_ttl',
+               default=300,
+               min=0,
+               help='Seconds of database address cached in wsgi process, 0 means disable'),
+    cfg.IntOpt('impl_cache_size',
+               default=50000,
+               min=100,
+               help='Max database impl index size cached in wsgi process'),
+    cfg.IntOpt('job_sweep_interval',
+               default=60,
+               min=10,
+               help='Seconds between two sweeps, expired running jobs set fail by sweep'),
+]
+
 
 def register_opts(group):
     # database for gopdb
-    CONF.register_opts(database_opts, group)
\ No newline at end of file
+    CONF.register_opts(database_opts, group)
+    CONF.register_opts(wsgi_opts, group)
\ No newline at end of file
@@ -12,7 +12,9 @@ from simpleutil.log import log as logging
 from simpleutil.utils import argutils
 from simpleutil.utils import jsonutils
 from simpleutil.utils import singleton
+from simpleutil.utils import strutils
 
+from simpleservice.ormdb.api import model_count_with_key
 from simpleservice.ormdb.api import model_query
 from simpleservice.rpc.exceptions import AMQPDestinationNotFound
 from simpleservice.rpc.exceptions import MessagingTimeout
@@ -31,9 +33,15 @@ from gopdb import common
 from gopdb import utils
 from gopdb.api import endpoint_session
 from gopdb.api import exceptions
+from gopdb.api.wsgi.cache import ADDRESSCACHE
+from gopdb.api.wsgi.cache import IMPLINDEX
 from gopdb.api.wsgi.impl import _address
 from gopdb.api.wsgi.impl import _impl
+from gopdb.api.wsgi.impl import show_databases
+from gopdb.api.wsgi import jobs
 from gopdb.models import GopDatabase
+from gopdb.models import GopJob
+from gopdb.models import GopSalveRelation
 from gopdb.models import GopSchema
 from gopdb.models import SchemaQuote
 
@@ -62,6 +70,26 @@ entity_controller = EntityReuest()
 endpoint_controller = EndpointReuest()
 cache_controller = CacheReuest()
 
+# 游标分页默认与最大单页数量
+CURSORLIMIT = 200
+MAXCURSORLIMIT = 2000
+
+
+def cursor_results(session, columns, key, after, limit=None,
+                   filter=None, count=False):
+    """seek on primary key instead of offset, total counted only when asked"""
+    limit = min(int(limit or CURSORLIMIT), MAXCURSORLIMIT)
+    query = model_query(session, tuple(columns), filter=filter)
+    query = query.filter(key > after).order_by(key).limit(limit)
+    names = [column.key for column in columns]
+    data = [dict(zip(names, row)) for row in query]
+    results = resultutils.results(result='list success', data=data)
+    if count:
+        results['total'] = model_count_with_key(session, key, filter=filter)
+    # 下一页游标, None表示已到最后一页
+    results['after'] = data[-1][key.key] if len(data) >= limit else None
+    return results
+
 
 @singleton.singleton
 class DatabaseReuest(BaseContorller):
@@ -93,6 +121,7 @@ class DatabaseReuest(BaseContorller):
             'file': {'type': 'string', 'minLength': 5, 'description': '主库binlog 文件名'},
             'position': {'type': 'integer', 'minimum': 1, 'description': '主库binlog 位置'},
             'force': {'type': 'boolean', 'description': '强制绑定, 忽略slave检查'},
+            'async': {'type': 'boolean', 'description': '异步执行, 返回任务ID'},
             'schemas': {'type': 'array', 'description': '主数据库scheam列表',
                         'items': {'type': 'string', 'minLength': 1, 'description': '主数据库scheam名'}},
         }
@@ -116,6 +145,7 @@ class DatabaseReuest(BaseContorller):
             'slave': {'type': 'integer', 'minimum': 1, 'description': '从库ID'},
             'file': {'type': 'string', 'minLength': 5, 'description': '主库binlog 文件名,主库无内容时可不填写'},
             'position': {'type': 'integer', 'minimum': 1, 'description': '主库binlog 位置,主库无内容时可不填写'},
+            'async': {'type': 'boolean', 'description': '异步执行, 返回任务ID'},
         }
     }
 
@@ -125,9 +155,72 @@ class DatabaseReuest(BaseContorller):
         'properties': {
             'slave': {'type': 'integer', 'minimum': 1, 'description': '从库ID'},
             'force': {'type': 'boolean', 'description': '忽略主从同步检查直接设置为ready'},
+            'max_eta': {'type': 'integer', 'minimum': 0,
+                        'description': '从库预计追上主库的秒数超过此值时不设置为ready'},
+            'async': {'type': 'boolean', 'description': '异步执行, 返回任务ID'},
+        }
+    }
+
+    DUMPDATABASE = {
+        'type': 'object',
+        'properties': {
+            'name': {'type': 'string', 'pattern': '^[a-zA-Z0-9_-]+$', 'maxLength': 64,
+                     'description': '备份名, 默认为时间'},
+            'schemas': {'type': 'array', 'minItems': 1, 'description': '需要备份的scheam列表, 默认全部',
+                        'items': {'type': 'string', 'minLength': 1, 'description': '数据库scheam名'}},
+            'workers': {'type': 'integer', 'minimum': 1, 'maximum': 32, 'description': '并发导出数量'},
+            'timeout': {'type': 'integer', 'minimum': 60, 'maximum': 86400, 'description': '备份超时时间'},
+        }
+    }
+
+    RESTOREDATABASE = {
+        'type': 'object',
+        'required': ['name', 'auth'],
+        'properties': {
+            'name': {'type': 'string', 'pattern': '^[a-zA-Z0-9_-]+$', 'maxLength': 64,
+                     'description': '备份名'},
+            'source': {'type': 'integer', 'minimum': 1,
+                       'description': '备份所在数据库ID, 默认为当前数据库, 必须与当前数据库在同一agent'},
+            'auth': {'type': 'object',
+                     'required': ['user', 'passwd', 'ro_user', 'ro_passwd'],
+                     'properties': {'user': {'type': 'string'},
+                                    'passwd': {'type': 'string'},
+                                    'ro_user': {'type': 'string'},
+                                    'ro_passwd': {'type': 'string'},
+                                    'source': {'type': 'string'},
+                                    'rosource': {'type': 'string'}},
+                     'description': '恢复出的schema使用的账号'},
+            'schemas': {'type': 'array', 'minItems': 1, 'description': '需要恢复的scheam列表, 默认全部',
+                        'items': {'type': 'string', 'minLength': 1, 'description': '数据库scheam名'}},
+            'workers': {'type': 'integer', 'minimum': 1, 'maximum': 32, 'description': '并发导入数量'},
+            'timeout': {'type': 'integer', 'minimum': 60, 'maximum': 86400, 'description': '恢复超时时间'},
         }
     }
 
+    APPLYCONFIG = {
+        'type': 'object',
+        'required': ['configs'],
+        'properties': {
+            'configs': {'type': 'object', 'minProperties': 1,
+                        'additionalProperties': {'type': ['string', 'integer', 'number', 'boolean']},
+                        'description': '需要修改的数据库配置, 动态参数立即生效, 静态参数重启后生效'},
+        }
+    }
+
+    SHOWDATABASES = {
+        'type': 'object',
+        'required': ['ids'],
+        'properties': {
+            'ids': {'type': ['string', 'integer', 'array'], 'minLength': 1, 'minItems': 1,
+                    'items': {'type': ['string', 'integer']},
+                    'description': '数据库ID列表, 字符串时以逗号分隔'},
+        }
+    }
+
+    # 批量show数据库数量上限
+    SHOWSLIMIT = 1000
+    SLOWLOGORDERS = ('total', 'count', 'avg', 'p95', 'max', 'rows_examined')
+
     def reflect(self, req, impl, body=None):
         body = body or {}
         kwargs = dict(req=req)
@@ -153,11 +246,18 @@ class DatabaseReuest(BaseContorller):
         dbresult = dbmanager.select_agents(dbtype, **kwargs)
         return resultutils.results(result='select database agents success', data=dbresult)
 
+    def caches(self, req, body=None):
+        """wsgi process cache status"""
+        return resultutils.results(result='get cache status success',
+                                   data=[dict(address=ADDRESSCACHE.stats(),
+                                              impl=IMPLINDEX.stats())])
+
     def index(self, req, body=None):
         body = body or {}
         order = body.pop('order', None)
         desc = body.pop('desc', False)
         page_num = int(body.pop('page_num', 0))
+        after = body.pop('after', None)
 
         slaves = body.pop('slaves', False)
         # schemas = body.pop('schemas', False)
@@ -178,6 +278,26 @@ class DatabaseReuest(BaseContorller):
                  GopDatabase.affinity,
                  GopDatabase.desc]
 
+        if after is not None:
+            # 游标模式
+            results = cursor_results(session, columns=columns,
+                                     key=GopDatabase.database_id,
+                                     after=int(after), limit=body.pop('limit', None),
+                                     filter=_filter, count=strutils.bool_from_string(body.pop('count', False)))
+            if slaves:
+                relations = {}
+                for column in results['data']:
+                    column['slaves'] = relations.setdefault(column.get('database_id'), [])
+                if relations:
+                    query = model_query(session, GopSalveRelation,
+                                        filter=GopSalveRelation.master_id.in_(relations.keys()))
+                    for slave in query:
+                        relations[slave.master_id].append(dict(slave_id=slave.slave_id,
+                                                               master_id=slave.master_id,
+                                                               readonly=slave.readonly,
+                                                               ready=slave.ready))
+            return results
+
         option = None
         if slaves:
             columns.append(GopDatabase.slaves)
@@ -229,6 +349,22 @@ class DatabaseReuest(BaseContorller):
         dbresult = dbmanager.show_database(database_id, **kwargs)
         return resultutils.results(result='show database success', data=[dbresult, ])
 
+    def shows(self, req, body=None):
+        """show many databases info in one request"""
+        body = body or {}
+        jsonutils.schema_validate(body, self.SHOWDATABASES)
+        try:
+            database_ids = argutils.map_to_int(body.pop('ids'))
+        except (TypeError, ValueError):
+            raise InvalidArgument('Database ids not integer')
+        if not database_ids:
+            raise InvalidArgument('No database id found')
+        if len(database_ids) > self.SHOWSLIMIT:
+            raise InvalidArgument('Database ids over %d' % self.SHOWSLIMIT)
+        quotes = body.pop('quotes', False)
+        dbresults = show_databases(database_ids, quotes=quotes)
+        return resultutils.results(result='show databases success', data=dbresults)
+
     def update(self, req, database_id, body=None):
         body = body or {}
         status = body.get('status', common.UNACTIVE)
@@ -283,6 +419,103 @@ class DatabaseReuest(BaseContorller):
         dbresult = dbmanager.status_database(database_id, **kwargs)
         return resultutils.results(result='status database success', data=[dbresult, ])
 
+    def statuses(self, req, body=None):
+        """status of all(or listed) databases, one rpc call for each agent"""
+        body = body or {}
+        impl = body.pop('impl', 'local')
+        database_ids = body.pop('ids', None)
+        if database_ids:
+            database_ids = argutils.map_to_int(database_ids)
+        kwargs = dict(req=req)
+        kwargs.update(body)
+        dbmanager = utils.impl_cls('wsgi', impl)
+        dbresults = dbmanager.status_databases(database_ids, **kwargs)
+        return resultutils.results(result='status databases success', data=dbresults)
+
+    def config(self, req, database_id, body=None):
+        """database config and options need restart"""
+        body = body or {}
+        database_id = int(database_id)
+        kwargs = dict(req=req)
+        kwargs.update(body)
+        dbmanager = _impl(database_id)
+        dbresult = dbmanager.config_database(database_id, **kwargs)
+        return resultutils.results(result='show database config success', data=[dbresult, ])
+
+    def apply(self, req, database_id, body=None):
+        """apply database config without restart"""
+        body = body or {}
+        jsonutils.schema_validate(body, self.APPLYCONFIG)
+        database_id = int(database_id)
+        configs = body.pop('configs')
+        kwargs = dict(req=req)
+        kwargs.update(body)
+        dbmanager = _impl(database_id)
+        dbresult = dbmanager.apply_config(database_id, configs, **kwargs)
+        return resultutils.results(result='apply database config success', data=[dbresult, ])
+
+    def replication(self, req, database_id, body=None):
+        """replication state(or history) of slave database"""
+        body = body or {}
+        database_id = int(database_id)
+        kwargs = dict(req=req)
+        kwargs['history'] = body.pop('history', False)
+        kwargs['channel'] = body.pop('channel', None)
+        limit = body.pop('limit', None)
+        kwargs['limit'] = int(limit) if limit else None
+        dbmanager = _impl(database_id)
+        dbresult = dbmanager.replication_database(database_id, **kwargs)
+        return resultutils.results(result='get database replication success', data=[dbresult, ])
+
+    def performance(self, req, database_id, body=None):
+        """global status rates(qps, rows, bytes) of database"""
+        body = body or {}
+        database_id = int(database_id)
+        kwargs = dict(req=req)
+        kwargs['history'] = body.pop('history', False)
+        limit = body.pop('limit', None)
+        kwargs['limit'] = int(limit) if limit else None
+        dbmanager = _impl(database_id)
+        dbresult = dbmanager.performance_database(database_id, **kwargs)
+        return resultutils.results(result='get database performance success', data=[dbresult, ])
+
+    def slowlog(self, req, database_id, body=None):
+        """top query fingerprints in slow log of database"""
+        body = body or {}
+        database_id = int(database_id)
+        kwargs = dict(req=req)
+        order = body.pop('order', 'total')
+        if order not in self.SLOWLOGORDERS:
+            raise InvalidArgument('Slow log order value error')
+        kwargs['order'] = order
+        kwargs['limit'] = min(int(body.pop('limit', 10)), 100)
+        kwargs['schema'] = body.pop('schema', None)
+        dbmanager = _impl(database_id)
+        dbresult = dbmanager.slowlog_database(database_id, **kwargs)
+        return resultutils.results(result='get database slow log success', data=[dbresult, ])
+
+    def dump(self, req, database_id, body=None):
+        """dump database data on agent, return job id"""
+        body = body or {}
+        jsonutils.schema_validate(body, self.DUMPDATABASE)
+        database_id = int(database_id)
+        kwargs = dict(req=req)
+        kwargs.update(body)
+        dbmanager = _impl(database_id)
+        dbresult = dbmanager.dump_database(database_id, **kwargs)
+        return resultutils.results(result='dump database job dispatched', data=[dbresult, ])
+
+    def restore(self, req, database_id, body=None):
+        """restore dump into database on agent, return job id"""
+        body = body or {}
+        jsonutils.schema_validate(body, self.RESTOREDATABASE)
+        database_id = int(database_id)
+        kwargs = dict(req=req)
+        kwargs.update(body)
+        dbmanager = _impl(database_id)
+        dbresult = dbmanager.restore_database(database_id, **kwargs)
+        return resultutils.results(result='restore database job dispatched', data=[dbresult, ])
+
     def bond(self, req, database_id, body=None):
         """slave bond master"""
         body = body or {}
@@ -381,6 +614,23 @@ class SchemaReuest(BaseContorller):
                         }
                     }
 
+    BULKQUOTES = {
+        'type': 'object',
+        'required': ['endpoint', 'entitys'],
+        'properties': {
+            'endpoint': {'type': 'string', 'minLength': 1, 'description': '引用方endpoint'},
+            'entitys': {'type': 'array', 'minItems': 1, 'maxItems': 20000,
+                        'items': {'type': 'integer', 'minimum': 1}, 'description': '引用方entity列表'},
+            'marker': {'type': 'integer', 'minimum': 0, 'description': '上一页返回的marker'},
+            'limit': {'type': 'integer', 'minimum': 1, 'maximum': 5000, 'description': '单页entity数量'},
+        }
+    }
+
+    # bulk接口单页entity数量
+    BULKLIMIT = 1000
+    # bulk接口单次in查询entity数量
+    BULKCHUNK = 200
+
     SCHEMAREG = re.compile('^[a-z][a-z0-9_]+$', re.IGNORECASE)
 
     def _validate_schema(self, schema):
@@ -393,17 +643,25 @@ class SchemaReuest(BaseContorller):
         order = body.pop('order', None)
         desc = body.pop('desc', False)
         page_num = int(body.pop('page_num', 0))
+        after = body.pop('after', None)
 
         session = endpoint_session(readonly=True)
+        columns = [GopSchema.schema_id,
+                   GopSchema.schema,
+                   GopSchema.database_id,
+                   GopSchema.character_set,
+                   GopSchema.collation_type,
+                   ]
+        if after is not None:
+            # 游标模式
+            return cursor_results(session, columns=columns,
+                                  key=GopSchema.schema_id,
+                                  after=int(after), limit=body.pop('limit', None),
+                                  filter=GopSchema.database_id == database_id,
+                                  count=strutils.bool_from_string(body.pop('count', False)))
         results = resultutils.bulk_results(session,
                                            model=GopSchema,
-                                           columns=[GopSchema.schema_id,
-                                                    GopSchema.schema,
-                                                    GopSchema.database_id,
-                                                    GopSchema.schema,
-                                                    GopSchema.character_set,
-                                                    GopSchema.collation_type,
-                                                    ],
+                                           columns=columns,
                                            counter=GopSchema.schema_id,
                                            order=order, desc=desc,
                                            filter=GopSchema.database_id == database_id,
@@ -607,13 +865,8 @@ class SchemaReuest(BaseContorller):
                                              dbversion=database.dbversion))
         return resultutils.results(result='get quote success', data=[data, ])
 
-    def quotes(self, req, body=None):
-        body = body or {}
-        session = endpoint_session(readonly=True)
-        endpoint = body.pop('endpoint')
-        entitys = argutils.map_to_int(body.pop('entitys'))
-        if len(entitys) > 5:
-            raise InvalidArgument('This api can not get entitys more then 5')
+    @staticmethod
+    def _quotes(session, endpoint, entitys):
         query = session.query(SchemaQuote.quote_id,
                               SchemaQuote.schema_id,
                               SchemaQuote.qdatabase_id,
@@ -631,13 +884,12 @@ class SchemaReuest(BaseContorller):
         query = query.filter(and_(SchemaQuote.endpoint == endpoint,
                                   SchemaQuote.entity.in_(entitys)))
         quotes = []
-        database_ids = set()
         for quote in query:
-            database_ids.add(quote.qdatabase_id)
             quotes.append(dict(quote_id=quote.quote_id,
                                schema_id=quote.schema_id,
                                qdatabase_id=quote.qdatabase_id,
                                database_id=quote.database_id,
+                               entity=quote.entity,
                                schema=quote.schema,
                                user=quote.user,
                                passwd=quote.passwd,
@@ -645,9 +897,90 @@ class SchemaReuest(BaseContorller):
                                ro_passwd=quote.ro_passwd,
                                character_set=quote.character_set,
                                collation_type=quote.collation_type))
+        return quotes
+
+    def quotes(self, req, body=None):
+        body = body or {}
+        session = endpoint_session(readonly=True)
+        endpoint = body.pop('endpoint')
+        entitys = argutils.map_to_int(body.pop('entitys'))
+        if len(entitys) > 5:
+            raise InvalidArgument('This api can not get entitys more then 5')
+        quotes = self._quotes(session, endpoint, entitys)
         # get all address
-        alladdress = _address(database_ids)
+        alladdress = _address(set([quote.get('qdatabase_id') for quote in quotes]))
         for quote in quotes:
             quote.update(alladdress[quote.get('qdatabase_id')])
 
         return resultutils.results(result='list quotes success', data=quotes)
+
+    def bulk(self, req, body=None):
+        """list quotes of a large number of entitys"""
+        body = body or {}
+        jsonutils.schema_validate(body, self.BULKQUOTES)
+        endpoint = body.pop('endpoint')
+        marker = body.pop('marker', 0)
+        limit = body.pop('limit', self.BULKLIMIT)
+        entitys = sorted(set([entity for entity in body.pop('entitys') if entity > marker]))
+        # 超过单页数量, 返回下一页的起始标记
+        marker = entitys[limit - 1] if len(entitys) > limit else None
+        entitys = entitys[:limit]
+        session = endpoint_session(readonly=True)
+        quotes = []
+        # 分段in查询, 避免单条sql过长
+        for index in range(0, len(entitys), self.BULKCHUNK):
+            quotes.extend(self._quotes(session, endpoint, entitys[index:index + self.BULKCHUNK]))
+        # 所有数据库地址只查询一次
+        alladdress = _address(set([quote.get('qdatabase_id') for quote in quotes]))
+        for quote in quotes:
+            quote.update(alladdress.get(quote.get('qdatabase_id'), dict(host=None, port=None)))
+        results = resultutils.results(result='list quotes success', data=quotes)
+        results.setdefault('marker', marker)
+        return results
+
+
+@singleton.singleton
+class JobReuest(BaseContorller):
+
+    JOBRESULT = {
+        'type': 'object',
+        'required': ['token'],
+        'properties': {
+            'token': {'type': 'string', 'description': '任务token, 只有收到任务的agent知道'},
+            'resultcode': {'type': 'integer', 'description': 'agent执行结果码'},
+            'result': {'type': 'string', 'description': 'agent执行结果'},
+            'progress': {'type': 'boolean', 'description': '任务进度报告, 任务未结束'},
+        }
+    }
+
+    # 等待任务结束的最大秒数
+    MAXWAIT = 60
+
+    def __init__(self):
+        super(JobReuest, self).__init__()
+        # 未报告结果的过期任务由清理协程设置为失败
+        jobs.start_sweeper()
+
+    def show(self, req, job_id, body=None):
+        body = body or {}
+        job_id = int(job_id)
+        wait = min(int(body.get('wait', 0)), self.MAXWAIT)
+        if wait > 0:
+            jobinfo = jobs.wait_job(job_id, wait)
+        else:
+            session = endpoint_session(readonly=True)
+            jobinfo = jobs.job_info(model_query(session, GopJob, filter=GopJob.job_id == job_id).one())
+        return resultutils.results(result='show job success', data=[jobinfo, ])
+
+    def update(self, req, job_id, body=None):
+        """agent report job result"""
+        body = body or {}
+        jsonutils.schema_validate(body, self.JOBRESULT)
+        job_id = int(job_id)
+        if body.get('progress'):
+            jobinfo = jobs.progress_job(job_id, body.get('token'), body.get('result'))
+            return resultutils.results(result='update job progress success', data=[jobinfo, ])
+        if body.get('resultcode') is None:
+            raise InvalidArgument('Job result code missed')
+        jobinfo = jobs.finish_job(job_id, body.get('token'), body.get('resultcode'), body.get('result'))
+        return resultutils.results(result='update job success', data=[jobinfo, ])
@@ -8,6 +8,8 @@ from gopdb import privilegeutils
 from gopdb import utils
 from gopdb.api import endpoint_session
 from gopdb.api import exceptions
+from gopdb.api.wsgi.cache import ADDRESSCACHE
+from gopdb.api.wsgi.cache import IMPLINDEX
 from gopdb.models import GopDatabase
 from gopdb.models import GopSalveRelation
 from gopdb.models import GopSchema
@@ -18,37 +20,46 @@ from simpleutil.common.exceptions import InvalidArgument
 from simpleutil.log import log as logging
 from simpleutil.utils import argutils
 from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import subqueryload
+from sqlalchemy.orm import undefer
 from sqlalchemy.sql import and_
 from sqlalchemy.sql import or_
 
 LOG = logging.getLogger(__name__)
 
+# impl name -> database manager
 MANAGERCACHE = {}
 
-def _impl(database_id):
+
+def _manager(impl):
     try:
-        return MANAGERCACHE[database_id]
+        return MANAGERCACHE[impl]
     except KeyError:
+        return MANAGERCACHE.setdefault(impl, utils.impl_cls('wsgi', impl))
+
+
+def _impl(database_id):
+    impl = IMPLINDEX.get(database_id)
+    if impl is None:
         session = endpoint_session(readonly=True)
         try:
-            database = model_query(session, GopDatabase, GopDatabase.database_id == database_id).one()
-            if database_id not in MANAGERCACHE:
-                dbmanager = utils.impl_cls('wsgi', database.impl)
-                MANAGERCACHE.setdefault(database_id, dbmanager)
-            return MANAGERCACHE[database_id]
+            impl = model_query(session, GopDatabase.impl, GopDatabase.database_id == database_id).one()[0]
         finally:
             session.close()
+        IMPLINDEX.set(database_id, impl)
+    return _manager(impl)
 
 
 def _address(database_ids):
     IMPLMAP = {}
     NOT_CACHED = []
     for database_id in database_ids:
-        if database_id in MANAGERCACHE:
+        impl = IMPLINDEX.get(database_id)
+        if impl:
             try:
-                IMPLMAP[MANAGERCACHE[database_id]].append(database_id)
+                IMPLMAP[impl].append(database_id)
             except KeyError:
-                IMPLMAP[MANAGERCACHE[database_id]] = [database_id, ]
+                IMPLMAP[impl] = [database_id, ]
         else:
             NOT_CACHED.append(database_id)
     if NOT_CACHED:
@@ -56,18 +67,112 @@ def _address(database_ids):
         query = model_query(session, (GopDatabase.database_id, GopDatabase.impl),
                             filter=GopDatabase.database_id.in_(NOT_CACHED))
         for r in query:
-            dbmanager = utils.impl_cls('wsgi', r[1])
+            IMPLINDEX.set(r[0], r[1])
             try:
-                IMPLMAP[dbmanager].append(r[0])
+                IMPLMAP[r[1]].append(r[0])
             except KeyError:
-                IMPLMAP[dbmanager] = [r[0], ]
+                IMPLMAP[r[1]] = [r[0], ]
         session.close()
     maps = dict()
-    for dbmanager in IMPLMAP:
-        maps.update(dbmanager.address(IMPLMAP[dbmanager]))
+    for impl in IMPLMAP:
+        maps.update(_manager(impl).address(IMPLMAP[impl]))
     return maps
 
 
+def _database_result(database, schemas, master_ids, quotes=False):
+    """build show database result without address"""
+    if quotes:
+        quotes = [dict(entity=quote.entity,
+                       endpoint=quote.endpoint,
+                       quote_id=quote.quote_id,
+                       schema_id=quote.schema_id)
+                  for quote in database.quotes]
+    else:
+        quotes = []
+
+    _result = dict(database_id=database.database_id,
+                   impl=database.impl,
+                   dbtype=database.dbtype,
+                   dbversion=database.dbversion,
+                   status=database.status,
+                   reflection_id=database.reflection_id,
+                   slave=database.slave,
+                   affinity=database.affinity,
+                   schemas=[dict(schema=schema.schema,
+                                 schema_id=schema.schema_id
+                                 ) for schema in schemas],
+                   quotes=quotes)
+    if database.slave:
+        _result.setdefault('masters', master_ids)
+    else:
+        # show master database slaves
+        _result.setdefault('slaves', database.slaves)
+    return _result
+
+
+def show_databases(database_ids, **kwargs):
+    """show databases info in fixed number of queries"""
+    quotes = kwargs.pop('quotes', False)
+    database_ids = set(database_ids)
+    session = endpoint_session(readonly=True)
+    query = model_query(session, GopDatabase, filter=GopDatabase.database_id.in_(database_ids))
+    query = query.options(subqueryload(GopDatabase.slaves), subqueryload(GopDatabase.schemas))
+    if quotes:
+        query = query.options(subqueryload(GopDatabase.quotes))
+    databases = query.all()
+    # slave database id -> master ids
+    masters = {}
+    slaves = [_database.database_id for _database in databases if _database.slave]
+    if slaves:
+        query = model_query(session, (GopSalveRelation.slave_id, GopSalveRelation.master_id),
+                            filter=GopSalveRelation.slave_id.in_(slaves))
+        for r in query:
+            try:
+                masters[r[0]].append((r[1], ))
+            except KeyError:
+                masters[r[0]] = [(r[1], )]
+    # slave will find masters schemas to show
+    mschemas = {}
+    master_ids = set([m[0] for ms in masters.values() for m in ms])
+    if master_ids:
+        query = model_query(session, GopDatabase,
+                            filter=and_(GopDatabase.database_id.in_(master_ids),
+                                        GopDatabase.slave == 0))
+        query = query.options(subqueryload(GopDatabase.schemas))
+        for m_database in query:
+            mschemas[m_database.database_id] = m_database.schemas
+    alladdress = _address([_database.database_id for _database in databases])
+    results = []
+    for _database in databases:
+        if _database.slave:
+            master_ids = masters.get(_database.database_id, [])
+            schemas = []
+            for m in master_ids:
+                schemas.extend(mschemas.get(m[0], []))
+        else:
+            master_ids = None
+            schemas = _database.schemas
+        _result = _database_result(_database, schemas, master_ids, quotes)
+        address = alladdress.get(_database.database_id, {})
+        _result.setdefault('host', address.get('host'))
+        _result.setdefault('port', address.get('port'))
+        results.append(_result)
+    session.close()
+    return results
+
+
+def prewarm():
+    """prewarm database impl index when wsgi start"""
+    session = endpoint_session(readonly=True)
+    try:
+        IMPLINDEX.prewarm(session)
+    except Exception as e:
+        LOG.warning('Prewarm database impl index fail with %s, '
+                    'index will be loaded lazily' % e.__class__.__name__)
+    finally:
+        session.close()
+
+
 @six.add_metaclass(abc.ABCMeta)
 class DatabaseManagerBase(object):
 
@@ -77,6 +182,7 @@ class DatabaseManagerBase(object):
         databases = set(databases)
         session = endpoint_session(readonly=True)
         query = model_query(session, GopDatabase, filter=GopDatabase.database_id.in_(databases))
+        query = query.options(subqueryload(GopDatabase.slaves))
         databases = query.all()
         slaves = set([slave.slave_id for database in databases for slave in database.slaves])
         address_maps = self.address(slaves)
@@ -104,7 +210,8 @@ class DatabaseManagerBase(object):
                 filters.append(ors[0])
         session = endpoint_session(readonly=True)
         query = model_query(session, GopDatabase, filter=and_(*filters))
-        query = query.options(joinedload(GopDatabase.schemas, innerjoin=False))
+        # 只需要schema数量, 不加载schemas
+        query = query.options(undefer(GopDatabase.schema_count))
         results = self._select_database(session, query, dbtype, **kwargs)
         # 结果按照亲和性从小到大排序
         # 亲和性数值越大,匹配范围越广
@@ -137,14 +244,18 @@ class DatabaseManagerBase(object):
         """impl reflect code"""
 
     def address(self, databases):
-        session = endpoint_session(readonly=True)
-        query = model_query(session, GopDatabase,
-                            filter=GopDatabase.database_id.in_(databases))
-        databases = query.all()
-        maps = dict()
-        for database in databases:
-            maps[database.reflection_id] = database.database_id
-        return self._address(session, maps)
+        maps, missed = ADDRESSCACHE.gets(databases)
+        if missed:
+            session = endpoint_session(readonly=True)
+            query = model_query(session, (GopDatabase.reflection_id, GopDatabase.database_id),
+                                filter=GopDatabase.database_id.in_(missed))
+            dbmaps = dict()
+            for r in query:
+                dbmaps[r[0]] = r[1]
+            address_maps = self._address(session, dbmaps)
+            ADDRESSCACHE.update(address_maps)
+            maps.update(address_maps)
+        return maps
 
     @abc.abstractmethod
     def _address(self, session, dbmaps):
@@ -155,6 +266,10 @@ class DatabaseManagerBase(object):
         session = endpoint_session(readonly=True)
         quotes = kwargs.pop('quotes', False)
         query = model_query(session, GopDatabase, filter=GopDatabase.database_id == database_id)
+        query = query.options(joinedload(GopDatabase.slaves, innerjoin=False),
+                              subqueryload(GopDatabase.schemas))
+        if quotes:
+            query = query.options(subqueryload(GopDatabase.quotes))
         _database = query.one()
         if _database.slave:
             schemas = []
@@ -169,35 +284,10 @@ class DatabaseManagerBase(object):
                 for m_database in query.all():
                     schemas.extend(m_database.schemas)
         else:
+            master_ids = None
             schemas = _database.schemas
 
-        if quotes:
-            quotes = [dict(entity=quote.entity,
-                           endpoint=quote.endpoint,
-                           quote_id=quote.quote_id,
-                           schema_id=quote.schema_id)
-                      for quote in _database.quotes]
-        else:
-            quotes = []
-
-        _result = dict(database_id=database_id,
-                       impl=_database.impl,
-                       dbtype=_database.dbtype,
-                       dbversion=_database.dbversion,
-                       status=_database.status,
-                       reflection_id=_database.reflection_id,
-                       slave=_database.slave,
-                       affinity=_database.affinity,
-                       schemas=[dict(schema=schema.schema,
-                                     schema_id=schema.schema_id
-                                     ) for schema in schemas],
-                       quotes=quotes)
-        if _database.slave:
-            _result.setdefault('masters', master_ids)
-        else:
-            # show master database slaves
-            _result.setdefault('slaves', _database.slaves)
-
+        _result = _database_result(_database, schemas, master_ids, quotes)
         with self._show_database(session, _database, **kwargs) as address:
             host = address[0]
             port = address[1]
@@ -248,6 +338,8 @@ class DatabaseManagerBase(object):
                     relation = GopSalveRelation(master_id=_database.database_id, slave_id=bond.database_id)
                     session.add(relation)
                     session.flush()
+        ADDRESSCACHE.invalidate(_database.database_id)
+        IMPLINDEX.set(_database.database_id, _database.impl)
         self._esure_create(_database, **kwargs)
         _result.setdefault('database_id', _database.database_id)
         return _result
@@ -264,7 +356,8 @@ class DatabaseManagerBase(object):
         session = endpoint_session()
         query = model_query(session, GopDatabase, filter=GopDatabase.database_id == database_id)
         if master:
-            query = query.options(joinedload(GopDatabase.schemas, innerjoin=False))
+            query = query.options(joinedload(GopDatabase.schemas, innerjoin=False),
+                                  subqueryload(GopDatabase.slaves))
         else:
             query = query.options(joinedload(GopDatabase.quotes, innerjoin=False))
 
@@ -298,7 +391,7 @@ class DatabaseManagerBase(object):
                                                       filter=GopSalveRelation.slave_id == database_id).all()]
                 if _masters:
                     masters = model_query(session, GopDatabase, filter=and_(GopDatabase.database_id.in_(_masters),
-                                                                            GopDatabase.slave == 0))
+                                                                            GopDatabase.slave == 0)).all()
                     if len(_masters) != len(masters):
                         raise exceptions.UnAcceptableDbError('Target slave database master missed')
                     raise exceptions.AcceptableDbError('Slave is bond to masters, unbond before delete')
@@ -309,6 +402,8 @@ class DatabaseManagerBase(object):
                     port = address[1]
                     _result.setdefault('host', host)
                     _result.setdefault('port', port)
+        ADDRESSCACHE.invalidate(database_id)
+        IMPLINDEX.invalidate(database_id)
         return _result
 
     @abc.abstractmethod
@@ -347,6 +442,110 @@ class DatabaseManagerBase(object):
     def _status_database(self, database, **kwargs):
         """impl status a database code"""
 
+    def status_databases(self, database_ids=None, **kwargs):
+        """status of many databases"""
+        session = endpoint_session(readonly=True)
+        query = model_query(session, GopDatabase)
+        if database_ids:
+            query = query.filter(GopDatabase.database_id.in_(database_ids))
+        return self._status_databases(session, query, **kwargs)
+
+    @abc.abstractmethod
+    def _status_databases(self, session, query, **kwargs):
+        """impl status databases code"""
+
+    def dump_database(self, database_id, **kwargs):
+        session = endpoint_session(readonly=True)
+        query = model_query(session, GopDatabase, filter=GopDatabase.database_id == database_id)
+        _database = query.one()
+        if _database.status != common.OK:
+            raise exceptions.AcceptableDbError('Database is not OK now')
+        return self._dump_database(_database, **kwargs)
+
+    @abc.abstractmethod
+    def _dump_database(self, database, **kwargs):
+        """impl dump database data code"""
+
+    def config_database(self, database_id, **kwargs):
+        session = endpoint_session(readonly=True)
+        query = model_query(session, GopDatabase, filter=GopDatabase.database_id == database_id)
+        _database = query.one()
+        return self._config_database(_database, **kwargs)
+
+    @abc.abstractmethod
+    def _config_database(self, database, **kwargs):
+        """impl show database config code"""
+
+    def apply_config(self, database_id, configs, **kwargs):
+        session = endpoint_session(readonly=True)
+        query = model_query(session, GopDatabase, filter=GopDatabase.database_id == database_id)
+        _database = query.one()
+        return self._apply_config(_database, configs, **kwargs)
+
+    @abc.abstractmethod
+    def _apply_config(self, database, configs, **kwargs):
+        """impl apply database config code"""
+
+    def replication_database(self, database_id, **kwargs):
+        session = endpoint_session(readonly=True)
+        query = model_query(session, GopDatabase, filter=GopDatabase.database_id == database_id)
+        _database = query.one()
+        if not _database.slave:
+            raise InvalidArgument('Database is not slave')
+        return self._replication_database(_database, **kwargs)
+
+    @abc.abstractmethod
+    def _replication_database(self, database, **kwargs):
+        """impl replication state of slave database code"""
+
+    def performance_database(self, database_id, **kwargs):
+        session = endpoint_session(readonly=True)
+        query = model_query(session, GopDatabase, filter=GopDatabase.database_id == database_id)
+        _database = query.one()
+        return self._performance_database(_database, **kwargs)
+
+    @abc.abstractmethod
+    def _performance_database(self, database, **kwargs):
+        """impl global status rates of database code"""
+
+    def slowlog_database(self, database_id, **kwargs):
+        session = endpoint_session(readonly=True)
+        query = model_query(session, GopDatabase, filter=GopDatabase.database_id == database_id)
+        _database = query.one()
+        return self._slowlog_database(_database, **kwargs)
+
+    @abc.abstractmethod
+    def _slowlog_database(self, database, **kwargs):
+        """impl slow log digest of database code"""
+
+    def restore_database(self, database_id, **kwargs):
+        source_id = kwargs.pop('source', None) or database_id
+        session = endpoint_session(readonly=True)
+        query = model_query(session, GopDatabase,
+                            filter=GopDatabase.database_id.in_(set([database_id, source_id])))
+        source = None
+        _database = None
+        for database in query:
+            if database.database_id == database_id:
+                _database = database
+            if database.database_id == source_id:
+                source = database
+        if not _database:
+            raise exceptions.AcceptableDbError('Database %d not found' % database_id)
+        if not source:
+            raise exceptions.AcceptableDbError('Source database %d not found' % source_id)
+        if _database.slave:
+            raise exceptions.AcceptableDbError('Database is slave, can not restore')
+        if _database.status != common.OK:
+            raise exceptions.AcceptableDbError('Database is not OK now')
+        if source.impl != _database.impl or source.dbtype != _database.dbtype:
+            raise InvalidArgument('Source database impl or dbtype not match')
+        return self._restore_database(_database, source, **kwargs)
+
+    @abc.abstractmethod
+    def _restore_database(self, database, source, **kwargs):
+        """impl restore dump of source database into database code"""
+
     def bond_database(self, database_id, **kwargs):
         master_id = kwargs.pop('master')
         file = kwargs.get('file')
@@ -359,7 +558,8 @@ class DatabaseManagerBase(object):
         relation = None
         session = endpoint_session()
         query = model_query(session, GopDatabase, filter=GopDatabase.database_id.in_([database_id, master_id]))
-        query = query.options(joinedload(GopDatabase.slaves, innerjoin=False))
+        query = query.options(joinedload(GopDatabase.slaves, innerjoin=False),
+                              subqueryload(GopDatabase.schemas))
         with session.begin(subtransactions=True):
             for database in query:
                 if database.database_id == database_id:
@@ -413,7 +613,8 @@ class DatabaseManagerBase(object):
         relation = None
         session = endpoint_session()
         query = model_query(session, GopDatabase, filter=GopDatabase.database_id.in_([database_id, master_id]))
-        query = query.options(joinedload(GopDatabase.slaves, innerjoin=False))
+        query = query.options(joinedload(GopDatabase.slaves, innerjoin=False),
+                              subqueryload(GopDatabase.schemas))
         with session.begin(subtransactions=True):
             for database in query:
                 if database.database_id == database_id:
@@ -452,7 +653,8 @@ class DatabaseManagerBase(object):
         slave = None
         session = endpoint_session()
         query = model_query(session, GopDatabase, filter=GopDatabase.database_id.in_([database_id, slave_id]))
-        query = query.options(joinedload(GopDatabase.slaves, innerjoin=False))
+        query = query.options(joinedload(GopDatabase.slaves, innerjoin=False),
+                              subqueryload(GopDatabase.schemas))
         with session.begin(subtransactions=True):
             for database in query:
                 if database.database_id == database_id:
@@ -640,7 +842,7 @@ class DatabaseManagerBase(object):
                     raise exceptions.AcceptableDbError('Source database is not master')
                 if not _database.passwd:
                     raise exceptions.AcceptableDbError('Source database has no passwd, can not copy')
-                schemas = [_schema.name for _schema in _database.schemas]
+                schemas = [_schema.schema for _schema in _database.schemas]
                 if src_schema not in schemas:
                     raise exceptions.AcceptableSchemaError('Source schemas %s not exist' % src_schema)
                 src_database = _database
@@ -649,7 +851,7 @@ class DatabaseManagerBase(object):
                     raise exceptions.AcceptableDbError('Destination database is not master')
                 if not _database.passwd:
                     raise exceptions.AcceptableDbError('Destination database has no passwd, can not copy')
-                schemas = [_schema.name for _schema in _database.schemas]
+                schemas = [_schema.schema for _schema in _database.schemas]
                 if dst_schema in schemas:
                     raise exceptions.AcceptableSchemaError('Destination schemas %s alreday exist' % dst_schema)
                 dst_database = _database
@@ -673,7 +875,7 @@ class DatabaseManagerBase(object):
                                        ro_passwd=auth.get('ro_passwd'),
                                        source=auth.get('source'),
                                        character_set=character_set,
-                                       collation=collation_type)
+                                       collation_type=collation_type)
                 session.add(gop_schema)
                 session.flush()
                 _result.setdefault('schema_id', gop_schema.schema_id)
@@ -694,7 +896,7 @@ class DatabaseManagerBase(object):
         force = kwargs.get('force', False)
         session = endpoint_session()
         query = model_query(session, GopDatabase, filter=GopDatabase.database_id == database_id)
-        query = query.options(joinedload(GopDatabase.schemas, innerjoin=False))
+        query = query.options(joinedload(GopDatabase.slaves, innerjoin=False))
         with session.begin():
             _database = query.one()
             _result = dict(database_id=_database.database_id,
@@ -730,15 +932,39 @@ class DatabaseManagerBase(object):
                         LOG.warning('Quote %d: [%s] force delete' % (quote_id, desc))
                 else:
                     raise exceptions.AcceptableSchemaError('Schema in quote, can not be delete')
-            with self._delete_schema(session, _database, _schema, **kwargs) as address:
-                host = address[0]
-                port = address[1]
-                _result.setdefault('host', host)
-                _result.setdefault('port', port)
-                _result.setdefault('schema', schema)
-                squery.delete()
+            try:
+                with self._delete_schema(session, _database, _schema, **kwargs) as address:
+                    host = address[0]
+                    port = address[1]
+                    _result.setdefault('host', host)
+                    _result.setdefault('port', port)
+                    _result.setdefault('schema', schema)
+                    squery.delete()
+            except Exception:
+                # cached address may be the reason of drop fail
+                ADDRESSCACHE.invalidate(database_id)
+                raise
         return _result
 
     @abc.abstractmethod
     def _delete_schema(self, session, database, schema, **kwargs):
         """impl delete schema intance code"""
+
+    def drop_schemas(self, database_id, schemas):
+        """drop schemas created by failed job, no request and quotes check"""
+        session = endpoint_session()
+        query = model_query(session, GopDatabase, filter=GopDatabase.database_id == database_id)
+        squery = model_query(session, GopSchema, filter=and_(GopSchema.database_id == database_id,
+                                                             GopSchema.schema.in_(schemas)))
+        with session.begin():
+            _database = query.one()
+            _schemas = squery.all()
+            if _schemas:
+                # 实例上删除成功后再删除记录, 失败时schema记录保留可手动删除
+                self._drop_schemas(session, _database, _schemas)
+                squery.delete(synchronize_session=False)
+        return [_schema.schema for _schema in _schemas]
+
+    @abc.abstractmethod
+    def _drop_schemas(self, session, database, schemas):
+        """impl drop schemas without request code"""
@@ -1,6 +1,7 @@
 # -*- coding:utf-8 -*-
 import contextlib
 import eventlet
+from sqlalchemy import event
 from sqlalchemy.pool import NullPool
 
 from simpleutil.common.exceptions import InvalidArgument
@@ -15,7 +16,9 @@ from simpleservice.ormdb.tools import utils
 from gopdb import common
 from gopdb import privilegeutils
 from gopdb.api import exceptions
+from gopdb.api.wsgi.cache import ADDRESSCACHE
 from gopdb.api.wsgi.impl import DatabaseManagerBase
+from gopdb.api.wsgi.jobs import create_job
 from gopdb.models import GopDatabase
 from goperation import threadpool
 from goperation.manager import common as manager_common
@@ -44,6 +47,12 @@ class DatabaseManager(DatabaseManagerBase):
         {'metadata.gopdb-aff': None},
         {'process': None}
     ]
+    # 上报了已分配内存与qps的agent的排序规则
+    capacity_weighters = weighters[:2] + [
+        # 按实际采样qps, 负载低的agent优先
+        {'metadata.gopdb-qps': 500},
+        {'metadata.gopdb-left': -256},
+    ] + weighters[2:]
 
     # ------------私有部分---------------
     def select_agents(self, dbtype, **kwargs):
@@ -68,7 +77,13 @@ class DatabaseManager(DatabaseManagerBase):
                     'metadata.%s!=None' % dbtype,
                     'metadata.%s>=5.5' % dbtype,
                     'disk>=%d' % disk, 'free>=%d' % free, 'cpu>=%d' % cpu]
-        return entity_controller.chioces(common.DB, includes, DatabaseManager.weighters)
+        # 按agent上数据库已分配内存计算的剩余内存
+        chioces = entity_controller.chioces(common.DB, includes + ['metadata.gopdb-left>=%d' % free],
+                                            DatabaseManager.capacity_weighters)
+        # 未上报已分配内存的agent(未升级)容量未知, 保留并排在后面
+        unknown = entity_controller.chioces(common.DB, includes + ['metadata.gopdb-left=None'],
+                                            DatabaseManager.weighters)
+        return chioces + [agent_id for agent_id in unknown if agent_id not in chioces]
 
     def _get_entity(self, req, entity, raise_error=False):
         _entity = entity_controller.show(req=req, entity=entity,
@@ -85,6 +100,67 @@ class DatabaseManager(DatabaseManagerBase):
             raise InvalidArgument('Target entity no port now')
         return local_ip, port
 
+    def _entity_target(self, req, entity):
+        _entity = entity_controller.show(req=req, entity=entity,
+                                         endpoint=common.DB, body={'ports': False})['data'][0]
+        agent_id = _entity['agent_id']
+        metadata = _entity['metadata']
+        if not metadata:
+            raise InvalidArgument('Traget database agent is offline')
+        target = targetutils.target_agent_by_string(metadata.get('agent_type'),
+                                                    metadata.get('host'))
+        target.namespace = common.DB
+        return agent_id, target
+
+    def _job_cast(self, req, database, entity, action, msg, delay=0, params=None, session=None):
+        """
+        cast rpc to agent with a job, agent report result to job later
+        with session, job is created in transaction of session and
+        rpc cast after transaction committed, so post hook of job can find rows of the transaction
+        """
+        agent_id, target = self._entity_target(req, entity)
+        finishtime, timeout = rpcfinishtime()
+        job = create_job(database.database_id, action, timeout + delay, params, session=session)
+        job_id = job.job_id
+        msg['args']['job'] = job_id
+        msg['args']['job_token'] = job.token
+
+        def _cast(*args):
+            rpc = get_client()
+            rpc.cast(target, ctxt={'finishtime': finishtime + delay, 'agents': [agent_id, ]},
+                     msg=msg)
+            LOG.info('Job %d of %s database %d dispatched' % (job_id, action, database.database_id))
+
+        if session is not None and session.transaction is not None:
+            event.listen(session, 'after_commit', _cast, once=True)
+        else:
+            _cast()
+        return dict(job_id=job_id)
+
+    @staticmethod
+    def _entity_call(agent_id, target, method, args, action, delay=0):
+        """call rpc to agent, raise error when rpc fail"""
+        rpc = get_client()
+        finishtime, timeout = rpcfinishtime()
+        rpc_ret = rpc.call(target, ctxt={'finishtime': finishtime + delay,
+                                         'agents': [agent_id, ]},
+                           msg={'method': method, 'args': args},
+                           timeout=timeout + delay)
+        if not rpc_ret:
+            raise RpcResultError('%s result is None' % action)
+        if rpc_ret.get('resultcode') != manager_common.RESULT_SUCCESS:
+            raise RpcResultError('%s fail %s' % (action, rpc_ret.get('result')))
+        return rpc_ret
+
+    def _entity_address(self, req, database):
+        """get database address from address cache first"""
+        address = ADDRESSCACHE.get(database.database_id)
+        if address:
+            return address.get('host'), address.get('port')
+        local_ip, port = self._get_entity(req, int(database.reflection_id))
+        ADDRESSCACHE.update({database.database_id: dict(host=local_ip, port=port)})
+        return local_ip, port
+
     # ------------公共部分---------------
     def _select_database(self, session, query, dbtype, **kwargs):
         req = kwargs.pop('req')
@@ -131,7 +207,8 @@ class DatabaseManager(DatabaseManagerBase):
             except KeyError:
                 raise InvalidArgument('No local agents found for entity %s' % database.reflection_id)
             # 按照schemas数量
-            sortkeys.append(len(database.schemas))
+            sortkeys.append(database.schema_count)
+            return sortkeys
 
         for affinity in affinitys:
             result.append(dict(affinity=affinity,
@@ -168,7 +245,7 @@ class DatabaseManager(DatabaseManagerBase):
     def _show_database(self, session, database, **kwargs):
         """show database info"""
         req = kwargs.pop('req')
-        yield self._get_entity(req, int(database.reflection_id))
+        yield self._entity_address(req, database)
 
     @contextlib.contextmanager
     def _create_database(self, session, database, bond, **kwargs):
@@ -236,6 +313,9 @@ class DatabaseManager(DatabaseManagerBase):
     def _start_database(self, database, **kwargs):
         req = kwargs.pop('req')
         entity = int(database.reflection_id)
+        if kwargs.pop('async', False):
+            return self._job_cast(req, database, entity, 'start',
+                                  msg={'method': 'start_entity', 'args': dict(entity=entity)})
         _entity = entity_controller.show(req=req, entity=entity,
                                          endpoint=common.DB, body={'ports': False})['data'][0]
         agent_id = _entity['agent_id']
@@ -258,6 +338,11 @@ class DatabaseManager(DatabaseManagerBase):
     def _stop_database(self, database, **kwargs):
         req = kwargs.pop('req')
         entity = int(database.reflection_id)
+        # fast or slow shutdown, dump buffer pool or not
+        args = dict(entity=entity, mode=kwargs.get('mode'), dump=kwargs.get('dump', False))
+        if kwargs.pop('async', False):
+            return self._job_cast(req, database, entity, 'stop',
+                                  msg={'method': 'stop_entity', 'args': args})
         _entity = entity_controller.show(req=req, entity=entity,
                                          endpoint=common.DB, body={'ports': False})['data'][0]
         agent_id = _entity['agent_id']
@@ -270,7 +355,7 @@ class DatabaseManager(DatabaseManagerBase):
         rpc_ret = rpc.call(target, ctxt={'finishtime': finishtime,
                                          'agents': [agent_id, ]},
                            msg={'method': 'stop_entity',
-                                'args': dict(entity=entity)},
+                                'args': args},
                            timeout=timeout)
         if not rpc_ret:
             raise RpcResultError('stop database entity result is None')
@@ -278,6 +363,105 @@ class DatabaseManager(DatabaseManagerBase):
             raise RpcResultError('stop database entity fail %s' % rpc_ret.get('result'))
         return rpc_ret
 
+    def _dump_database(self, database, **kwargs):
+        req = kwargs.pop('req')
+        entity = int(database.reflection_id)
+        # dump run longer than rpc, always run as job
+        delay = kwargs.pop('timeout', 3600)
+        args = dict(entity=entity, name=kwargs.get('name'), schemas=kwargs.get('schemas'),
+                    workers=kwargs.get('workers'), timeout=delay)
+        return self._job_cast(req, database, entity, 'dump',
+                              msg={'method': 'dump_entity', 'args': args}, delay=delay)
+
+    def _config_database(self, database, **kwargs):
+        req = kwargs.pop('req')
+        entity = int(database.reflection_id)
+        agent_id, target = self._entity_target(req, entity)
+        rpc_ret = self._entity_call(agent_id, target, 'entity_config',
+                                    dict(entity=entity), 'load database config')
+        return dict(database_id=database.database_id, config=rpc_ret.get('config'))
+
+    def _apply_config(self, database, configs, **kwargs):
+        req = kwargs.pop('req')
+        entity = int(database.reflection_id)
+        agent_id, target = self._entity_target(req, entity)
+        rpc_ret = self._entity_call(agent_id, target, 'apply_entity_config',
+                                    dict(entity=entity, configs=configs), 'apply database config')
+        return dict(database_id=database.database_id, config=rpc_ret.get('config'))
+
+    def _replication_database(self, database, **kwargs):
+        req = kwargs.pop('req')
+        entity = int(database.reflection_id)
+        agent_id, target = self._entity_target(req, entity)
+        args = dict(entity=entity, history=kwargs.get('history', False),
+                    channel=kwargs.get('channel'), limit=kwargs.get('limit'))
+        rpc_ret = self._entity_call(agent_id, target, 'replication_history', args,
+                                    'get database replication')
+        return dict(database_id=database.database_id, replication=rpc_ret.get('replication'))
+
+    def _performance_database(self, database, **kwargs):
+        req = kwargs.pop('req')
+        entity = int(database.reflection_id)
+        agent_id, target = self._entity_target(req, entity)
+        args = dict(entity=entity, history=kwargs.get('history', False), limit=kwargs.get('limit'))
+        rpc_ret = self._entity_call(agent_id, target, 'entity_performance', args,
+                                    'get database performance')
+        return dict(database_id=database.database_id, performance=rpc_ret.get('performance'))
+
+    def _slowlog_database(self, database, **kwargs):
+        req = kwargs.pop('req')
+        entity = int(database.reflection_id)
+        agent_id, target = self._entity_target(req, entity)
+        rpc_ret = self._entity_call(agent_id, target, 'entity_slowlog', dict(entity=entity, **kwargs),
+                                    'get database slow log')
+        return dict(database_id=database.database_id, slowlog=rpc_ret.get('slowlog'))
+
+    def _restore_database(self, database, source, **kwargs):
+        req = kwargs.pop('req')
+        auth = kwargs.pop('auth')
+        name = kwargs.pop('name')
+        schemas = kwargs.pop('schemas', None)
+        delay = kwargs.pop('timeout', 3600)
+        entity = int(database.reflection_id)
+        source_entity = int(source.reflection_id)
+        agent_id, target = self._entity_target(req, entity)
+        if source_entity != entity and self._entity_target(req, source_entity)[0] != agent_id:
+            raise InvalidArgument('Source database not on same agent')
+        rpc_ret = self._entity_call(agent_id, target, 'dump_manifest',
+                                    dict(entity=entity, source=source_entity, name=name),
+                                    'load dump manifest')
+        dumped = rpc_ret.get('manifest')['schemas']
+        if schemas:
+            missed = set(schemas) - set(dumped.keys())
+            if missed:
+                raise InvalidArgument('Schemas %s not found in dump' % ','.join(missed))
+        else:
+            schemas = dumped.keys()
+        # 通过创建schema接口创建空库, 表结构与数据由agent导入
+        created = []
+        try:
+            for schema in schemas:
+                self.create_schema(database.database_id, schema, auth,
+                                   options=dict(character_set=dumped[schema].get('character_set'),
+                                                collation_type=dumped[schema].get('collation_type')),
+                                   req=req)
+                created.append(schema)
+            args = dict(entity=entity, source=source_entity, name=name, schemas=schemas,
+                        workers=kwargs.get('workers'), timeout=delay)
+            # 导入失败时任务失败回调删除创建的schema
+            result = self._job_cast(req, database, entity, 'restore',
+                                    msg={'method': 'restore_entity', 'args': args}, delay=delay,
+                                    params=dict(schemas=created))
+        except Exception:
+            for schema in created:
+                try:
+                    self.delete_schema(database.database_id, schema, req=req, force=True)
+                except Exception:
+                    LOG.exception('Delete schema %s of database %d fail' % (schema, database.database_id))
+            raise
+        result['schemas'] = schemas
+        return result
+
     def _status_database(self, database, **kwargs):
         req = kwargs.pop('req')
         entity = int(database.reflection_id)
@@ -301,40 +485,92 @@ class DatabaseManager(DatabaseManagerBase):
             raise RpcResultError('status database entity fail %s' % rpc_ret.get('result'))
         return rpc_ret
 
+    def _status_databases(self, session, query, **kwargs):
+        kwargs.pop('req', None)
+        zone = kwargs.pop('zone', None)
+        entitys = dict()
+        for _database in query.filter_by(impl='local'):
+            entitys[int(_database.reflection_id)] = _database.database_id
+        if not entitys:
+            return []
+        emaps = entity_controller.shows(common.DB, entitys=entitys.keys(),
+                                        ports=False, metadata=True)
+        results = []
+        # agent_id -> (target, entitys)
+        agents = {}
+        for entity, database_id in entitys.items():
+            entityinfo = emaps.get(entity)
+            metadata = entityinfo.get('metadata') if entityinfo else None
+            if zone and (metadata or {}).get('zone') != zone:
+                continue
+            if not metadata:
+                results.append(dict(database_id=database_id, entity=entity,
+                                    agent_id=entityinfo.get('agent_id') if entityinfo else None,
+                                    status='offline'))
+                continue
+            agent_id = entityinfo.get('agent_id')
+            try:
+                agents[agent_id][1].append(entity)
+            except KeyError:
+                target = targetutils.target_agent_by_string(metadata.get('agent_type'),
+                                                            metadata.get('host'))
+                target.namespace = common.DB
+                agents[agent_id] = (target, [entity, ])
+        if not agents:
+            return results
+
+        rpc = get_client()
+        finishtime, timeout = rpcfinishtime()
+
+        def _status(agent_id, target, _entitys):
+            try:
+                return rpc.call(target, ctxt={'finishtime': finishtime, 'agents': [agent_id, ]},
+                                msg={'method': 'status_entities', 'args': dict(entitys=_entitys)},
+                                timeout=timeout)
+            except Exception as e:
+                LOG.error('Status databases from agent %d fail with %s' % (agent_id, e.__class__.__name__))
+                return None
+
+        # 每个agent一次rpc, 并发执行
+        pile = eventlet.GreenPile(min(len(agents), 50))
+        agent_ids = agents.keys()
+        for agent_id in agent_ids:
+            pile.spawn(_status, agent_id, *agents[agent_id])
+        for agent_id, rpc_ret in zip(agent_ids, pile):
+            statuses = dict()
+            if rpc_ret and rpc_ret.get('resultcode') == manager_common.RESULT_SUCCESS:
+                statuses = dict([(status.get('entity'), status) for status in rpc_ret.get('entitys', [])])
+            for entity in agents[agent_id][1]:
+                status = dict(entity=entity, status='unkonwn')
+                status.update(statuses.get(entity, {}))
+                status.update(database_id=entitys[entity], agent_id=agent_id)
+                results.append(status)
+        return results
+
     def _bond_database(self, session, master, slave, relation, **kwargs):
         req = kwargs.pop('req')
         entity = int(slave.reflection_id)
+        args = dict(entity=entity,
+                    force=kwargs.get('force', False),
+                    master=dict(database_id=master.database_id,
+                                host=kwargs.get('host'),
+                                port=kwargs.get('port'),
+                                passwd=kwargs.get('passwd'),
+                                file=kwargs.get('file'),
+                                position=kwargs.get('position'),
+                                schemas=kwargs.get('schemas')))
+        if kwargs.pop('async', False):
+            # 绑定状态由任务完成后设置
+            return self._job_cast(req, slave, entity, 'bond',
+                                  msg={'method': 'bond_entity', 'args': args},
+                                  delay=5,
+                                  params=dict(master_id=master.database_id, slave_id=slave.database_id,
+                                              ready=not kwargs.get('schemas')),
+                                  session=session)
         with session.begin(subtransactions=True):
-            _entity = entity_controller.show(req=req, entity=entity,
-                                             endpoint=common.DB, body={'ports': False})['data'][0]
-            agent_id = _entity['agent_id']
-            metadata = _entity['metadata']
-            if not metadata:
-                raise InvalidArgument('Traget database agent is offline')
-            target = targetutils.target_agent_by_string(metadata.get('agent_type'),
-                                                        metadata.get('host'))
-            target.namespace = common.DB
-            rpc = get_client()
-            finishtime, timeout = rpcfinishtime()
+            agent_id, target = self._entity_target(req, entity)
             # 发送master信息到从库所在agent
-            rpc_ret = rpc.call(target, ctxt={'finishtime': finishtime + 5, 'agents': [agent_id, ]},
-                               msg={'method': 'bond_entity',
-                                    'args': dict(entity=entity,
-                                                 force=kwargs.get('force', False),
-                                                 master=dict(
-                                                     database_id=master.database_id,
-                                                     host=kwargs.get('host'),
-                                                     port=kwargs.get('port'),
-                                                     passwd=kwargs.get('passwd'),
-                                                     file=kwargs.get('file'),
-                                                     position=kwargs.get('position'),
-                                                     schemas=kwargs.get('schemas')
-                                                 ))},
-                               timeout=timeout + 5)
-            if not rpc_ret:
-                raise RpcResultError('bond database result is None')
-            if rpc_ret.get('resultcode') != manager_common.RESULT_SUCCESS:
-                raise RpcResultError('bond database fail %s' % rpc_ret.get('result'))
+            rpc_ret = self._entity_call(agent_id, target, 'bond_entity', args, 'bond database', delay=5)
             # 绑定状态设置就绪
             relation.ready = True if not kwargs.get('schemas') else False
             return rpc_ret
@@ -402,68 +638,61 @@ class DatabaseManager(DatabaseManagerBase):
 
     def _slave_database(self, session, master, slave, **kwargs):
         req = kwargs.pop('req')
+        # get slave host and port
+        _host, _port = self._get_entity(req=req,
+                                        entity=int(slave.reflection_id), raise_error=True)
+        entity = int(master.reflection_id)
+        args = dict(entity=entity,
+                    schemas=kwargs.get('schemas'),
+                    file=kwargs.get('file'),
+                    position=kwargs.get('position'),
+                    bond=dict(database_id=slave.database_id,
+                              host=_host, port=_port))
+        if kwargs.pop('async', False):
+            return self._job_cast(req, master, entity, 'slave',
+                                  msg={'method': 'slave_entity', 'args': args},
+                                  delay=5, session=session)
         with session.begin(subtransactions=True):
-            # get slave host and port
-            _host, _port = self._get_entity(req=req,
-                                            entity=int(slave.reflection_id), raise_error=True)
-            entity = int(master.reflection_id)
-            _entity = entity_controller.show(req=req, entity=entity,
-                                             endpoint=common.DB, body={'ports': False})['data'][0]
-            agent_id = _entity['agent_id']
-            metadata = _entity['metadata']
-            if not metadata:
-                raise InvalidArgument('Traget database agent is offline')
-            target = targetutils.target_agent_by_string(metadata.get('agent_type'),
-                                                        metadata.get('host'))
-            target.namespace = common.DB
-            rpc = get_client()
-            finishtime, timeout = rpcfinishtime()
+            agent_id, target = self._entity_target(req, entity)
             # 发送slave信息到主库所在agent
-            rpc_ret = rpc.call(target,
-                               ctxt={'finishtime': finishtime + 5, 'agents': [agent_id, ]},
-                               msg={'method': 'slave_entity',
-                                    'args': dict(entity=entity,
-                                                 schemas=kwargs.get('schemas'),
-                                                 file=kwargs.get('file'),
-                                                 position=kwargs.get('position'),
-                                                 bond=dict(database_id=slave.database_id,
-                                                           host=_host, port=_port))
-                                    },
-                               timeout=timeout + 5)
-            if not rpc_ret:
-                raise RpcResultError('bond slave for master database result is None')
-            if rpc_ret.get('resultcode') != manager_common.RESULT_SUCCESS:
-                raise RpcResultError('bond slave for master database fail %s' % rpc_ret.get('result'))
-            return rpc_ret
+            return self._entity_call(agent_id, target, 'slave_entity', args,
+                                     'bond slave for master database', delay=5)
+
+    def _master_binlog(self, req, master):
+        """current binlog position of master, None if fail"""
+        entity = int(master.reflection_id)
+        try:
+            agent_id, target = self._entity_target(req, entity)
+            rpc_ret = self._entity_call(agent_id, target, 'entity_master_status',
+                                        dict(entity=entity), 'get master status')
+        except Exception as e:
+            LOG.warning('Get binlog position of master %d fail with %s' % (master.database_id,
+                                                                          e.__class__.__name__))
+            return None
+        return rpc_ret.get('replication')
 
     def _ready_relation(self, session, master, slave, relation, **kwargs):
         req = kwargs.pop('req')
         entity = int(slave.reflection_id)
+        schemas = [schema.schema for schema in master.schemas]
+        _host, _port = self._get_entity(req, int(master.reflection_id), raise_error=True)
+        # 主库当前binlog位置, 用于计算从库追上主库的时间
+        args = dict(entity=entity,
+                    master=dict(database_id=master.database_id,
+                                host=_host, port=_port, schemas=schemas,
+                                binlog=self._master_binlog(req, master)),
+                    max_eta=kwargs.pop('max_eta', None))
+        if kwargs.pop('async', False):
+            # 绑定状态由任务完成后设置
+            return self._job_cast(req, slave, entity, 'ready',
+                                  msg={'method': 'entity_replication_ready', 'args': args},
+                                  params=dict(master_id=master.database_id, slave_id=slave.database_id),
+                                  session=session)
         with session.begin(subtransactions=True):
-            schemas = [schema.schema for schema in master.schemas]
-            _host, _port = self._get_entity(req, int(master.reflection_id), raise_error=True)
-            _entity = entity_controller.show(req=req, entity=entity,
-                                             endpoint=common.DB, body={'ports': False})['data'][0]
-            agent_id = _entity['agent_id']
-            metadata = _entity['metadata']
-            if not metadata:
-                raise InvalidArgument('Traget database agent is offline')
-            target = targetutils.target_agent_by_string(metadata.get('agent_type'),
-                                                        metadata.get('host'))
-            target.namespace = common.DB
-            rpc = get_client()
-            finishtime, timeout = rpcfinishtime()
+            agent_id, target = self._entity_target(req, entity)
             # 发送master信息到从库所在agent
-            rpc_ret = rpc.call(target, ctxt={'finishtime': finishtime, 'agents': [agent_id, ]},
-                               msg={'method': 'entity_replication_ready',
-                                    'args': dict(entity=entity,
-                                                 master=dict(database_id=master.database_id,
-                                                             host=_host, port=_port, schemas=schemas))},
-                               timeout=timeout)
-            if not rpc_ret:
-                raise RpcResultError('get replication status result is None')
-            if rpc_ret.get('resultcode') != manager_common.RESULT_SUCCESS:
-                raise RpcResultError('get replication status fail %s' % rpc_ret.get('result'))
+            rpc_ret = self._entity_call(agent_id, target, 'entity_replication_ready', args,
+                                        'get replication status')
             # 绑定状态设置就绪
             relation.ready = True
             return rpc_ret
@@ -472,7 +701,7 @@ class DatabaseManager(DatabaseManagerBase):
     @contextlib.contextmanager
     def _show_schema(self, session, database, schema, **kwargs):
         req = kwargs.pop('req')
-        yield self._get_entity(req, int(database.reflection_id))
+        yield self._entity_address(req, database)
 
     @contextlib.contextmanager
     def _create_schema(self, session,
@@ -502,8 +731,8 @@ class DatabaseManager(DatabaseManagerBase):
                      dst_database, dst_schema,
                      auths, **kwargs):
         req = kwargs.pop('req')
-        src_port, src_local_ip = self._get_entity(req, int(src_database.reflection_id))
-        dst_port, dst_local_ip = self._get_entity(req, int(dst_database.reflection_id))
+        src_local_ip, src_port = self._get_entity(req, int(src_database.reflection_id))
+        dst_local_ip, dst_port = self._get_entity(req, int(dst_database.reflection_id))
         src_info = dict(user=src_database.user, passwd=src_database.passwd,
                         host=src_local_ip, port=src_port)
         dst_info = dict(user=dst_database.user, passwd=dst_database.passwd,
@@ -530,12 +759,27 @@ class DatabaseManager(DatabaseManagerBase):
             raise exceptions.AcceptableDbError('Can not find Database port, not init finished')
         if not local_ip:
             raise exceptions.AcceptableDbError('Database agent is offline now')
+        # refresh cache with the address just fetched
+        ADDRESSCACHE.update({database.database_id: dict(host=local_ip, port=port)})
+        self._drop_schema(database, schema, local_ip, port)
+        yield local_ip, port
+
+    @staticmethod
+    def _drop_schema(database, schema, host, port):
         conn = connformater % dict(user=database.user, passwd=database.passwd,
-                                   schema=schema.schema, host=local_ip, port=port)
+                                   schema=schema.schema, host=host, port=port)
         engine = create_engine(conn, thread_checkin=False, poolclass=NullPool)
         dropauths = None
         if schema.user != database.user:
             dropauths = privilegeutils.mysql_privileges(schema)
         utils.drop_schema(engine, dropauths)
-        yield local_ip, port
+
+    def _drop_schemas(self, session, database, schemas):
+        # 地址通过entity批量接口获取, 不需要请求
+        address = self.address([database.database_id]).get(database.database_id) or {}
+        host, port = address.get('host'), address.get('port', -1)
+        if not host or port <= 0:
+            raise exceptions.AcceptableDbError('Database %d is offline now' % database.database_id)
+        for schema in schemas:
+            self._drop_schema(database, schema, host, port)
 
@@ -52,7 +52,7 @@ class DatabaseManager(DatabaseManagerBase):
             result.append(dict(affinity=affinity,
                                databases=[_database.database_id
                                           for _database in sorted(affinitys[affinity],
-                                                                  key=lambda x: len(x.schemas))]
+                                                                  key=lambda x: x.schema_count)]
                                ))
         return result
 
@@ -62,7 +62,7 @@ class DatabaseManager(DatabaseManagerBase):
                                filter=RecordDatabase.record_id.in_(record_ids))
         address_maps = dict()
         for _record in _records:
-            address_maps[dbmaps[str(_records.record_id)]] = dict(host=_record.host, port=_record.port)
+            address_maps[dbmaps[str(_record.record_id)]] = dict(host=_record.host, port=_record.port)
         return address_maps
 
     @contextlib.contextmanager
@@ -110,6 +110,38 @@ class DatabaseManager(DatabaseManagerBase):
         """impl status a database code"""
         raise NotImplementedError
 
+    def _status_databases(self, session, query, **kwargs):
+        """impl status databases code"""
+        raise NotImplementedError
+
+    def _dump_database(self, database, **kwargs):
+        """impl dump database data code"""
+        raise NotImplementedError
+
+    def _config_database(self, database, **kwargs):
+        """impl show database config code"""
+        raise NotImplementedError
+
+    def _apply_config(self, database, configs, **kwargs):
+        """impl apply database config code"""
+        raise NotImplementedError
+
+    def _replication_database(self, database, **kwargs):
+        """impl replication state of slave database code"""
+        raise NotImplementedError
+
+    def _performance_database(self, database, **kwargs):
+        """impl global status rates of database code"""
+        raise NotImplementedError
+
+    def _slowlog_database(self, database, **kwargs):
+        """impl slow log digest of database code"""
+        raise NotImplementedError
+
+    def _restore_database(self, database, source, **kwargs):
+        """impl restore dump of source database into database code"""
+        raise NotImplementedError
+
     def _bond_database(self, session, master, slave, relation, **kwargs):
         raise NotImplementedError('Wait!!!')
         # try:
@@ -237,6 +269,10 @@ class DatabaseManager(DatabaseManagerBase):
             utils.drop_schema(engine, auths)
             raise
 
+    def _drop_schemas(self, session, database, schemas):
+        """impl drop schemas without request code"""
+        raise NotImplementedError
+
     @contextlib.contextmanager
     def _delete_schema(self, session, database, schema, **kwargs):
         """delete schema intance on reflection_id"""
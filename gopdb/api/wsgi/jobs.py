@@ -0,0 +1,230 @@
+# -*- coding:utf-8 -*-
+import time
+import eventlet
+
+from simpleutil.config import cfg
+from simpleutil.log import log as logging
+from simpleutil.utils import jsonutils
+from simpleutil.utils import uuidutils
+from simpleutil.common.exceptions import InvalidArgument
+
+from simpleservice.ormdb.api import model_query
+
+from goperation.manager import common as manager_common
+
+from gopdb import common
+from gopdb.api import endpoint_session
+from gopdb.api.wsgi.impl import _impl
+from gopdb.models import GopJob
+from gopdb.models import GopSalveRelation
+from sqlalchemy.sql import and_
+
+
+CONF = cfg.CONF
+
+LOG = logging.getLogger(__name__)
+
+# 任务成功后的回调 action -> func(session, job, params)
+POSTHOOKS = {}
+# 任务失败后的回调, 在事务提交后执行 action -> func(job, params)
+FAILHOOKS = {}
+
+JOBSTATUS = {common.JOBFAIL: 'fail',
+             common.JOBRUNNING: 'running',
+             common.JOBSUCCESS: 'success'}
+
+# 过期任务清理协程, 每个进程一个
+SWEEPER = []
+
+
+def posthook(action):
+    def wrapper(func):
+        POSTHOOKS[action] = func
+        return func
+    return wrapper
+
+
+def failhook(action):
+    def wrapper(func):
+        FAILHOOKS[action] = func
+        return func
+    return wrapper
+
+
+def _relation_ready(session, job, params):
+    query = model_query(session, GopSalveRelation,
+                        filter=and_(GopSalveRelation.master_id == params.get('master_id'),
+                                    GopSalveRelation.slave_id == params.get('slave_id')))
+    relation = query.one_or_none()
+    if not relation:
+        LOG.warning('Job %d relation of master %s slave %s missed' %
+                    (job.job_id, params.get('master_id'), params.get('slave_id')))
+        return
+    relation.ready = True
+    session.flush()
+
+
+@posthook('bond')
+def _bond_hook(session, job, params):
+    # 有schema的主库需要确认同步后再设置就绪
+    if params.get('ready'):
+        _relation_ready(session, job, params)
+
+
+@posthook('ready')
+def _ready_hook(session, job, params):
+    _relation_ready(session, job, params)
+
+
+@failhook('restore')
+def _restore_fail_hook(job, params):
+    # 导入失败或过期, 删除为导入创建的schema
+    schemas = params.get('schemas')
+    if not schemas:
+        return
+    try:
+        dropped = _impl(job.database_id).drop_schemas(job.database_id, schemas)
+    except Exception:
+        LOG.exception('Job %d drop schemas %s of database %d fail' %
+                      (job.job_id, ','.join(schemas), job.database_id))
+    else:
+        LOG.info('Job %d schemas %s of database %d dropped' % (job.job_id, ','.join(dropped), job.database_id))
+
+
+def create_job(database_id, action, timeout, params=None, session=None):
+    """
+    create a running job, return job
+    job created in session of caller is committed with caller transaction
+    """
+    now = int(time.time())
+    job = GopJob(database_id=database_id, action=action,
+                 status=common.JOBRUNNING,
+                 token=uuidutils.generate_uuid(),
+                 params=jsonutils.dumps(params) if params else None,
+                 ctime=now, expire=now + timeout)
+    session = session or endpoint_session()
+    with session.begin(subtransactions=True):
+        session.add(job)
+        session.flush()
+    return job
+
+
+def job_info(job):
+    status = job.status
+    if status == common.JOBRUNNING and job.expire < int(time.time()):
+        status = 'timeout'
+    else:
+        status = JOBSTATUS[status]
+    return dict(job_id=job.job_id, database_id=job.database_id,
+                action=job.action, status=status,
+                result=job.result, ctime=job.ctime, mtime=job.mtime)
+
+
+def _fail_hook(job):
+    if job.action in FAILHOOKS:
+        # 失败回调可能需要调用agent, 不阻塞调用方
+        eventlet.spawn_n(FAILHOOKS[job.action], job, jsonutils.loads(job.params) if job.params else {})
+
+
+def finish_job(job_id, token, resultcode, result):
+    """agent report job result"""
+    session = endpoint_session()
+    query = model_query(session, GopJob, filter=GopJob.job_id == job_id)
+    now = int(time.time())
+    with session.begin():
+        # 锁定任务行, 避免与过期清理同时结束任务
+        job = query.with_for_update().one()
+        if job.token != token:
+            raise InvalidArgument('Job token not match')
+        if job.status != common.JOBRUNNING:
+            LOG.warning('Job %d has been finished' % job_id)
+            return job_info(job)
+        if job.expire < now:
+            # 调用方已得到超时结果, 过期的报告不执行成功回调
+            LOG.warning('Job %d report after expired, set job fail' % job_id)
+            success = False
+            result = 'job report after expired: %s' % result
+        else:
+            success = resultcode == manager_common.RESULT_SUCCESS
+        job.status = common.JOBSUCCESS if success else common.JOBFAIL
+        job.result = result
+        job.mtime = now
+        if success and job.action in POSTHOOKS:
+            POSTHOOKS[job.action](session, job, jsonutils.loads(job.params) if job.params else {})
+        session.flush()
+    if not success:
+        _fail_hook(job)
+    return job_info(job)
+
+
+def expire_jobs():
+    """set expired running jobs fail, return count of expired jobs"""
+    session = endpoint_session()
+    now = int(time.time())
+    query = model_query(session, GopJob, filter=and_(GopJob.status == common.JOBRUNNING,
+                                                     GopJob.expire < now))
+    expired = []
+    with session.begin():
+        for job in query.with_for_update():
+            # 等锁期间任务可能已被agent报告结束
+            if job.status != common.JOBRUNNING:
+                continue
+            job.status = common.JOBFAIL
+            job.result = 'job expired, agent not report result'
+            job.mtime = now
+            expired.append(job)
+        session.flush()
+    for job in expired:
+        LOG.warning('Job %d of %s database %d expired' % (job.job_id, job.action, job.database_id))
+        _fail_hook(job)
+    return len(expired)
+
+
+def _sweep():
+    interval = CONF[common.DB].job_sweep_interval
+    while True:
+        eventlet.sleep(interval)
+        try:
+            expire_jobs()
+        except Exception:
+            LOG.exception('Sweep expired jobs fail')
+
+
+def start_sweeper():
+    """start sweeper of expired jobs, once each process"""
+    if not SWEEPER:
+        SWEEPER.append(eventlet.spawn(_sweep))
+
+
+def progress_job(job_id, token, result):
+    """agent report progress of running job"""
+    session = endpoint_session()
+    query = model_query(session, GopJob, filter=GopJob.job_id == job_id)
+    with session.begin():
+        job = query.one()
+        if job.token != token:
+            raise InvalidArgument('Job token not match')
+        # 进度报告晚于结果到达或任务已过期
+        if job.status == common.JOBRUNNING and job.expire >= int(time.time()):
+            job.result = result
+            job.mtime = int(time.time())
+            session.flush()
+    return job_info(job)
+
+
+def wait_job(job_id, timeout):
+    """poll job until finish or timeout"""
+    deadline = time.time() + timeout
+    interval = 0.1
+    while True:
+        session = endpoint_session(readonly=True)
+        job = model_query(session, GopJob, filter=GopJob.job_id == job_id).one()
+        session.close()
+        if job.status != common.JOBRUNNING:
+            break
+        left = deadline - time.time()
+        if left <= 0:
+            break
+        eventlet.sleep(min(interval, left))
+        interval = min(interval * 2, 1.0)
+    return job_info(job)
@@ -3,6 +3,7 @@ from simpleservice.wsgi.middleware import controller_return_response
 
 from gopdb import common
 from gopdb.api.wsgi import controller
+from gopdb.api.wsgi import impl
 
 
 COLLECTION_ACTIONS = ['index', 'create']
@@ -21,6 +22,18 @@ class Routers(router.RoutersBase):
                            path='/%s/agents' % common.DB,
                            get_action='agents')
 
+        self._add_resource(mapper, db_controller,
+                           path='/%s/caches' % common.DB,
+                           get_action='caches')
+
+        self._add_resource(mapper, db_controller,
+                           path='/%s/databases/show' % common.DB,
+                           get_action='shows')
+
+        self._add_resource(mapper, db_controller,
+                           path='/%s/databases/status' % common.DB,
+                           get_action='statuses')
+
         self._add_resource(mapper, db_controller,
                            path='/%s/{impl}/select' % common.DB,
                            get_action='select')
@@ -40,6 +53,13 @@ class Routers(router.RoutersBase):
         collection.member.link('start', method='POST')
         collection.member.link('stop', method='POST')
         collection.member.link('status', method='GET')
+        collection.member.link('replication', method='GET')
+        collection.member.link('performance', method='GET')
+        collection.member.link('slowlog', method='GET')
+        collection.member.link('config', method='GET')
+        collection.member.link('apply', method='PUT')
+        collection.member.link('dump', method='POST')
+        collection.member.link('restore', method='POST')
         collection.member.link('bond', method='POST')
         collection.member.link('unbond', method='DELETE')
         collection.member.link('slave', method='POST')
@@ -72,4 +92,21 @@ class Routers(router.RoutersBase):
 
         self._add_resource(mapper, schema_controller,
                            path='/%s/quotes' % common.DB,
-                           get_action='quotes')
\ No newline at end of file
+                           get_action='quotes')
+
+        self._add_resource(mapper, schema_controller,
+                           path='/%s/quotes/bulk' % common.DB,
+                           post_action='bulk')
+
+        job_controller = controller_return_response(controller.JobReuest(),
+                                                    controller.FAULT_MAP)
+
+        self._add_resource(mapper, job_controller,
+                           path='/%s/jobs/{job_id}' % common.DB,
+                           get_action='show')
+
+        self._add_resource(mapper, job_controller,
+                           path='/%s/jobs/{job_id}' % common.DB,
+                           put_action='update')
+
+        impl.prewarm()
@@ -1,3 +1,4 @@
+# -*- coding:utf-8 -*-
 DB = 'gopdb'
 
 ENDPOINTKEY = '%s.endpoint' % DB
@@ -9,6 +10,11 @@ REPLICATIONRIVILEGES = 'REPLICATION SLAVE'
 UNACTIVE = -1
 OK = 0
 
+# 异步任务状态
+JOBFAIL = -1
+JOBRUNNING = 0
+JOBSUCCESS = 1
+
 VERSIONMAP = {}
 
 IGNORES = {'mysql': frozenset(['information_schema', 'performance_schema', 'sys', 'mysql'])}
@@ -1,3 +1,4 @@
+# -*- coding:utf-8 -*-
 import sqlalchemy as sa
 from sqlalchemy import orm
 from sqlalchemy.ext import declarative
@@ -9,6 +10,8 @@ from sqlalchemy.dialects.mysql import TINYINT
 from sqlalchemy.dialects.mysql import INTEGER
 from sqlalchemy.dialects.mysql import BLOB
 from sqlalchemy.dialects.mysql import BOOLEAN
+from sqlalchemy.dialects.mysql import MEDIUMTEXT
+from sqlalchemy.dialects.mysql import TEXT
 
 from simpleservice.ormdb.models import TableBase
 from simpleservice.ormdb.models import InnoDBTableBase
@@ -101,6 +104,34 @@ class GopDatabase(TableBase):
     )
 
 
+# schema数量统计列, 默认延迟加载, 需要时通过undefer在主查询中一次取出
+GopDatabase.schema_count = orm.column_property(
+    sa.select([sa.func.count(GopSchema.schema_id)]).where(
+        GopSchema.database_id == GopDatabase.database_id).correlate_except(GopSchema).as_scalar(),
+    deferred=True)
+
+
+class GopJob(TableBase):
+    job_id = sa.Column(INTEGER(unsigned=True), nullable=False, primary_key=True, autoincrement=True)
+    database_id = sa.Column(INTEGER(unsigned=True), nullable=False)
+    action = sa.Column(VARCHAR(32), nullable=False)
+    status = sa.Column(TINYINT, default=common.JOBRUNNING, nullable=False)
+    # only agent received the job know the token
+    token = sa.Column(VARCHAR(36), nullable=False)
+    # params of post hook and fail hook, json
+    params = sa.Column(TEXT, nullable=True, default=None)
+    # result of restore include report of each table
+    result = sa.Column(MEDIUMTEXT, nullable=True, default=None)
+    ctime = sa.Column(INTEGER(unsigned=True), nullable=False)
+    # job not finish before expire means agent lost the job
+    expire = sa.Column(INTEGER(unsigned=True), nullable=False)
+    mtime = sa.Column(INTEGER(unsigned=True), nullable=True, default=None)
+    __table_args__ = (
+        sa.Index('job_database_index', database_id),
+        InnoDBTableBase.__table_args__
+    )
+
+
 class RecordDatabase(TableBase):
     record_id = sa.Column(INTEGER(unsigned=True), nullable=False, primary_key=True, autoincrement=True)
     zone = sa.Column(VARCHAR(32), nullable=False)
@@ -0,0 +1,112 @@
+# -*- coding:utf-8 -*-
+import contextlib
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from goperation import config
+
+from gopdb import models
+from gopdb.api.wsgi.cache import ADDRESSCACHE
+from gopdb.api.wsgi.impl import _impl
+from gopdb.api.wsgi.impl import _manager
+from gopdb.api.wsgi.impl import show_databases
+
+
+a = 'C:\\Users\\loliz_000\\Desktop\\etc\\goperation\\goperation.conf'
+b = 'C:\\Users\\loliz_000\\Desktop\\etc\\goperation\\gcenter.conf'
+c = 'C:\\Users\\loliz_000\\Desktop\\etc\\goperation\\endpoints\\gopdb.server.conf'
+config.configure('test', [a, b, c])
+
+# 测试用的主库/从库, 主库需要有schema, 从库需要绑定到主库
+master_id = 1
+slave_id = 2
+# 主库上已有的schema, 用于测试copy_schema
+schema = 'gamserver_db_1'
+# 从库重新绑定用的主库信息, 从主库show master status获取
+binlog = dict(host='127.0.0.1', port=3306, passwd='111111',
+              file='mysql-bin.000001', position=154)
+# 测试用的schema认证信息
+auth = dict(user='querycount', passwd='querycount',
+            ro_user='querycount_ro', ro_passwd='querycount')
+
+COUNTER = []
+# 只统计gopdb的表, goperation的entity查询不计入
+TABLES = [model.__tablename__ for model in (models.GopDatabase, models.GopSchema, models.SchemaQuote,
+                                             models.GopSalveRelation, models.GopJob,
+                                             models.RecordDatabase)]
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count(conn, cursor, statement, parameters, context, executemany):
+    if any(table in statement for table in TABLES):
+        COUNTER.append(statement)
+
+
+@contextlib.contextmanager
+def budget(name, limit):
+    ADDRESSCACHE.clear()
+    del COUNTER[:]
+    yield
+    count = len(COUNTER)
+    print '%s: %d queries' % (name, count)
+    if count > limit:
+        for statement in COUNTER:
+            print statement
+        raise AssertionError('%s execute %d queries, over budget %d' % (name, count, limit))
+
+
+def querycount_test():
+    dbmanager = _impl(master_id)
+    # 各接口的sql数量上限, 与数据库数量/关联表行数无关
+    with budget('show_database master', 2):
+        dbmanager.show_database(master_id, req=None)
+    with budget('show_database master quotes', 3):
+        dbmanager.show_database(master_id, req=None, quotes=True)
+    with budget('show_database slave', 4):
+        dbmanager.show_database(slave_id, req=None)
+    with budget('show_databases', 6):
+        show_databases([master_id, slave_id], quotes=True)
+    with budget('slaves_address', 3):
+        dbmanager.slaves_address([master_id, slave_id])
+    with budget('address', 1):
+        dbmanager.address([master_id, slave_id])
+    with budget('select_database', 1):
+        dbmanager.select_database(req=None)
+    with budget('reflect_database', 1):
+        dbmanager.reflect_database(req=None, entitys=[1, 2])
+
+
+def writecount_test():
+    dbmanager = _impl(master_id)
+    # record类型的库不需要agent, 用于测试创建/删除库与schema
+    recordmanager = _manager('record')
+    with budget('create_database', 3):
+        database_id = recordmanager.create_database('root', None, 'mysql', '5.7', 1, req=None, slave=0,
+                                                    host='127.0.0.1', port=3306)['database_id']
+    with budget('create_schema', 3):
+        recordmanager.create_schema(database_id, 'querycount', auth, None, req=None)
+    with budget('show_schema', 3):
+        recordmanager.show_schema(database_id, 'querycount', req=None, quotes=True)
+    with budget('delete_schema', 5):
+        recordmanager.delete_schema(database_id, 'querycount', req=None)
+    with budget('delete_database', 6):
+        recordmanager.delete_database(database_id, True, req=None)
+    with budget('copy_schema', 3):
+        dbmanager.copy_schema(master_id, schema, master_id, 'querycount_copy', auth, req=None)
+    with budget('delete_schema copy', 5):
+        dbmanager.delete_schema(master_id, 'querycount_copy', req=None)
+    schemas = [s['schema'] for s in dbmanager.show_database(master_id, req=None)['schemas']]
+    with budget('unbond_database', 4):
+        dbmanager.unbond_database(slave_id, req=None, master=master_id, force=True)
+    with budget('bond_database', 5):
+        dbmanager.bond_database(slave_id, req=None, master=master_id, schemas=schemas, **binlog)
+    with budget('stop_database', 1):
+        dbmanager.stop_database(slave_id, req=None)
+    # 异步启动会写入任务记录
+    with budget('start_database async', 2):
+        dbmanager.start_database(slave_id, req=None, async=True)
+
+
+querycount_test()
+writecount_test()